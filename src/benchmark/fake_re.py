@@ -0,0 +1,153 @@
+"""
+Local stand-in for the relation engine API, for benchmarks.
+
+Serves `/api/v1/query_results` for every stored query used by the server,
+with generated documents, a configurable number of results per list query
+and injected latency:
+    python -m src.benchmark.fake_re --port 5001 --latency-ms 5 --result-size 20
+"""
+import sys
+import time
+import json
+import random
+import argparse
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Number of ancestors returned by taxonomy_get_lineage
+_LINEAGE_DEPTH = 20
+
+
+def _taxon(i, params):
+    key = f'{i}_1'
+    sciname_field = params.get('sciname_field', 'scientific_name')
+    return {
+        '_id': f"{params.get('@taxon_coll', 'ncbi_taxon')}/{key}",
+        '_key': key,
+        '_rev': '_cV2ab3C---',
+        'id': str(i),
+        sciname_field: f'Escherichia coli {i}',
+        'rank': 'species',
+        'strain': False,
+        'gencode': 11,
+        'created': 0,
+        'expired': 9007199254740991,
+        'aliases': [{'category': 'synonym', 'name': f'Bacillus coli {i}'}],
+    }
+
+
+def _ws_obj(i, params):
+    return {
+        'ws_obj': {
+            'workspace_id': 1000 + i,
+            'object_id': 1,
+            'version': 1,
+            'name': f'genome_{i}',
+            'type': 'KBaseGenomes.Genome-17.0',
+            'ws_info': {'metadata': {'refdata_source': 'RefSeq', 'narrative_nice_Name': f'Narrative {i}'}},
+        },
+        'edge': {'assigned_by': 'assign_taxa', 'updated_at': 0},
+    }
+
+
+def _page(params, size):
+    """Range of results for a paginated query over `size` matching documents."""
+    offset = params.get('offset') or 0
+    limit = params.get('limit') or size
+    return range(offset, min(size, offset + limit))
+
+
+def fake_results(name, params, size):
+    """Result docs of a stored query, shaped like the real ones."""
+    params = params or {}
+    if name == 'taxonomy_fetch_taxon':
+        return [_taxon(params.get('id', 1), params)]
+    if name == 'taxonomy_fetch_taxa':
+        return [_taxon(_id, params) for _id in params.get('ids', [])]
+    if name == 'taxonomy_get_lineage':
+        return [_taxon(i, params) for i in range(_LINEAGE_DEPTH)]
+    if name == 'taxonomy_get_parent':
+        # The same tree as the lineages: a chain from taxon 0, under which every other taxon hangs
+        _id = int(params.get('id', 1))
+        if _id == 0:
+            return []
+        return [{'id': str(min(_id, _LINEAGE_DEPTH) - 1), 'created': 0, 'expired': 9007199254740991}]
+    if name == 'taxonomy_get_taxon_from_ws_obj':
+        return [_taxon(562, params)]
+    if name == 'taxonomy_get_taxa_from_ws_objs':
+        return [{'obj_ref': ref, 'taxon': _taxon(i, params)} for (i, ref) in enumerate(params.get('obj_refs', []))]
+    if name in ('taxonomy_get_children_after', 'taxonomy_get_siblings_after'):
+        page = _page({**params, 'offset': int(params.get('after', 0)) + 1}, size)
+        return [{'total_count': size, 'results': [_taxon(i, params) for i in page]}]
+    if name in ('taxonomy_get_children', 'taxonomy_get_siblings', 'taxonomy_search_sci_name'):
+        return [{'total_count': size, 'results': [_taxon(i, params) for i in _page(params, size)]}]
+    if name in ('taxonomy_search_species_strain', 'taxonomy_search_species_strain_no_sort'):
+        return [_taxon(i, params) for i in _page(params, size)]
+    if name == 'taxonomy_get_associated_ws_objects':
+        return [{'total_count': size, 'results': [_ws_obj(i, params) for i in _page(params, size)]}]
+    if name in ('data_sources_get_data_sources', 'data_sources_get_all_data_sources'):
+        return [
+            {'_id': f'data_sources/{ns}', '_key': ns, '_rev': '_a', 'ns': ns, 'category': 'taxonomy'}
+            for ns in params.get('ns', ['ncbi_taxonomy', 'gtdb', 'rdp_taxonomy', 'silva_taxonomy'])
+        ]
+    return None
+
+
+def make_handler(latency_ms, jitter_ms, result_size):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, like the real RE API
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are written separately, so don't let them wait on delayed ACKs
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            name = parse_qs(url.query).get('stored_query', [None])[0]
+            results = None
+            if url.path == '/api/v1/query_results' and name:
+                results = fake_results(name, json.loads(body) if body else {}, result_size)
+            time.sleep((latency_ms + random.uniform(0, jitter_ms)) / 1000)  # nosec
+            if results is None:
+                self._send(400, {'error': {'message': f'Unknown stored query: {name}'}})
+            else:
+                self._send(200, {
+                    'results': results,
+                    'count': len(results),
+                    'has_more': False,
+                    'cursor_id': None,
+                    'stats': {'executionTime': latency_ms / 1000},
+                })
+
+        def _send(self, status, resp):
+            data = json.dumps(resp).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port, latency_ms=0, jitter_ms=0, result_size=20):
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(latency_ms, jitter_ms, result_size))
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--latency-ms', type=float, default=0, help='Delay added to every query')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Max random delay added on top of the latency')
+    parser.add_argument('--result-size', type=int, default=20, help='Number of documents matched by list queries')
+    args = parser.parse_args(argv)
+    serve(args.port, args.latency_ms, args.jitter_ms, args.result_size)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,53 @@
+"""
+Benchmark of the JSON work done for one large response, per codec.
+
+Decodes an RE-like `get_children` response of 1000 taxa, transforms the
+results as the handler does, and encodes the JSON-RPC response:
+    python -m src.benchmark.json_codec [iterations]
+"""
+import sys
+import timeit
+
+from src.utils import codec
+
+_DOC = {
+    '_id': 'ncbi_taxon/562_1', '_key': '562_1', '_rev': '_cV2ab3C---',
+    'id': '562', 'scientific_name': 'Escherichia coli', 'rank': 'species',
+    'strain': False, 'gencode': 11, 'created': 0, 'expired': 9007199254740991,
+    'aliases': [
+        {'category': 'authority', 'name': 'Escherichia coli (Migula 1895) Castellani and Chalmers 1919'},
+        {'category': 'synonym', 'name': 'Bacillus coli'},
+    ],
+}
+
+
+def _body(n):
+    results = [dict(_DOC, id=str(i), _key=f'{i}_1') for i in range(n)]
+    resp = {'results': [{'total_count': n, 'results': results}], 'count': 1, 'has_more': False, 'stats': {}}
+    return codec.dumps(resp)
+
+
+def _roundtrip(loads, dumps, body):
+    resp = loads(body)
+    res = resp['results'][0]
+    for doc in res['results']:
+        doc['ns'] = 'ncbi_taxonomy'
+        del doc['_id'], doc['_key'], doc['_rev']
+    return dumps({'version': '1.1', 'result': [{'stats': resp['stats'], **res}]})
+
+
+def main(iterations):
+    body = _body(1000)
+    codecs = [codec._load_stdlib()]
+    try:
+        codecs.append(codec._load_orjson())
+    except ImportError:
+        print('orjson is not installed')
+    print(f"{'codec':<10}{'per response':>16}{'responses/s':>14}")
+    for (name, loads, dumps) in codecs:
+        secs = timeit.timeit(lambda: _roundtrip(loads, dumps, body), number=iterations) / iterations
+        print(f"{name:<10}{secs * 1e3:>13.2f} ms{1 / secs:>14.0f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
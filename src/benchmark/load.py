@@ -0,0 +1,249 @@
+"""
+Load benchmark of the server against a local relation engine stand-in.
+
+Starts the fake RE API (see fake_re.py) and the server as subprocesses,
+then drives each method in turn with a fixed number of concurrent clients
+and reports latency percentiles, throughput and server memory:
+    python -m src.benchmark.load --duration 10 --concurrency 20 --latency-ms 5
+
+With `--baseline`, results are compared to a stored run and the exit status
+is 1 if any method got slower, handles less load, uses more memory than the
+tolerance allows or has more failed calls. `--save-baseline` writes the
+results of this run, along with its settings: a run with other settings
+isn't comparable, so it is not compared and the exit status is 2.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import httpx
+
+# Params of a typical call to each method
+SCENARIOS = {
+    'get_taxon': {'id': '562', 'ns': 'ncbi_taxonomy'},
+    'get_taxa': {'ids': [str(i) for i in range(100)], 'ns': 'ncbi_taxonomy'},
+    'get_taxon_from_ws_obj': {'obj_ref': '1/2/3', 'ns': 'ncbi_taxonomy'},
+    'get_taxa_from_ws_objs': {'obj_refs': [f'1/{i}/1' for i in range(100)], 'ns': 'ncbi_taxonomy'},
+    'get_lineage': {'id': '562', 'ns': 'ncbi_taxonomy'},
+    'get_children': {'id': '562', 'ns': 'ncbi_taxonomy', 'limit': 20},
+    'get_siblings': {'id': '562', 'ns': 'ncbi_taxonomy', 'limit': 20},
+    'search_taxa': {'search_text': 'escherichia', 'ns': 'ncbi_taxonomy', 'limit': 20},
+    'search_species': {'search_text': 'escherichia', 'ns': 'ncbi_taxonomy', 'limit': 20},
+    'get_associated_ws_objects': {'id': '562', 'ns': 'ncbi_taxonomy', 'limit': 20},
+    'get_data_sources': {'ns': ['ncbi_taxonomy', 'gtdb']},
+}
+
+# Options that a run must share with the baseline to be compared to it
+_SETTINGS = ('duration', 'concurrency', 'workers', 'latency_ms', 'jitter_ms', 'result_size')
+
+# Metrics compared to the baseline, and whether a higher value is better
+_COMPARED = [('p95_ms', False), ('throughput', True), ('rss_mib', False)]
+
+_SERVER = "from src.server.main import app; app.run(host='127.0.0.1', port={port}, workers={workers}, access_log=False)"
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _process_tree(pid):
+    pids = [pid]
+    for child in _read(f'/proc/{pid}/task/{pid}/children').split():
+        pids.extend(_process_tree(int(child)))
+    return pids
+
+
+def _read(path):
+    try:
+        with open(path) as fd:
+            return fd.read()
+    except OSError:
+        return ''
+
+
+def rss_mib(pid):
+    """Resident memory of a process and all of its children (the server workers), in MiB."""
+    total_kb = 0
+    for _pid in _process_tree(pid):
+        for line in _read(f'/proc/{_pid}/status').splitlines():
+            if line.startswith('VmRSS:'):
+                total_kb += int(line.split()[1])
+    return total_kb / 1024
+
+
+async def _wait_ready(client, url, proc, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'Server exited with status {proc.returncode}')
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f'Server at {url} did not start in {timeout}s')
+
+
+async def run_method(client, url, method, params, duration, concurrency):
+    """Call a method from `concurrency` clients, each waiting for its last response, for `duration` seconds."""
+    body = json.dumps({'version': '1.1', 'method': 'taxonomy_re_api.' + method, 'params': [params]})
+    headers = {'Content-Type': 'application/json'}
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            resp = await client.post(url, content=body, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if resp.status_code != 200:
+                errors += 1
+
+    start = time.monotonic()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.monotonic() - start
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+async def run(args):
+    re_port = _free_port()
+    port = _free_port()
+    fake_re = subprocess.Popen([
+        sys.executable, '-m', 'src.benchmark.fake_re', '--port', str(re_port), '--latency-ms', str(args.latency_ms),
+        '--jitter-ms', str(args.jitter_ms), '--result-size', str(args.result_size),
+    ])
+    env = dict(os.environ, KBASE_SECURE_CONFIG_PARAM_RE_API_URL=f'http://127.0.0.1:{re_port}')
+    server = subprocess.Popen(
+        [sys.executable, '-c', _SERVER.format(port=port, workers=args.workers)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f'http://127.0.0.1:{port}/'
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+            await _wait_ready(client, url, server)
+            for method in args.methods:
+                # Warm up connections and caches before measuring
+                await run_method(client, url, method, SCENARIOS[method], min(1, args.duration), args.concurrency)
+                results[method] = await run_method(
+                    client, url, method, SCENARIOS[method], args.duration, args.concurrency)
+                results[method]['rss_mib'] = rss_mib(server.pid)
+    finally:
+        for proc in (server, fake_re):
+            proc.terminate()
+            proc.wait()
+    return results
+
+
+def settings_diff(settings, baseline_settings):
+    """List the settings of a run that differ from those of the baseline."""
+    return [
+        f'{name} is {settings[name]}, the baseline used {baseline_settings.get(name)}'
+        for name in _SETTINGS if settings[name] != baseline_settings.get(name)
+    ]
+
+
+def compare(results, baseline, tolerance):
+    """
+    List the regressions of `results` beyond `tolerance` (a fraction) from the baseline.
+    Failed calls are regressions as well, unless the baseline had as many.
+    """
+    regressions = []
+    for (method, result) in results.items():
+        base = baseline.get(method)
+        (errors, allowed) = (result.get('errors', 0), (base or {}).get('errors', 0))
+        if errors > allowed:
+            regressions.append(f'{method}: {errors} errors, the baseline had {allowed}')
+        if base is None:
+            continue
+        for (metric, higher_is_better) in _COMPARED:
+            if metric not in base:
+                continue
+            (value, limit) = (result[metric], base[metric])
+            if higher_is_better and value < limit * (1 - tolerance):
+                regressions.append(f'{method}: {metric} {value:.1f} is below the baseline {limit:.1f}')
+            elif not higher_is_better and value > limit * (1 + tolerance):
+                regressions.append(f'{method}: {metric} {value:.1f} is above the baseline {limit:.1f}')
+    return regressions
+
+
+def _print_table(results):
+    print(f"{'method':<28}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'rss':>11}")
+    for (method, r) in results.items():
+        print(
+            f"{method:<28}{r['requests']:>10}{r['errors']:>8}{r['throughput']:>9.0f}{r['p50_ms']:>7.1f} ms"
+            f"{r['p95_ms']:>7.1f} ms{r['p99_ms']:>7.1f} ms{r['rss_mib']:>7.1f} MiB"
+        )
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--methods', type=lambda s: s.split(','), default=list(SCENARIOS),
+                        help='Comma-separated methods to run (default: all)')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to drive each method')
+    parser.add_argument('--concurrency', type=int, default=20, help='Number of concurrent clients')
+    parser.add_argument('--workers', type=int, default=1, help='Number of server workers')
+    parser.add_argument('--latency-ms', type=float, default=5, help='Latency of every fake RE query')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Max random latency added to fake RE queries')
+    parser.add_argument('--result-size', type=int, default=20, help='Number of documents matched by list queries')
+    parser.add_argument('--baseline', help='JSON file of a previous run to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed regression, as a fraction')
+    parser.add_argument('--save-baseline', help='Write the results of this run to this JSON file')
+    args = parser.parse_args(argv)
+    unknown = set(args.methods) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown methods: {', '.join(sorted(unknown))}")
+
+    settings = {name: getattr(args, name) for name in _SETTINGS}
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)
+        # Check before running, so that a mismatch doesn't cost a whole run
+        diffs = settings_diff(settings, baseline.get('settings', {}))
+        if diffs:
+            for diff in diffs:
+                print('NOT COMPARABLE', diff)
+            return 2
+
+    results = asyncio.run(run(args))
+    _print_table(results)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as fd:
+            json.dump({'settings': settings, 'results': results}, fd, indent=2, sort_keys=True)
+    if baseline is not None:
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
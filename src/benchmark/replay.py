@@ -0,0 +1,104 @@
+"""
+Replay a captured traffic log (see src/utils/traffic.py) against a server.
+
+Requests are sent with the same spacing as they were received, sped up by
+`--speed`, or as fast as `--concurrency` allows with `--speed max`:
+    python -m src.benchmark.replay traffic.jsonl http://localhost:5000/ --speed 4 --concurrency 50
+
+Latency is reported per method (batches as "batch"). Tokens are not kept in
+the log, so requests that had one are sent with `--token`, if it is given.
+"""
+import sys
+import time
+import asyncio
+import argparse
+import httpx
+
+from src.utils import codec, traffic
+from src.benchmark.load import percentile
+
+
+def _method(body):
+    if isinstance(body, list):
+        return 'batch'
+    method = body.get('method') if isinstance(body, dict) else None
+    return method.split('.')[-1] if isinstance(method, str) else 'unknown'
+
+
+async def replay(entries, url, speed=1.0, concurrency=10, token=None):
+    """
+    Send the logged requests to `url`, with `speed` (None for max speed) scaling their timing.
+    Returns a dict of method name to (sorted latencies in seconds, number of errors).
+    """
+    entries = sorted(entries, key=lambda entry: entry['ts'])
+    results = {}
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def send(client, entry):
+        headers = {'Content-Type': 'application/json'}
+        if entry.get('auth') and token:
+            headers['Authorization'] = token
+        (latencies, errors) = results.setdefault(_method(entry['body']), ([], [0]))
+        try:
+            start = time.perf_counter()
+            resp = await client.post(url, content=codec.dumps(entry['body']), headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if resp.status_code != entry.get('status', 200):
+                errors[0] += 1
+        except httpx.HTTPError:
+            errors[0] += 1
+        finally:
+            sem.release()
+
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        tasks = []
+        if entries:
+            (first_ts, start) = (entries[0]['ts'], time.monotonic())
+        for entry in entries:
+            if speed:
+                delay = start + (entry['ts'] - first_ts) / speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await sem.acquire()
+            tasks.append(asyncio.ensure_future(send(client, entry)))
+        await asyncio.gather(*tasks)
+    return {method: (sorted(latencies), errors[0]) for (method, (latencies, errors)) in results.items()}
+
+
+def _print_report(results, elapsed):
+    print(f"{'method':<28}{'requests':>10}{'errors':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    total = 0
+    for (method, (latencies, errors)) in sorted(results.items()):
+        total += len(latencies)
+        if not latencies:
+            print(f"{method:<28}{0:>10}{errors:>8}")
+            continue
+        (p50, p95, p99) = [percentile(latencies, pct) * 1000 for pct in (50, 95, 99)]
+        print(
+            f"{method:<28}{len(latencies):>10}{errors:>8}{p50:>7.1f} ms{p95:>7.1f} ms{p99:>7.1f} ms"
+            f"{latencies[-1] * 1000:>7.1f} ms"
+        )
+    print(f'{total} requests in {elapsed:.1f}s ({total / elapsed:.0f} req/s)')
+
+
+def _speed(value):
+    return None if value == 'max' else float(value)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('log', help='Traffic log file')
+    parser.add_argument('url', help='URL of the JSON-RPC endpoint of the target server')
+    parser.add_argument('--speed', type=_speed, default=1.0, help='Speed-up factor of the timing, or "max"')
+    parser.add_argument('--concurrency', type=int, default=10, help='Max requests in flight')
+    parser.add_argument('--token', help='Authorization token for requests that had one')
+    args = parser.parse_args(argv)
+
+    start = time.monotonic()
+    results = asyncio.run(replay(traffic.read(args.log), args.url, args.speed, args.concurrency, args.token))
+    _print_report(results, time.monotonic() - start)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
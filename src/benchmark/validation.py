@@ -0,0 +1,45 @@
+"""
+Micro-benchmark of request parameter validation, per method.
+
+Compares `jsonschema.validate` against the precompiled validators used by the server:
+    python -m src.benchmark.validation [iterations]
+"""
+import sys
+import timeit
+import jsonschema
+
+from src.utils.schemas import load_schemas, load_validators, validate
+
+# Typical valid params for each schema
+_PARAMS = {
+    'get_taxon': {'id': '562', 'ns': 'ncbi_taxonomy'},
+    'get_taxa': {'ids': [str(i) for i in range(100)], 'ns': 'ncbi_taxonomy'},
+    'get_taxon_from_ws_obj': {'obj_ref': '1/2/3', 'ns': 'ncbi_taxonomy'},
+    'get_lineage': {'id': '562', 'ns': 'ncbi_taxonomy', 'select': ['id', 'rank']},
+    'get_children': {'id': '562', 'ns': 'ncbi_taxonomy', 'limit': 20, 'offset': 0},
+    'get_siblings': {'id': '562', 'ns': 'ncbi_taxonomy', 'limit': 20, 'offset': 0},
+    'search_taxa': {'search_text': 'escherichia', 'ns': 'ncbi_taxonomy', 'limit': 20},
+    'search_species': {'search_text': 'escherichia', 'ns': 'ncbi_taxonomy', 'limit': 20},
+    'get_associated_ws_objects': {'id': '562', 'ns': 'ncbi_taxonomy', 'limit': 20},
+    'get_data_sources': {'ns': ['ncbi_taxonomy', 'gtdb']},
+}
+
+
+def main(iterations):
+    schemas = load_schemas()
+    validators = load_validators(schemas)
+    print(f"{'schema':<28}{'jsonschema.validate':>22}{'precompiled':>14}{'speedup':>10}")
+    for (name, params) in sorted(_PARAMS.items()):
+        if name not in schemas:
+            continue
+        schema = schemas[name]
+        validator = validators[name]
+        before = timeit.timeit(lambda: jsonschema.validate(instance=params, schema=schema), number=iterations)
+        after = timeit.timeit(lambda: validate(validator, params), number=iterations)
+        before_us = before / iterations * 1e6
+        after_us = after / iterations * 1e6
+        print(f"{name:<28}{before_us:>19.1f} us{after_us:>11.1f} us{before / after:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -28,11 +28,26 @@ class ServerError(Exception):
     code = -32000
 
 
+class DeadlineExceeded(ServerError):
+    """The deadline of a call passed before it finished."""
+    code = -32001
+
+
+class Overloaded(ServerError):
+    """A call was rejected without being tried, as the RE API is overloaded or failing."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        # Seconds after which the call may succeed
+        self.retry_after = retry_after
+
+
 class REError(Exception):
     """Error from the RE API."""
 
     def __init__(self, resp):
-        """Takes a requests response object."""
+        """Takes an HTTP response object."""
+        self.status_code = resp.status_code
         self.resp_json = None
         try:
             self.resp_json = resp.json()
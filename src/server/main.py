@@ -2,20 +2,37 @@
 Main HTTP server entrypoint.
 """
 import time
+import asyncio
 import sanic
-import jsonschema
 import traceback
+from urllib.parse import parse_qsl, quote
 from jsonschema.exceptions import ValidationError
-from contextlib import suppress
 
 from src.utils.config import get_config
-from src.utils.schemas import load_schemas
-from src.utils.search import clean_search_text
-from src.utils import re_api
-from src.exceptions import MethodNotFound, InvalidRequest, InvalidParams, ServerError, REError
+from src.utils.schemas import load_schemas, load_validators, validate
+from src.utils.search import clean_search_text, is_plain_prefix, merge_ranked
+from src.utils.lineage import LineageCache
+from src.utils.snapshot import load_snapshots, find_snapshot
+from src.utils.stream import StreamedResult, fetch_pages
+from src.utils.pagination import Page
+from src.utils.traffic import TrafficLog
+from src.utils.refresh import RefreshingValue
+from src.utils.conditional import etag, etag_matches
+from src.utils.compression import choose_encoding, compress
+from src.utils import re_api, codec, metrics
+from src.exceptions import (
+    MethodNotFound, InvalidRequest, InvalidParams, ServerError, REError, Overloaded, DeadlineExceeded,
+)
 
 _CONF = get_config()
 _SCHEMAS = load_schemas()
+_VALIDATORS = load_validators(_SCHEMAS)
+_SNAPSHOTS = load_snapshots(_CONF['snapshot_paths'])
+_LINEAGES = (
+    LineageCache(_CONF['lineage_cache_snapshots'], _CONF['lineage_cache_max_taxa'], _CONF['lineage_cache_ttl'])
+    if _CONF['lineage_cache'] else None
+)
+_TRAFFIC = TrafficLog(_CONF['traffic_log'], _CONF['traffic_log_sample']) if _CONF['traffic_log'] else None
 app = sanic.Sanic(name='Taxonomy RE API')
 app.config.API_TITLE = 'Taxonomy RE API'
 app.config.API_DESCRIPTION = 'Taxonomy data API using the relation engine.'
@@ -44,10 +61,24 @@ def transform_query_params(params, required_ns_fields=[], field_name_remappings=
         params[field_name] = ns_config['query_params'][field_name]
     for (input_name, output_name) in field_name_remappings.items():
         params[output_name] = params.pop(input_name)
-    params.setdefault('ts', int(time.time() * 1000))
+    params.setdefault('ts', default_ts())
     return (ns, ns_config)
 
 
+def default_ts():
+    """
+    The current time in milliseconds, used when a request has no `ts`.
+    It is floored to the start of its bucket, so that requests without a `ts` made
+    at about the same time send identical RE queries, which share one RE request
+    while in flight (see re_api.FLIGHTS) and a cache entry when caching.
+    """
+    ts = int(time.time() * 1000)
+    bucket = _CONF['cache_ts_bucket_ms']
+    if bucket > 0:
+        ts -= ts % bucket
+    return ts
+
+
 # Mapping of namespace names to collection and field names
 # The 'translate_field_name' options are used to change field names in the source document.
 _NS_CONFIG = {
@@ -82,93 +113,283 @@ _NS_CONFIG = {
 }
 
 
-def _get_taxon(params, headers):
+async def _get_taxon(params, headers):
     """
     Fetch a taxon by ID.
     Returns (result, err), one of which will be None.
     """
-    schema = _SCHEMAS['get_taxon']
-    jsonschema.validate(instance=params, schema=schema)
+    validate(_VALIDATORS['get_taxon'], params)
     (ns, ns_config) = transform_query_params(params, ('@taxon_coll',))
-    results = re_api.query("taxonomy_fetch_taxon", params)
+    snapshot = find_snapshot(_SNAPSHOTS, ns, params['ts'])
+    if snapshot is not None:
+        results = {'stats': None, 'results': snapshot.get_taxon(params['id'])}
+    else:
+        results = await re_api.query("taxonomy_fetch_taxon", params, cache=True)
     transform_taxon_results(results['results'], ns, ns_config)
     return {'stats': results['stats'], 'results': results['results'], 'ts': params['ts']}
 
 
-def _get_taxon_from_ws_obj(params, headers):
+async def _get_taxa(params, headers):
+    """
+    Fetch many taxa by ID.
+    The IDs are fetched in chunks, one RE query per chunk, and the chunks are run concurrently.
+    Returns the found taxa keyed by ID, plus the list of IDs that were not found.
+    """
+    validate(_VALIDATORS['get_taxa'], params)
+    (ns, ns_config) = transform_query_params(params, ('@taxon_coll',))
+    # Remove duplicates, keeping the requested order
+    ids = list(dict.fromkeys(params.pop('ids')))
+    snapshot = find_snapshot(_SNAPSHOTS, ns, params['ts'])
+    if snapshot is not None:
+        found = {_id: taxon for _id in ids for taxon in snapshot.get_taxon(_id)}
+        transform_taxon_results(found.values(), ns, ns_config)
+        return {'stats': [], 'results': found, 'missing': [_id for _id in ids if _id not in found], 'ts': params['ts']}
+    size = _CONF['bulk_chunk_size']
+    chunks = [ids[idx:idx + size] for idx in range(0, len(ids), size)]
+    responses = await asyncio.gather(*[
+        re_api.query("taxonomy_fetch_taxa", {**params, 'ids': chunk}, cache=True)
+        for chunk in chunks
+    ])
+    found = {}
+    for resp in responses:
+        transform_taxon_results(resp['results'], ns, ns_config)
+        for taxon in resp['results']:
+            found[taxon['id']] = taxon
+    return {
+        'stats': [resp['stats'] for resp in responses],
+        'results': found,
+        'missing': [_id for _id in ids if _id not in found],
+        'ts': params['ts'],
+    }
+
+
+async def _get_taxon_from_ws_obj(params, headers):
     """
     Fetch the taxon document from a workspace object reference.
     """
-    schema = _SCHEMAS['get_taxon_from_ws_obj']
-    jsonschema.validate(instance=params, schema=schema)
+    validate(_VALIDATORS['get_taxon_from_ws_obj'], params)
     (ns, ns_config) = transform_query_params(params, ('@taxon_coll',))
     params['obj_ref'] = params['obj_ref'].replace('/', ':')
-    results = re_api.query("taxonomy_get_taxon_from_ws_obj", params)
+    results = await re_api.query("taxonomy_get_taxon_from_ws_obj", params)
     transform_taxon_results(results['results'], ns, ns_config)
     return {'stats': results['stats'], 'results': results['results'], 'ts': params['ts']}
 
 
-def _get_lineage(params, headers):
+async def _get_taxa_from_ws_objs(params, headers):
+    """
+    Fetch the taxon documents of many versioned workspace object references.
+    The references are resolved in chunks, one RE query per chunk, and the chunks are run concurrently.
+    Returns the taxa keyed by reference, plus the list of references that have no taxon.
+    """
+    validate(_VALIDATORS['get_taxa_from_ws_objs'], params)
+    (ns, ns_config) = transform_query_params(params, ('@taxon_coll',))
+    # Remove duplicates, keeping the requested order
+    refs = list(dict.fromkeys(params.pop('obj_refs')))
+    size = _CONF['bulk_chunk_size']
+    chunks = [refs[idx:idx + size] for idx in range(0, len(refs), size)]
+    responses = await asyncio.gather(*[
+        re_api.query("taxonomy_get_taxa_from_ws_objs", {**params, 'obj_refs': [ref.replace('/', ':') for ref in chunk]})
+        for chunk in chunks
+    ])
+    found = {}
+    for resp in responses:
+        for doc in resp['results']:
+            # An object whose taxon isn't in the namespace at `ts` comes back with a null taxon
+            if doc.get('taxon') is not None:
+                found.setdefault(doc['obj_ref'].replace(':', '/'), doc['taxon'])
+    transform_taxon_results(found.values(), ns, ns_config)
+    return {
+        'stats': [resp['stats'] for resp in responses],
+        'results': found,
+        'missing': [ref for ref in refs if ref not in found],
+        'ts': params['ts'],
+    }
+
+
+async def _get_lineage(params, headers):
     """
     Fetch ancestor lineage for a taxon by ID.
     Returns (result, err), one of which will be None.
     """
-    schema = _SCHEMAS['get_lineage']
-    jsonschema.validate(instance=params, schema=schema)
+    validate(_VALIDATORS['get_lineage'], params)
     (ns, ns_config) = transform_query_params(params, ('@taxon_coll', '@taxon_child_of'))
-    results = re_api.query("taxonomy_get_lineage", params)
+    snapshot = find_snapshot(_SNAPSHOTS, ns, params['ts'])
+    if snapshot is not None:
+        results = snapshot.get_lineage(params['id'], params.get('select'))
+        transform_taxon_results(results, ns, ns_config)
+        return {'stats': None, 'results': results, 'ts': params['ts']}
+    cached = _LINEAGES.snapshot(ns, params['ts']) if _LINEAGES is not None else None
+    if cached is not None:
+        result = await _get_cached_lineage(params, cached, ns, ns_config)
+        if result is not None:
+            return result
+    results = await re_api.query("taxonomy_get_lineage", params, cache=True)
     transform_taxon_results(results['results'], ns, ns_config)
     return {'stats': results['stats'], 'results': results['results'], 'ts': params['ts']}
 
 
-def _get_children(params, headers):
+async def _get_cached_lineage(params, snapshot, ns, ns_config):
+    """
+    Build a lineage from a lineage cache snapshot, fetching only what is not cached yet.
+    If the chain of parents is unknown, the parent of the taxon is fetched from RE, then its
+    parent, and so on until the chain joins a cached ancestor. The ancestor documents that are
+    not cached are then fetched in one query.
+    Returns None if, meanwhile, the snapshot was narrowed to a range that no longer covers `ts`.
+    """
+    query_params = ns_config['query_params']
+    stats = None
+    current = snapshot.first_unknown(params['id'])
+    if current is None:
+        _LINEAGES.hits += 1
+    else:
+        _LINEAGES.misses += 1
+    while current is not None:
+        parent_params = {
+            '@taxon_coll': query_params['@taxon_coll'],
+            '@taxon_child_of': query_params['@taxon_child_of'],
+            'id': current,
+            'ts': params['ts'],
+        }
+        resp = await re_api.query("taxonomy_get_parent", parent_params, cache=True)
+        stats = resp['stats']
+        if not resp['results'] and current == params['id']:
+            # A root, or not a taxon at all: there is no lineage, and nothing to cache
+            break
+        snapshot.add_parent(current, resp['results'][0] if resp['results'] else None)
+        current = snapshot.first_unknown(current)
+    ids = snapshot.lineage_ids(params['id']) or []
+    missing = [_id for _id in ids if _id not in snapshot.docs]
+    if missing:
+        fetch_params = {'@taxon_coll': query_params['@taxon_coll'], 'ids': missing, 'ts': params['ts']}
+        resp = await re_api.query("taxonomy_fetch_taxa", fetch_params, cache=True)
+        snapshot.add_docs(resp['results'])
+        stats = resp['stats']
+    if not snapshot.covers(params['ts']):
+        return None
+    select = params.get('select')
+    results = []
+    for _id in ids:
+        doc = snapshot.docs.get(_id)
+        if doc is not None:
+            results.append({k: doc[k] for k in select if k in doc} if select else dict(doc))
+    transform_taxon_results(results, ns, ns_config)
+    return {'stats': stats, 'results': results, 'ts': params['ts']}
+
+
+async def _get_children(params, headers):
     """
     Fetch the descendants for a taxon by ID.
     Returns (result, err), one of which will be None.
     """
-    schema = _SCHEMAS['get_children']
-    jsonschema.validate(instance=params, schema=schema)
+    validate(_VALIDATORS['get_children'], params)
+    stream = params.pop('stream', False)
+    page = Page('get_children', params)
     (ns, ns_config) = transform_query_params(params, ('@taxon_coll', '@taxon_child_of', 'sciname_field'))
-    results = re_api.query("taxonomy_get_children", params)
+    snapshot = find_snapshot(_SNAPSHOTS, ns, params['ts'])
+    if stream:
+        return await _stream_children(params, ns, ns_config, snapshot)
+    if snapshot is not None and not params.get('search_text'):
+        (total_count, docs) = snapshot.get_children(
+            params['id'], params.get('limit', 20), params.get('offset', 0), params.get('select'), page.after)
+        results = {'stats': None, 'results': [{'total_count': total_count, 'results': docs}]}
+    else:
+        results = await _query_page("taxonomy_get_children", params, page)
     res = results['results'][0]
     transform_taxon_results(res['results'], ns, ns_config)
-    return {'stats': results['stats'], 'total_count': res['total_count'], 'results': res['results'], 'ts': params['ts']}
+    return {
+        'stats': results['stats'],
+        'total_count': res['total_count'],
+        'results': res['results'],
+        'ts': params['ts'],
+        'next_cursor': page.next_cursor(params, res['results'], res['total_count']),
+    }
+
+
+async def _query_page(stored_query, params, page):
+    """
+    Run a paginated RE query. A page after a cursor is fetched with the keyset variant of the
+    query (such as taxonomy_get_children_after), which seeks to the last result seen instead of
+    counting `offset` results from the start.
+    """
+    if page.after is None:
+        return await re_api.query(stored_query, params, cache=True)
+    query_params = {key: val for (key, val) in params.items() if key != 'offset'}
+    return await re_api.query(stored_query + '_after', {**query_params, 'after': page.after}, cache=True)
+
+
+async def _stream_children(params, ns, ns_config, snapshot):
+    """Fetch the children of a taxon page by page, for the streaming mode of get_children."""
+    fields = {'stats': None, 'ts': params['ts']}
+
+    async def fetch_page(offset, limit):
+        if snapshot is not None and not params.get('search_text'):
+            (total_count, children) = snapshot.get_children(params['id'], limit, offset, params.get('select'))
+            transform_taxon_results(children, ns, ns_config)
+            return (total_count, children)
+        results = await re_api.query("taxonomy_get_children", {**params, 'offset': offset, 'limit': limit})
+        fields['stats'] = fields['stats'] or results['stats']
+        res = results['results'][0]
+        transform_taxon_results(res['results'], ns, ns_config)
+        return (res['total_count'], res['results'])
+
+    return await _stream_pages(fetch_page, params, fields)
 
 
-def _get_siblings(params, headers):
+async def _stream_pages(fetch_page, params, fields):
+    (total_count, pages) = await fetch_pages(
+        fetch_page, params.get('offset', 0), params.get('limit'), _CONF['stream_page_size'])
+    return StreamedResult({**fields, 'total_count': total_count}, pages)
+
+
+async def _get_siblings(params, headers):
     """
     Fetch the siblings for a taxon by ID.
     Returns (result, err), one of which will be None.
     """
-    schema = _SCHEMAS['get_siblings']
-    jsonschema.validate(instance=params, schema=schema)
+    validate(_VALIDATORS['get_siblings'], params)
+    page = Page('get_siblings', params)
     (ns, ns_config) = transform_query_params(params, ('@taxon_coll', '@taxon_child_of', 'sciname_field'))
-    results = re_api.query("taxonomy_get_siblings", params)
+    snapshot = find_snapshot(_SNAPSHOTS, ns, params['ts'])
+    if snapshot is not None:
+        (total_count, docs) = snapshot.get_siblings(
+            params['id'], params.get('limit', 20), params.get('offset', 0), params.get('select'), page.after)
+        results = {'stats': None, 'results': [{'total_count': total_count, 'results': docs}]}
+    else:
+        results = await _query_page("taxonomy_get_siblings", params, page)
     res = results['results'][0]
     transform_taxon_results(res['results'], ns, ns_config)
-    return {'stats': results['stats'], 'total_count': res['total_count'], 'results': res['results'], 'ts': params['ts']}
+    return {
+        'stats': results['stats'],
+        'total_count': res['total_count'],
+        'results': res['results'],
+        'ts': params['ts'],
+        'next_cursor': page.next_cursor(params, res['results'], res['total_count']),
+    }
 
 
-def _search_taxa(params, headers):
+async def _search_taxa(params, headers):
     """
     Search for a taxon vertex by scientific name.
     Returns (result, err), one of which will be None.
     """
-    schema = _SCHEMAS['search_taxa']
-    jsonschema.validate(instance=params, schema=schema)
+    validate(_VALIDATORS['search_taxa'], params)
+    if _search_namespaces(params['ns']) is not None:
+        return await _search_many('search_taxa', _search_taxa, params, headers)
+    page = Page('search_taxa', params)
     (ns, ns_config) = transform_query_params(params, ('@taxon_coll', 'sciname_field'))
-    results = re_api.query("taxonomy_search_sci_name", params)
+    results = await re_api.query("taxonomy_search_sci_name", params, cache=True)
     res = results['results'][0]
     transform_taxon_results(res['results'], ns, ns_config)
     return {
         'stats': results['stats'],
         'total_count': res.get('total_count'),
         'results': res['results'],
-        'ts': params['ts']
+        'ts': params['ts'],
+        'next_cursor': page.next_cursor(params, res['results'], res.get('total_count')),
     }
 
 
-def _search_species(params, headers):
+async def _search_species(params, headers):
     """
     Search for a species or strain.
 
@@ -189,106 +410,243 @@ def _search_species(params, headers):
         "stats": {...},
     }
     """
-    schema = _SCHEMAS['search_species']
-    jsonschema.validate(instance=params, schema=schema)
+    validate(_VALIDATORS['search_species'], params)
+    if _search_namespaces(params['ns']) is not None:
+        return await _search_many('search_species', _search_species, params, headers)
+    page = Page('search_species', params)
     ns, ns_config = transform_query_params(
         params=params,
         required_ns_fields=('@taxon_coll', 'sciname_field'),
     )
     # Check if the search text is acceptable for AQL
     params['search_text'] = clean_search_text(params['search_text'])
+    snapshot = find_snapshot(_SNAPSHOTS, ns, params['ts'])
+    if (
+        params['search_text']
+        and snapshot is not None
+        and len(params['search_text']) <= _CONF['prefix_search_max_len']
+        and is_plain_prefix(params['search_text'])
+    ):
+        # Answer prefix searches, such as autocomplete, from the snapshot's species index
+        results = snapshot.search_species(
+            params['search_text'], params.get('limit', 20), params.get('offset', 0), params.get('select'), page.after)
+        transform_taxon_results(results, ns, ns_config)
+        return {
+            'results': results,
+            'ts': params['ts'],
+            'stats': None,
+            'next_cursor': page.next_cursor(params, results),
+        }
     if params['search_text']:
         stored_query = (
             'taxonomy_search_species_strain_no_sort'
             if len(params['search_text']) <= 3
             else 'taxonomy_search_species_strain'
         )
-        resp_json = re_api.query(stored_query, params)
+        resp_json = await re_api.query(stored_query, params, cache=True)
         transform_taxon_results(resp_json['results'], ns, ns_config)
         return {
             'results': resp_json['results'],
             'ts': params['ts'],
             'stats': resp_json['stats'],
+            'next_cursor': page.next_cursor(params, resp_json['results']),
         }
     else:
         return {
             'results': [],
             'ts': params['ts'],
             'stats': None,
+            'next_cursor': None,
         }
 
 
-def _get_associated_ws_objects(params, headers):
+# Max number of results fetched per namespace by a search in several namespaces (the max `limit` of one)
+_MAX_MERGED_SEARCH = 1000
+
+
+def _search_namespaces(ns):
+    """The namespaces to search for an `ns` param that is a list, or "*" for all; None for a single namespace."""
+    if ns == '*':
+        return list(_NS_CONFIG)
+    if isinstance(ns, list):
+        return ns
+    return None
+
+
+async def _search_many(method, search, params, headers):
+    """
+    Run a search in several namespaces concurrently, then merge and rank their results
+    (see merge_ranked) and apply `limit` and `offset` to the merged list.
+    Each namespace is searched for its first `offset + limit` results, with the same `ts`.
+    """
+    page = Page(method, params)
+    namespaces = _search_namespaces(params['ns'])
+    if params.get('ts') is None:
+        params['ts'] = default_ts()
+    (offset, limit) = (params.get('offset', 0), params.get('limit', 20))
+    if offset + limit > _MAX_MERGED_SEARCH:
+        raise InvalidParams(f'A search in several namespaces can only page through its first {_MAX_MERGED_SEARCH} '
+                            'results (offset + limit)')
+    resps = await asyncio.gather(*[
+        search({**params, 'ns': ns, 'offset': 0, 'limit': offset + limit}, headers)
+        for ns in namespaces
+    ])
+    ranked = merge_ranked(
+        [(resp['results'], _NS_CONFIG[ns]['query_params']['sciname_field']) for (ns, resp) in zip(namespaces, resps)],
+        clean_search_text(params['search_text']),
+    )
+    results = ranked[offset:offset + limit]
+    counts = [resp.get('total_count') for resp in resps]
+    total_count = None if method == 'search_species' or None in counts else sum(counts)
+    result = {
+        'results': results,
+        'ts': params['ts'],
+        'stats': {ns: resp['stats'] for (ns, resp) in zip(namespaces, resps)},
+        'next_cursor': page.next_cursor(params, results, total_count),
+    }
+    if method == 'search_taxa':
+        result['total_count'] = total_count
+    return result
+
+
+async def _get_associated_ws_objects(params, headers):
     """
     Get any versioned workspace objects associated with a taxon.
     """
-    schema = _SCHEMAS['get_associated_ws_objects']
-    jsonschema.validate(instance=params, schema=schema)
+    validate(_VALIDATORS['get_associated_ws_objects'], params)
+    stream = params.pop('stream', False)
     (ns, ns_config) = transform_query_params(params, ('@taxon_coll',), {'id': 'taxon_id'})
-    results = re_api.query("taxonomy_get_associated_ws_objects", params, headers.get('Authorization'))
+    tok = headers.get('Authorization')
+    if stream:
+        fields = {'stats': None}
+
+        async def fetch_page(offset, limit):
+            page_params = {**params, 'offset': offset, 'limit': limit}
+            results = await re_api.query("taxonomy_get_associated_ws_objects", page_params, tok)
+            fields['stats'] = fields['stats'] or results['stats']
+            res = results['results'][0]
+            _set_workspace_info(res['results'])
+            return (res['total_count'], res['results'])
+
+        return await _stream_pages(fetch_page, params, fields)
+    # Users page back and forth through the same objects, so results are cached briefly for each token
+    results = await re_api.query("taxonomy_get_associated_ws_objects", params, tok, auth_cache=True)
     res = results['results'][0]
-    transform_taxon_results(results['results'], ns, ns_config)
-    for res in results['results']:
-        # Write some extra metadata about the workspace for each object
-        for elem in res['results']:
-            obj = elem['ws_obj']
-            obj['workspace'] = {
-                'refdata_source': obj['ws_info'].get('metadata', {}).get('refdata_source'),
-                'narr_name': obj['ws_info'].get('metadata', {}).get('narrative_nice_Name'),
-            }
-            del obj['ws_info']
+    _set_workspace_info(res['results'])
     return {'stats': results['stats'], 'total_count': res['total_count'], 'results': res['results']}
 
 
-def _get_data_sources(params, headers):
+def _set_workspace_info(results):
+    """Replace the workspace info of each object with the bits of its metadata that clients use, in one pass."""
+    for elem in results:
+        obj = elem['ws_obj']
+        metadata = obj.pop('ws_info').get('metadata') or {}
+        obj['workspace'] = {
+            'refdata_source': metadata.get('refdata_source'),
+            'narr_name': metadata.get('narrative_nice_Name'),
+        }
+
+
+async def _fetch_data_sources():
+    """Fetch every taxonomy data source from RE, without the database fields."""
+    response = await re_api.query("data_sources_get_all_data_sources", {'type': 'taxonomy'})
+    sources = []
+    for source in response['results']:
+        del source['_id']
+        del source['_key']
+        del source['_rev']
+        sources.append(source)
+    return sources
+
+
+# All the data sources, refreshed in the background
+_DATA_SOURCES = RefreshingValue(_fetch_data_sources, _CONF['data_sources_max_age'])
+# A request for an unknown namespace refreshes the data sources if they are older than this, in seconds
+_DATA_SOURCES_MISS_AGE = 10
+
+
+async def _get_data_sources(params, headers):
     """
     Returns a list of all Taxonomy Sources
     """
-    schema = _SCHEMAS['get_data_sources']
-
     # parameters for get_data_sources are not actually required, as omitting
     # the parameters (which filter the sources) implies returning all.
     if params is not None:
-        jsonschema.validate(instance=params, schema=schema)
+        validate(_VALIDATORS['get_data_sources'], params)
 
-    re_params = {
-        'type': 'taxonomy',
-    }
+    sources = await _DATA_SOURCES.get()
 
     # Be nice. Filtering by ns can be skipped by either setting 'ns' to null, or
     # omitting it from the params object.
     if params is not None and params.get('ns') is not None:
-        re_params['ns'] = params.get('ns')
-        response = re_api.query("data_sources_get_data_sources", re_params, headers.get('Authorization'))
-    else:
-        response = re_api.query("data_sources_get_all_data_sources", re_params, headers.get('Authorization'))
-
-    sources = []
-    for source in response['results']:
-        del source['_id']
-        del source['_key']
-        del source['_rev']
-        sources.append(source)
+        namespaces = set(params['ns'])
+        sources = [source for source in sources if source.get('ns') in namespaces]
+        if len(sources) < len(namespaces):
+            # The missing sources may have been added since the last refresh
+            _DATA_SOURCES.refresh_if_older(_DATA_SOURCES_MISS_AGE)
 
     return {
         'sources': sources
     }
 
 
+def _parse_body(req):
+    """
+    Parse the request body as JSON, once per request.
+    The result is kept on the request context for building the response.
+    """
+    if not req.body:
+        req.ctx.rpc_body = None
+    else:
+        try:
+            req.ctx.rpc_body = codec.loads(req.body)
+        except ValueError:
+            raise sanic.exceptions.InvalidUsage('Failed when parsing body as json')
+    return req.ctx.rpc_body
+
+
+def _json_resp(resp, status=200):
+    return sanic.response.raw(codec.dumps(resp), status=status, content_type='application/json')
+
+
 def _rpc_resp(req, resp, status=200):
     resp['version'] = '1.1'
-    # We need to suppress the call for json
-    # since it fails if the request does not
-    # have json.
-    has_json = False
-    with suppress(Exception):
-        if req.json:
-            has_json = True
+    # The body is not set if it failed to parse as json
+    body = getattr(req.ctx, 'rpc_body', None)
+
+    if isinstance(body, dict) and 'id' in body:
+        resp['id'] = body['id']
+
+    return _json_resp(resp, status)
 
-    if has_json and 'id' in req.json:
-        resp['id'] = req.json['id']
 
-    return sanic.response.json(resp, status)
+def _rpc_stream(req, result):
+    """
+    Respond with a StreamedResult, writing its results array in chunks as
+    the pages are fetched.
+    """
+    resp = {'version': '1.1'}
+    body = getattr(req.ctx, 'rpc_body', None)
+    if isinstance(body, dict) and 'id' in body:
+        resp['id'] = body['id']
+    # Split the response around an empty results array, which is the last field
+    resp['result'] = [{**result.fields, 'results': []}]
+    (start, end) = codec.dumps(resp).rsplit(b'[]', 1)
+
+    async def write(response):
+        await response.write(start + b'[')
+        size = len(start) + len(end) + 2
+        sep = b''
+        async for docs in result.pages:
+            if docs:
+                chunk = sep + b','.join(codec.dumps(doc) for doc in docs)
+                await response.write(chunk)
+                size += len(chunk)
+                sep = b','
+        await response.write(b']' + end)
+        metrics.RESPONSE_SIZE.labels(req.ctx.rpc_method).observe(size)
+
+    return sanic.response.stream(write, content_type='application/json')
 
 
 def get_json_type(json_value):
@@ -309,26 +667,255 @@ def get_json_type(json_value):
         raise Exception('Not a json type')
 
 
+_HANDLERS = {
+    'taxonomy_re_api.get_taxon': _get_taxon,
+    'taxonomy_re_api.get_taxa': _get_taxa,
+    'taxonomy_re_api.get_lineage': _get_lineage,
+    'taxonomy_re_api.get_children': _get_children,
+    'taxonomy_re_api.get_siblings': _get_siblings,
+    'taxonomy_re_api.search_taxa': _search_taxa,
+    'taxonomy_re_api.search_species': _search_species,
+    'taxonomy_re_api.get_associated_ws_objects': _get_associated_ws_objects,
+    'taxonomy_re_api.get_taxon_from_ws_obj': _get_taxon_from_ws_obj,
+    'taxonomy_re_api.get_taxa_from_ws_objs': _get_taxa_from_ws_objs,
+    'taxonomy_re_api.get_data_sources': _get_data_sources,
+}
+
+
 @app.route('/', methods=["POST", "GET", "OPTIONS"])
 async def handle_rpc(req):
-    """Handle a JSON RPC 1.1 request."""
+    """
+    Handle a JSON RPC 1.1 request.
+    The body may also be an array of calls, which are run concurrently and
+    answered with an array of responses in the same order.
+    """
     if req.method == 'OPTIONS':
         return sanic.response.raw(b'', status=204)
     if req.method == 'GET':
         # Server status request
-        return _rpc_resp(req, {'result': [{'status': 'ok'}]})
-    body = req.json
-    handlers = {
-        'taxonomy_re_api.get_taxon': _get_taxon,
-        'taxonomy_re_api.get_lineage': _get_lineage,
-        'taxonomy_re_api.get_children': _get_children,
-        'taxonomy_re_api.get_siblings': _get_siblings,
-        'taxonomy_re_api.search_taxa': _search_taxa,
-        'taxonomy_re_api.search_species': _search_species,
-        'taxonomy_re_api.get_associated_ws_objects': _get_associated_ws_objects,
-        'taxonomy_re_api.get_taxon_from_ws_obj': _get_taxon_from_ws_obj,
-        'taxonomy_re_api.get_data_sources': _get_data_sources,
-    }
+        status = {'status': 'ok', 'coalesced_queries': re_api.FLIGHTS.coalesced}
+        if re_api.CACHE is not None:
+            status['cache'] = re_api.CACHE.stats()
+        if re_api.AUTH_CACHE is not None:
+            status['auth_cache'] = re_api.AUTH_CACHE.stats()
+        if _SNAPSHOTS:
+            status['snapshots'] = [snapshot.stats() for snapshots in _SNAPSHOTS.values() for snapshot in snapshots]
+        if _LINEAGES is not None:
+            status['lineage_cache'] = _LINEAGES.stats()
+        status['data_sources'] = _DATA_SOURCES.stats()
+        if re_api.LIMITER is not None:
+            status['re_limiter'] = re_api.LIMITER.stats()
+        status['re_replicas'] = re_api.POOL.stats()
+        return _rpc_resp(req, {'result': [status]})
+    with metrics.IN_FLIGHT.track_inprogress():
+        return await _handle_post(req)
+
+
+async def _handle_post(req):
+    body = _parse_body(req)
+
+    if not body:
+        raise InvalidRequest("Request is not valid")
+
+    if isinstance(body, list):
+        req.ctx.rpc_method = 'batch'
+        return await _handle_batch(body, req.headers)
+
+    req.ctx.rpc_method = _method_label(body)
+    validators = _http_validators(body)
+    # "*" only makes sense for a resource at a URL, not for a call in a POST body
+    if validators is not None and etag_matches(req.headers.get('If-None-Match'), validators['ETag'], any_tag=False):
+        return sanic.response.raw(b'', status=304, headers=validators)
+    result = await _run_call(body, req.headers)
+    if isinstance(result, StreamedResult):
+        return _rpc_stream(req, result)
+    resp = {'result': [result]}
+    resp = _rpc_resp(req, resp)
+    if validators is not None:
+        resp.headers.update(validators)
+    return resp
+
+
+# Read-only methods whose result is fixed by their params and `ts`
+_CONDITIONAL_METHODS = {
+    'taxonomy_re_api.get_taxon',
+    'taxonomy_re_api.get_taxa',
+    'taxonomy_re_api.get_lineage',
+    'taxonomy_re_api.get_children',
+    'taxonomy_re_api.get_siblings',
+    'taxonomy_re_api.search_taxa',
+    'taxonomy_re_api.search_species',
+}
+
+
+def _http_validators(call):
+    """
+    ETag and Cache-Control headers for a call to a read-only method, or None for other calls
+    and for calls whose params are invalid (which then fail when they run).
+    A missing (or null) `ts` is resolved here, so that the tag is known before the method runs.
+    Responses are cacheable by anyone when the request pins a `ts` in the past (or has a cursor, which does),
+    and for a short time when it asks for the current data.
+    """
+    method = call.get('method')
+    params = call.get('params')
+    if method not in _CONDITIONAL_METHODS or not isinstance(params, list) or len(params) != 1:
+        return None
+    param = params[0]
+    if not isinstance(param, dict) or param.get('stream'):
+        return None
+    if not _VALIDATORS[method.split('.', 1)[1]].is_valid(param):
+        return None
+    pinned = param.get('ts') is not None or 'cursor' in param
+    if not pinned:
+        param['ts'] = default_ts()
+    ts = param.get('ts', 0)
+    if pinned and isinstance(ts, int) and ts <= time.time() * 1000:
+        cache_control = f"public, max-age={_CONF['http_cache_max_age']}"
+    elif not pinned and _CONF['http_cache_current_max_age'] > 0:
+        cache_control = f"public, max-age={_CONF['http_cache_current_max_age']}"
+    else:
+        cache_control = 'no-cache'
+    return {'ETag': etag(method, param), 'Cache-Control': cache_control}
+
+
+def _query_int(value):
+    """Parse an integer query parameter, which must fit in 64 bits to be encoded as JSON."""
+    number = int(value)
+    if not -2 ** 63 <= number < 2 ** 63:
+        raise ValueError(value)
+    return number
+
+
+# Query string parameters of the GET routes, with functions parsing their values
+_QUERY_PARAMS = {
+    'ts': _query_int,
+    'limit': _query_int,
+    'offset': _query_int,
+    'select': lambda value: sorted(set(value.split(','))),
+    'cursor': str,
+    'search_text': str,
+}
+
+
+@app.route('/ns/<ns>/taxon/<taxon_id>', methods=["GET"])
+async def handle_get_taxon(req, ns, taxon_id):
+    """REST-style get_taxon, cacheable by HTTP caches."""
+    return await _handle_get(req, 'get_taxon', {'ns': ns, 'id': taxon_id})
+
+
+@app.route('/ns/<ns>/taxon/<taxon_id>/<relation>', methods=["GET"])
+async def handle_get_related(req, ns, taxon_id, relation):
+    """REST-style get_lineage, get_children and get_siblings, cacheable by HTTP caches."""
+    if relation not in ('lineage', 'children', 'siblings'):
+        raise sanic.exceptions.NotFound(f'Requested URL {req.path} not found')
+    return await _handle_get(req, 'get_' + relation, {'ns': ns, 'id': taxon_id})
+
+
+async def _handle_get(req, method, param):
+    """
+    Run a read-only method with params from the path and query string, and respond with its result.
+    Requests are redirected to a canonical query string (sorted, with `select` sorted and joined by commas),
+    so that caches keep one copy of each result.
+    """
+    query = _parse_query(req.query_string)
+    canonical = '&'.join(f"{key}={quote(','.join(val) if key == 'select' else str(val), safe=',')}"
+                         for (key, val) in sorted(query.items()))
+    if req.query_string != canonical:
+        return sanic.response.redirect(req.path + ('?' + canonical if canonical else ''), status=301)
+    call = {'version': '1.1', 'method': 'taxonomy_re_api.' + method, 'params': [{**param, **query}]}
+    req.ctx.rpc_method = call['method']
+    validators = _http_validators(call)
+    if validators is not None and etag_matches(req.headers.get('If-None-Match'), validators['ETag']):
+        return sanic.response.raw(b'', status=304, headers=validators)
+    result = await _run_call(call, req.headers)
+    return sanic.response.raw(codec.dumps(result), content_type='application/json', headers=validators)
+
+
+def _parse_query(query_string):
+    query = {}
+    for (key, value) in parse_qsl(query_string, keep_blank_values=True):
+        if key not in _QUERY_PARAMS:
+            raise InvalidParams(f'Unknown query parameter "{key}"')
+        if key in query:
+            raise InvalidParams(f'Query parameter "{key}" is repeated')
+        try:
+            query[key] = _QUERY_PARAMS[key](value)
+        except ValueError:
+            raise InvalidParams(f'Query parameter "{key}" should be a 64-bit integer')
+    return query
+
+
+async def _handle_batch(calls, headers):
+    """
+    Run an array of JSON RPC 1.1 calls concurrently.
+    Errors are reported per call, so the batch itself always succeeds.
+    """
+    if len(calls) > _CONF['max_batch_size']:
+        raise InvalidRequest(f"Batch can include at most {_CONF['max_batch_size']} calls, it has {len(calls)}")
+    resps = await asyncio.gather(*[_run_batch_call(call, headers) for call in calls])
+    return _json_resp(resps)
+
+
+async def _run_batch_call(call, headers):
+    try:
+        result = await _run_call(call, headers)
+        if isinstance(result, StreamedResult):
+            result = await result.collect()
+        resp = {'result': [result]}
+    except Exception as err:
+        (resp, status) = _error_resp(err)
+        if status == 500:
+            traceback.print_exc()
+    resp['version'] = '1.1'
+    if isinstance(call, dict) and 'id' in call:
+        resp['id'] = call['id']
+    return resp
+
+
+def _method_label(call):
+    """Name of the method of a call for metrics, without letting unknown names add new series."""
+    method = call.get('method') if isinstance(call, dict) else None
+    return method if method in _HANDLERS else 'unknown'
+
+
+async def _run_call(body, headers):
+    """Run a single JSON RPC 1.1 call, recording its metrics."""
+    method = _method_label(body)
+    metrics.REQUESTS.labels(method).inc()
+    try:
+        with metrics.LATENCY.labels(method).time():
+            return await _run_with_deadline(body, headers)
+    except Exception as err:
+        metrics.ERRORS.labels(method, _error_handler(err).__name__.strip('_')).inc()
+        raise
+
+
+async def _run_with_deadline(body, headers):
+    """
+    Run a call, cancelling it (and any RE queries it is waiting on) once its timeout passes.
+    The timeout, in milliseconds, is the `timeout_ms` field of the call or the X-Timeout-Ms header.
+    """
+    timeout_ms = body.get('timeout_ms') if isinstance(body, dict) else None
+    if timeout_ms is None:
+        timeout_ms = headers.get('X-Timeout-Ms')
+    if timeout_ms is None:
+        timeout_ms = _CONF['request_timeout_ms']
+    try:
+        timeout_ms = int(timeout_ms)
+    except (TypeError, ValueError):
+        raise InvalidRequest(f'Timeout should be an integer number of milliseconds, it is "{timeout_ms}"')
+    if timeout_ms <= 0:
+        raise InvalidRequest('Timeout should be a positive number of milliseconds')
+    timeout = min(timeout_ms, _CONF['max_request_timeout_ms']) / 1000
+    # Cancelling the call stops its wait on RE queries; a query shared with other calls keeps running for them
+    try:
+        return await asyncio.wait_for(_call_method(body, headers), timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f'The call did not finish within its timeout of {round(timeout * 1000)}ms')
+
+
+async def _call_method(body, headers):
+    """Validate a single JSON RPC 1.1 call and return the result of its method."""
 
     # Validate  JSON-RPC 1.1 overall structure
 
@@ -373,14 +960,91 @@ async def handle_rpc(req):
         raise InvalidParams(f"Method params array can only include at most one item, it has {len(params)}")
 
     # Run the method
-    if method not in handlers:
+    if method not in _HANDLERS:
         raise MethodNotFound(method)
 
-    meth = handlers[method]
+    meth = _HANDLERS[method]
+
+    return await meth(param, headers)
+
+
+@app.listener('after_server_start')
+async def refresh_data_sources(app, loop):
+    """Keep the worker's copy of the data sources fresh, so requests never wait for it."""
+    _DATA_SOURCES.start()
 
-    result = meth(param, req.headers)
-    resp = {'result': [result]}
-    return _rpc_resp(req, resp)
+
+@app.listener('after_server_start')
+async def probe_re_replicas(app, loop):
+    """Check the health of the RE replicas in the background, when there are several."""
+    re_api.start_probing()
+
+
+@app.listener('before_server_stop')
+async def stop_data_sources(app, loop):
+    await _DATA_SOURCES.stop()
+
+
+@app.listener('before_server_stop')
+async def stop_probing_re_replicas(app, loop):
+    await re_api.stop_probing()
+
+
+@app.listener('after_server_stop')
+async def close_re_client(app, loop):
+    """Release the worker's RE connection pool."""
+    await re_api.close()
+    metrics.worker_stopped()
+
+
+@app.route('/metrics', methods=["GET"])
+async def handle_metrics(req):
+    """Prometheus metrics, aggregated over all the server workers."""
+    (body, content_type) = metrics.render()
+    return sanic.response.raw(body, content_type=content_type)
+
+
+# Response middleware runs in the reverse order it is added, so this runs after the others
+@app.middleware('response')
+async def compress_response(req, res):
+    """Compress large response bodies in an encoding that the client accepts."""
+    if not isinstance(res, sanic.response.HTTPResponse) or 'Content-Encoding' in res.headers:
+        return
+    if not res.body or len(res.body) < _CONF['compress_min_size']:
+        return
+    res.headers['Vary'] = 'Accept-Encoding'
+    encoding = choose_encoding(req.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return
+    level = _CONF['compress_levels'].get(getattr(req.ctx, 'rpc_method', None))
+    if len(res.body) >= _CONF['compress_offload_size']:
+        loop = asyncio.get_event_loop()
+        res.body = await loop.run_in_executor(None, compress, res.body, encoding, level)
+    else:
+        res.body = compress(res.body, encoding, level)
+    res.headers['Content-Encoding'] = encoding
+
+
+@app.middleware('request')
+async def start_timer(req):
+    req.ctx.received = time.time()
+
+
+@app.middleware('response')
+async def log_traffic(req, res):
+    """Append JSON RPC calls to the traffic log, when it is enabled."""
+    # Only bodies that were parsed as JSON
+    if _TRAFFIC is not None and getattr(req.ctx, 'rpc_body', None) is not None:
+        duration = time.time() - req.ctx.received
+        _TRAFFIC.record(req.body, req.headers.get('Authorization'), req.ctx.received, duration, res.status)
+
+
+@app.middleware('response')
+async def observe_response(req, res):
+    """Record the size of JSON RPC responses that have a body. Streamed bodies are counted as they are written."""
+    method = getattr(req.ctx, 'rpc_method', None)
+    if method is not None and isinstance(res, sanic.response.HTTPResponse):
+        metrics.RESPONSE_SIZE.labels(method).observe(len(res.body))
 
 
 @app.middleware('response')
@@ -391,8 +1055,10 @@ async def cors_resp(req, res):
     res.headers['Access-Control-Allow-Headers'] = '*'
 
 
-@app.exception(sanic.exceptions.NotFound)
-async def page_not_found(req, err):
+# Error responses
+# Each function takes an exception and returns a pair of (JSON RPC response, HTTP status)
+
+def _page_not_found(err):
     """Handle 404 as a json response."""
     resp = {
         'error': {
@@ -401,11 +1067,10 @@ async def page_not_found(req, err):
             'message': 'Not found - ' + str(err),
         }
     }
-    return _rpc_resp(req, resp, status=404)
+    return (resp, 404)
 
 
-@app.exception(ValidationError)
-async def invalid_schema(req, err):
+def _invalid_schema(err):
     """Handle a JSON Schema validation error."""
     error = {
         'message': 'Parameter validation error: ' + err.message,
@@ -421,11 +1086,10 @@ async def invalid_schema(req, err):
             'error': error
         }
     }
-    return _rpc_resp(req, resp, status=400)
+    return (resp, 400)
 
 
-@app.exception(REError)
-async def re_api_error(req, err):
+def _re_api_error(err):
     resp = {
         'error': {
             'name': 'JSONRPCError',
@@ -437,11 +1101,10 @@ async def re_api_error(req, err):
             }
         }
     }
-    return _rpc_resp(req, resp, status=400)
+    return (resp, 400)
 
 
-@app.exception(sanic.exceptions.InvalidUsage)
-async def invalid_usage(req, err):
+def _invalid_usage(err):
     resp = {
         'error': {
             'name': 'JSONRPCError',
@@ -453,74 +1116,84 @@ async def invalid_usage(req, err):
 
         }
     }
-    return _rpc_resp(req, resp, status=400)
+    return (resp, 400)
 
 
-@app.exception(sanic.exceptions.MethodNotSupported)
-async def method_not_supported(req, err):
+def _invalid_request(err):
     resp = {
         'error': {
             'name': 'JSONRPCError',
-            'code': InvalidRequest.code,
+            'code': err.code,
             'message': 'Invalid request',
             'error': {
-                'message': str(err),
+                'message': str(err)
             }
         }
     }
-    return _rpc_resp(req, resp, status=400)
+    return (resp, 400)
 
 
-@app.exception(InvalidRequest)
-async def invalid_request(req, err):
+def _method_not_found(err):
     resp = {
         'error': {
             'name': 'JSONRPCError',
             'code': err.code,
-            'message': 'Invalid request',
+            'message': 'Method not found',
             'error': {
-                'message': str(err)
+                'message': f'Method "{err.method_name}" not found',
+                'method': err.method_name
             }
         }
     }
-    return _rpc_resp(req, resp, status=400)
+    return (resp, 400)
 
 
-@app.exception(MethodNotFound)
-async def method_not_found(req, err):
+def _invalid_params(err):
     resp = {
         'error': {
             'name': 'JSONRPCError',
             'code': err.code,
-            'message': 'Method not found',
+            'message': 'Invalid params',
             'error': {
-                'message': f'Method "{err.method_name}" not found',
-                'method': err.method_name
+                'message': str(err),
             }
         }
     }
-    return _rpc_resp(req, resp, status=400)
+    return (resp, 400)
 
 
-@app.exception(InvalidParams)
-async def invalid_params(req, err):
+def _deadline_exceeded(err):
     resp = {
         'error': {
             'name': 'JSONRPCError',
             'code': err.code,
-            'message': 'Invalid params',
+            'message': 'Deadline exceeded',
+            'error': {
+                'message': str(err),
+            }
+        }
+    }
+    return (resp, 504)
+
+
+def _overloaded(err):
+    """A call rejected by the RE concurrency limiter; the client may retry after `retry_after` seconds."""
+    resp = {
+        'error': {
+            'name': 'JSONRPCError',
+            'code': err.code,
+            'message': 'Server error',
             'error': {
                 'message': str(err),
+                'retry_after': err.retry_after,
             }
         }
     }
-    return _rpc_resp(req, resp, status=400)
+    return (resp, 503)
 
 
 # Any other exception -> 500
-@app.exception(Exception)
-async def server_error(req, err):
-    traceback.print_exc()
+def _server_error(err):
     resp = {
         'error': {
             'name': 'JSONRPCError',
@@ -532,7 +1205,48 @@ async def server_error(req, err):
             }
         }
     }
-    return _rpc_resp(req, resp, status=500)
+    return (resp, 500)
+
+
+# The first matching exception class is used, so keep `Exception` last
+_ERRORS = [
+    (sanic.exceptions.NotFound, _page_not_found),
+    (ValidationError, _invalid_schema),
+    (REError, _re_api_error),
+    (sanic.exceptions.InvalidUsage, _invalid_usage),
+    (sanic.exceptions.MethodNotSupported, _invalid_usage),
+    (InvalidRequest, _invalid_request),
+    (MethodNotFound, _method_not_found),
+    (InvalidParams, _invalid_params),
+    (Overloaded, _overloaded),
+    (DeadlineExceeded, _deadline_exceeded),
+    (Exception, _server_error),
+]
+
+
+def _error_handler(err):
+    """Get the function building the error response for an exception."""
+    for (exc_class, make_resp) in _ERRORS:
+        if isinstance(err, exc_class):
+            return make_resp
+
+
+def _error_resp(err):
+    """Get the JSON RPC error response and HTTP status for an exception."""
+    return _error_handler(err)(err)
+
+
+@app.exception(Exception)
+async def handle_error(req, err):
+    """Render any exception as a JSON RPC error response."""
+    (resp, status) = _error_resp(err)
+    if status == 500:
+        traceback.print_exc()
+    res = _rpc_resp(req, resp, status=status)
+    if isinstance(err, Overloaded):
+        res.headers['Retry-After'] = str(err.retry_after)
+    return res
+
 
 if __name__ == '__main__':
     app.run(
@@ -0,0 +1,52 @@
+"""
+Shared fixtures for the unit tests.
+"""
+import json
+import asyncio
+import pytest
+
+from src.server import main
+from src.utils import re_api
+
+
+class FakeRE:
+    """Stand-in for `re_api.query` that records calls and returns canned results."""
+
+    def __init__(self, results=None, delay=0):
+        self.calls = []
+        self.results = results or {}
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def query(self, name, params, tok=None, **kwargs):
+        self.calls.append((name, dict(params), tok))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            result = self.results.get(name, {'results': [], 'stats': {}})
+            if callable(result):
+                result = result(params)
+            return json.loads(json.dumps(result))
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def fake_re(monkeypatch):
+    fake = FakeRE()
+    monkeypatch.setattr(re_api, 'query', fake.query)
+    return fake
+
+
+def _rpc(body, headers=None):
+    _, resp = main.app.test_client.post('/', data=json.dumps(body), headers=headers)
+    return resp
+
+
+@pytest.fixture
+def rpc():
+    """Function posting a JSON-RPC body to the app and returning the response."""
+    return _rpc
@@ -0,0 +1,70 @@
+"""
+Tests for the load benchmark helpers and the fake RE API.
+"""
+from src.benchmark import load, fake_re
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert load.percentile(values, 50) == 50
+    assert load.percentile(values, 99) == 99
+    assert load.percentile([7], 95) == 7
+    assert load.percentile([], 50) is None
+
+
+def test_compare():
+    baseline = {'get_taxon': {'p95_ms': 10, 'throughput': 100, 'rss_mib': 50}}
+    ok = {'get_taxon': {'p95_ms': 12, 'throughput': 80, 'rss_mib': 60}, 'get_lineage': {'p95_ms': 99}}
+    assert load.compare(ok, baseline, 0.25) == []
+    slow = {'get_taxon': {'p95_ms': 13, 'throughput': 70, 'rss_mib': 50}}
+    regressions = load.compare(slow, baseline, 0.25)
+    assert len(regressions) == 2
+    assert regressions[0].startswith('get_taxon: p95_ms 13.0')
+    # Any failed call is a regression, even for methods missing from the baseline
+    failing = {'get_taxon': {'p95_ms': 10, 'throughput': 100, 'rss_mib': 50, 'errors': 3}, 'get_lineage': {'errors': 1}}
+    assert load.compare(failing, baseline, 0.25) == [
+        'get_taxon: 3 errors, the baseline had 0',
+        'get_lineage: 1 errors, the baseline had 0',
+    ]
+    assert load.compare(failing, {'get_taxon': {'errors': 3}}, 0.25) == ['get_lineage: 1 errors, the baseline had 0']
+
+
+def test_settings_diff():
+    settings = {'duration': 10, 'concurrency': 20, 'workers': 1, 'latency_ms': 5, 'jitter_ms': 0, 'result_size': 20}
+    assert load.settings_diff(settings, dict(settings, duration=10.0)) == []
+    assert load.settings_diff(dict(settings, concurrency=4), settings) == ['concurrency is 4, the baseline used 20']
+    # A baseline without settings can't be compared to
+    assert len(load.settings_diff(settings, {})) == len(settings)
+
+
+def test_baseline_settings(tmp_path, monkeypatch):
+    runs = []
+
+    async def run(args):
+        runs.append(args)
+        return {}
+
+    monkeypatch.setattr(load, 'run', run)
+    assert load.main(['--baseline', 'src/benchmark/baseline.json', '--concurrency', '4', '--duration', '1']) == 2
+    assert runs == []
+    # The stored baseline was taken with the default options
+    assert load.main(['--baseline', 'src/benchmark/baseline.json']) == 0
+    path = str(tmp_path / 'baseline.json')
+    assert load.main(['--duration', '1', '--save-baseline', path]) == 0
+    assert load.main(['--duration', '1', '--baseline', path]) == 0
+    assert len(runs) == 3
+
+
+def test_fake_results():
+    for name in ['taxonomy_get_children', 'taxonomy_get_associated_ws_objects']:
+        (res,) = fake_re.fake_results(name, {'offset': 15, 'limit': 10}, 20)
+        assert res['total_count'] == 20
+        assert len(res['results']) == 5
+    taxa = fake_re.fake_results('taxonomy_fetch_taxa', {'ids': ['1', '2'], 'sciname_field': 'name'}, 20)
+    assert [(t['id'], t['name']) for t in taxa] == [('1', 'Escherichia coli 1'), ('2', 'Escherichia coli 2')]
+    docs = fake_re.fake_results('taxonomy_get_taxa_from_ws_objs', {'obj_refs': ['1:2:3', '4:5:6']}, 20)
+    assert [doc['obj_ref'] for doc in docs] == ['1:2:3', '4:5:6']
+    assert all(doc['taxon']['id'] for doc in docs)
+    assert fake_re.fake_results('taxonomy_get_parent', {'id': '562'}, 20)[0]['id'] == '19'
+    assert fake_re.fake_results('taxonomy_get_parent', {'id': '0'}, 20) == []
+    assert fake_re.fake_results('nope', {}, 20) is None
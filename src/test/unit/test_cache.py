@@ -0,0 +1,117 @@
+import json
+import asyncio
+
+from src.utils import re_api
+from src.utils.cache import ResponseCache
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_bytes=10, ttl=60)
+    cache.set('a', '1234')
+    cache.set('b', '1234')
+    assert cache.get('a') == '1234'
+    # 'b' is now the least recently used entry
+    cache.set('c', '1234')
+    assert cache.get('b') is None
+    assert cache.get('a') == '1234'
+    assert cache.get('c') == '1234'
+    stats = cache.stats()
+    assert stats['entries'] == 2
+    assert stats['size'] == 8
+    assert stats['evictions'] == 1
+    assert stats['hits'] == 3
+    assert stats['misses'] == 1
+
+
+def test_too_large_value():
+    cache = ResponseCache(max_bytes=3, ttl=60)
+    cache.set('a', '1234')
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_ttl():
+    cache = ResponseCache(max_bytes=100, ttl=0)
+    cache.set('a', '1')
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_query_cache(monkeypatch):
+    calls = []
+
+    async def post(name, params, tok, timeout, hedge=False):
+        calls.append(name)
+        return json.dumps({'results': [{'id': '1'}]})
+
+    monkeypatch.setattr(re_api, '_post', post)
+    monkeypatch.setattr(re_api, 'CACHE', ResponseCache(max_bytes=1000, ttl=60))
+
+    async def run():
+        first = await re_api.query('q', {'id': '1', 'ts': 1}, cache=True)
+        first['results'][0]['ns'] = 'changed'
+        second = await re_api.query('q', {'ts': 1, 'id': '1'}, cache=True)
+        other_tok = await re_api.query('q', {'ts': 1, 'id': '1'}, tok='x', cache=True)
+        uncached = await re_api.query('q', {'ts': 1, 'id': '1'})
+        return (second, other_tok, uncached)
+
+    (second, other_tok, uncached) = asyncio.run(run())
+    # Cached results are copies, so mutating a result does not change the cache
+    assert second == {'results': [{'id': '1'}]}
+    assert other_tok == uncached == second
+    # The second query was a hit; a different token and an uncached call both went to RE
+    assert calls == ['q', 'q', 'q']
+    assert re_api.CACHE.stats()['hits'] == 1
+
+
+def test_auth_cache(monkeypatch):
+    calls = []
+
+    async def post(name, params, tok, timeout, hedge=False):
+        calls.append(tok)
+        return json.dumps({'results': [{'tok': tok}]})
+
+    monkeypatch.setattr(re_api, '_post', post)
+    monkeypatch.setattr(re_api, 'CACHE', None)
+    monkeypatch.setattr(re_api, 'AUTH_CACHE', ResponseCache(max_bytes=1000, ttl=60))
+
+    async def run():
+        return [
+            await re_api.query('q', {'id': '1'}, tok=tok, auth_cache=True)
+            for tok in ['alice', 'bob', 'alice', None, None, 'bob']
+        ]
+
+    results = asyncio.run(run())
+    # Each token only ever gets its own results
+    assert [result['results'][0]['tok'] for result in results] == ['alice', 'bob', 'alice', None, None, 'bob']
+    assert calls == ['alice', 'bob', None]
+    # Raw tokens are never kept in the cache keys
+    assert all('alice' not in str(key) for key in re_api.AUTH_CACHE._entries)
+
+
+def test_associated_ws_objects_cache(fake_re, rpc, monkeypatch):
+    from src.server import main
+
+    monkeypatch.setattr(re_api, 'AUTH_CACHE', ResponseCache(max_bytes=1000, ttl=60))
+    fake_re.results['taxonomy_get_associated_ws_objects'] = {
+        'results': [{'total_count': 1, 'results': [
+            {'ws_obj': {'name': 'x', 'ws_info': {'metadata': {'narrative_nice_Name': 'N', 'other': 1}}}},
+            {'ws_obj': {'name': 'y', 'ws_info': {'metadata': None}}},
+        ]}],
+        'stats': {},
+    }
+    body = {
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_associated_ws_objects',
+        'params': [{'id': '1', 'ns': 'ncbi_taxonomy'}],
+    }
+    resp = rpc(body, headers={'Authorization': 'alice'})
+    assert resp.status_code == 200, resp.json
+    assert [res['ws_obj'] for res in resp.json['result'][0]['results']] == [
+        {'name': 'x', 'workspace': {'refdata_source': None, 'narr_name': 'N'}},
+        {'name': 'y', 'workspace': {'refdata_source': None, 'narr_name': None}},
+    ]
+    # Requests without a ts get a bucketed one, so that they share the cache
+    [(_, params, tok)] = fake_re.calls
+    assert params['ts'] % main._CONF['cache_ts_bucket_ms'] == 0
+    assert tok == 'alice'
@@ -0,0 +1,31 @@
+"""
+Tests for the pluggable JSON codec.
+"""
+import pytest
+
+from src.server import main
+from src.utils import codec
+
+
+@pytest.mark.parametrize('load', [codec._load_stdlib, codec._load_orjson])
+def test_codec_roundtrip(load):
+    (_, loads, dumps) = load()
+    doc = {'b': [1, 2.5, None, True], 'a': 'é'}
+    body = dumps(doc)
+    assert isinstance(body, bytes)
+    assert loads(body) == doc
+    assert loads(body.decode()) == doc
+    assert dumps(doc, sort_keys=True) == b'{"a":"\xc3\xa9","b":[1,2.5,null,true]}'
+    with pytest.raises(ValueError):
+        loads(b'{"a":')
+
+
+@pytest.mark.parametrize('load', [codec._load_stdlib, codec._load_orjson])
+def test_huge_ts(load):
+    # orjson decodes integers beyond 64 bits as floats, which pass an "integer" schema,
+    # so the schemas bound `ts` to keep both codecs rejecting them
+    (_, loads, _) = load()
+    params = loads(b'{"id": "1", "ns": "gtdb", "ts": 99999999999999999999999}')
+    assert not main._VALIDATORS['get_taxon'].is_valid(params)
+    params = loads(b'{"id": "1", "ns": "gtdb", "ts": 9007199254740991}')
+    assert main._VALIDATORS['get_taxon'].is_valid(params)
@@ -0,0 +1,60 @@
+"""
+Tests for negotiated response compression.
+"""
+import gzip
+import brotli
+import pytest
+
+from src.server import main
+from src.utils.compression import choose_encoding, compress
+
+
+def test_choose_encoding():
+    assert choose_encoding('gzip, deflate, br') == 'br'
+    assert choose_encoding('gzip;q=1.0, br;q=0.5') == 'gzip'
+    assert choose_encoding('br;q=0, gzip') == 'gzip'
+    assert choose_encoding('*') == 'br'
+    assert choose_encoding('*;q=0, gzip') == 'gzip'
+    assert choose_encoding('identity') is None
+    assert choose_encoding('') is None
+    assert choose_encoding(None) is None
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br'])
+def test_compress(encoding):
+    body = b'{"results":[' + b','.join(b'{"id":"%d","rank":"species"}' % i for i in range(1000)) + b']}'
+    data = compress(body, encoding)
+    assert len(data) < len(body) / 5
+    # No timestamp, so the output is deterministic
+    assert compress(body, encoding) == data
+    decompress = gzip.decompress if encoding == 'gzip' else brotli.decompress
+    assert decompress(data) == body
+    assert decompress(compress(body, encoding, level=1)) == body
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br'])
+@pytest.mark.parametrize('offload_size', [0, 1 << 30])
+def test_compressed_response(fake_re, monkeypatch, rpc, encoding, offload_size):
+    monkeypatch.setitem(main._CONF, 'compress_offload_size', offload_size)
+    monkeypatch.setitem(main._CONF, 'compress_levels', {'taxonomy_re_api.get_children': 1})
+    docs = [{'id': str(i), 'scientific_name': f'Taxon {i}', 'rank': 'species'} for i in range(1000)]
+    fake_re.results['taxonomy_get_children'] = {'results': [{'total_count': 1000, 'results': docs}], 'stats': {}}
+    call = {
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_children',
+        'params': [{'id': '1', 'ns': 'ncbi_taxonomy', 'ts': 1, 'limit': 1000}],
+    }
+    raw = rpc(call, headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in raw.headers
+    assert raw.headers['Vary'] == 'Accept-Encoding'
+    resp = rpc(call, headers={'Accept-Encoding': encoding})
+    assert resp.headers['Content-Encoding'] == encoding
+    assert int(resp.headers['Content-Length']) < len(raw.body) / 5
+    # The client decodes the body
+    assert resp.body == raw.body
+
+
+def test_small_response(fake_re, rpc):
+    resp = rpc({'version': '1.1', 'method': 'taxonomy_re_api.get_data_sources', 'params': []},
+               headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in resp.headers
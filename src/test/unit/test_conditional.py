@@ -0,0 +1,109 @@
+"""
+Tests for ETags and conditional requests.
+"""
+from src.server import main
+from src.utils.conditional import etag, etag_matches
+
+
+def test_etag():
+    tag = etag('m', {'id': '1', 'ts': 5})
+    assert tag.startswith('W/"')
+    assert etag('m', {'ts': 5, 'id': '1'}) == tag
+    assert etag('m', {'id': '1', 'ts': 6}) != tag
+    assert etag('other', {'id': '1', 'ts': 5}) != tag
+    assert etag_matches(tag, tag)
+    assert etag_matches('"x", ' + tag[2:], tag)
+    assert etag_matches('*', tag)
+    assert not etag_matches('*', tag, any_tag=False)
+    assert not etag_matches('"x"', tag)
+    assert not etag_matches(None, tag)
+
+
+def test_not_modified(fake_re, rpc):
+    fake_re.results['taxonomy_get_lineage'] = {'results': [{'id': '1'}], 'stats': {}}
+    call = {
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_lineage',
+        'params': [{'id': '562', 'ns': 'ncbi_taxonomy', 'ts': 1000}],
+    }
+    resp = rpc(call)
+    tag = resp.headers['ETag']
+    assert resp.headers['Cache-Control'].startswith('public, max-age=')
+    resp = rpc(call, headers={'If-None-Match': tag})
+    assert resp.status_code == 304
+    assert resp.body == b''
+    assert resp.headers['ETag'] == tag
+    assert len(fake_re.calls) == 1
+    # A different ts is a different result
+    call['params'][0]['ts'] = 2000
+    resp = rpc(call, headers={'If-None-Match': tag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != tag
+
+
+def test_unpinned_ts(fake_re, monkeypatch, rpc):
+    monkeypatch.setitem(main._CONF, 'http_cache_current_max_age', 0)
+    resp = rpc({
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_taxon',
+        'params': [{'id': '562', 'ns': 'ncbi_taxonomy'}],
+    })
+    assert resp.headers['Cache-Control'] == 'no-cache'
+    # The tag is made with the ts that the method used
+    ts = resp.json['result'][0]['ts']
+    assert resp.headers['ETag'] == etag('taxonomy_re_api.get_taxon', {'id': '562', 'ns': 'ncbi_taxonomy', 'ts': ts})
+
+
+def test_no_etag(fake_re, rpc):
+    resp = rpc({'version': '1.1', 'method': 'taxonomy_re_api.get_taxon', 'params': [{'ns': 'ncbi_taxonomy'}]})
+    assert resp.status_code == 400
+    assert 'ETag' not in resp.headers
+    fake_re.results['taxonomy_get_associated_ws_objects'] = {
+        'results': [{'total_count': 0, 'results': []}],
+        'stats': {},
+    }
+    resp = rpc({
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_associated_ws_objects',
+        'params': [{'id': '562', 'ns': 'ncbi_taxonomy', 'ts': 1}],
+    })
+    assert resp.status_code == 200
+    assert 'ETag' not in resp.headers
+
+
+def test_not_modified_checks(fake_re, rpc):
+    # Invalid params are reported, whatever the validators say
+    resp = rpc({
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_taxon',
+        'params': [{'id': '562', 'ns': 'bogus', 'ts': 1}],
+    }, headers={'If-None-Match': '*'})
+    assert resp.status_code == 400
+    _, resp = main.app.test_client.get('/ns/bogus/taxon/562?ts=1', headers={'If-None-Match': '*'})
+    assert resp.status_code == 400
+    # "*" is not honoured for calls
+    call = {
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_taxon',
+        'params': [{'id': '562', 'ns': 'ncbi_taxonomy', 'ts': 1}],
+    }
+    assert rpc(call, headers={'If-None-Match': '*'}).status_code == 200
+
+
+def test_null_ts(fake_re, monkeypatch, rpc):
+    ts = [1000]
+    monkeypatch.setattr(main, 'default_ts', lambda: ts[0])
+    call = {
+        'version': '1.1',
+        'method': 'taxonomy_re_api.search_species',
+        'params': [{'search_text': 'escherichia', 'ns': 'ncbi_taxonomy', 'ts': None}],
+    }
+    resp = rpc(call)
+    tag = resp.headers['ETag']
+    assert resp.headers['Cache-Control'] == f"public, max-age={main._CONF['http_cache_current_max_age']}"
+    # A null ts is the current data, so the tag changes with it
+    ts[0] = 2000
+    call['params'][0]['ts'] = None
+    resp = rpc(call, headers={'If-None-Match': tag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != tag
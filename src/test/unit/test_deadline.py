@@ -0,0 +1,75 @@
+"""
+Tests for call deadlines.
+"""
+import time
+import asyncio
+
+from src.utils import re_api
+
+
+def test_deadline_exceeded(fake_re, rpc):
+    fake_re.delay = 1
+    start = time.monotonic()
+    resp = rpc({
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_taxon',
+        'params': [{'id': '562', 'ns': 'ncbi_taxonomy', 'ts': 1}],
+        'timeout_ms': 50,
+        'id': 7,
+    })
+    assert time.monotonic() - start < 0.5
+    assert resp.status_code == 504
+    assert resp.json['id'] == 7
+    assert resp.json['error']['code'] == -32001
+    # The RE query was cancelled
+    assert fake_re.in_flight == 0
+
+
+def test_deadline_header(fake_re, rpc):
+    fake_re.delay = 0.2
+    call = {
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_lineage',
+        'params': [{'id': '562', 'ns': 'ncbi_taxonomy', 'ts': 1}],
+    }
+    resp = rpc([call], headers={'X-Timeout-Ms': '20'})
+    assert resp.json[0]['error']['code'] == -32001
+    resp = rpc({**call, 'timeout_ms': 'soon'})
+    assert resp.status_code == 400
+    assert resp.json['error']['code'] == -32600
+
+
+def test_deadline_of_shared_query(monkeypatch):
+    """A short deadline doesn't cut short a coalesced query, nor count as an RE failure."""
+    import httpx
+    from src.utils.limiter import AdaptiveLimiter
+    from src.utils.replicas import ReplicaPool
+
+    timeouts = []
+
+    class Client:
+        async def post(self, url, **kwargs):
+            timeouts.append(kwargs.get('timeout'))
+            await asyncio.sleep(0.1)
+            return httpx.Response(200, content=b'{"results": [1]}', request=httpx.Request('POST', url))
+
+    limiter = AdaptiveLimiter(initial=20, min_limit=2, max_limit=100, slow_latency=2, max_queue=10, max_wait=1,
+                              max_failures=5, open_seconds=10)
+    pool = ReplicaPool(['http://re'], hedge_percentile=95, hedge_min_delay=0.01, hedge_budget=0.1, max_failures=3)
+    monkeypatch.setattr(re_api, '_get_client', lambda: Client())
+    monkeypatch.setattr(re_api, 'LIMITER', limiter)
+    monkeypatch.setattr(re_api, 'POOL', pool)
+
+    async def run():
+        return await asyncio.gather(
+            asyncio.wait_for(re_api.query('q', {}), 0.02),
+            re_api.query('q', {}),
+            return_exceptions=True,
+        )
+
+    (short, long) = asyncio.run(run())
+    assert isinstance(short, asyncio.TimeoutError)
+    assert long == {'results': [1]}
+    assert timeouts == [None]
+    assert limiter.failures == 0 and limiter.limit > 20
+    assert pool.replicas[0].failures == 0
@@ -0,0 +1,111 @@
+"""
+Tests for the adaptive RE concurrency limiter.
+"""
+import time
+import asyncio
+import pytest
+
+from src.server import main
+from src.utils import re_api
+from src.utils.limiter import AdaptiveLimiter
+from src.exceptions import Overloaded
+
+
+def _limiter(**kwargs):
+    params = dict(initial=2, min_limit=1, max_limit=10, slow_latency=0.05, max_queue=1, max_wait=1,
+                  max_failures=2, open_seconds=0.05)
+    return AdaptiveLimiter(**{**params, **kwargs})
+
+
+def _call(delay=0, error=None):
+    async def call():
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return delay
+    return call
+
+
+def _is_failure(err):
+    return isinstance(err, ConnectionError)
+
+
+def test_aimd():
+    async def run():
+        limiter = _limiter()
+        for _ in range(4):
+            await limiter.run(_call(), _is_failure)
+        assert 3 < limiter.limit < 4
+        limit = limiter.limit
+        # Slow calls that end together decrease the limit once
+        await asyncio.gather(limiter.run(_call(0.06), _is_failure), limiter.run(_call(0.06), _is_failure))
+        assert limiter.limit == pytest.approx(limit * 0.9)
+
+    asyncio.run(run())
+
+
+def test_queue():
+    async def run():
+        limiter = _limiter(initial=1)
+        results = await asyncio.gather(
+            limiter.run(_call(0.02), _is_failure),
+            limiter.run(_call(0.01), _is_failure),
+            limiter.run(_call(), _is_failure),
+            return_exceptions=True,
+        )
+        assert results[:2] == [0.02, 0.01]
+        assert isinstance(results[2], Overloaded)
+        assert limiter.stats()['rejected'] == 1
+        assert limiter.in_flight == 0
+
+        limiter = _limiter(initial=1, max_wait=0.01)
+        results = await asyncio.gather(
+            limiter.run(_call(0.03), _is_failure),
+            limiter.run(_call(), _is_failure),
+            return_exceptions=True,
+        )
+        assert isinstance(results[1], Overloaded)
+        assert limiter.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_circuit_breaker():
+    async def run():
+        limiter = _limiter()
+        # Errors that are not failures, such as bad queries, don't open the circuit
+        for error in [ValueError(), ConnectionError(), ConnectionError()]:
+            with pytest.raises(type(error)):
+                await limiter.run(_call(error=error), _is_failure)
+        assert limiter.stats()['circuit'] == 'open'
+        with pytest.raises(Overloaded):
+            await limiter.run(_call(), _is_failure)
+        await asyncio.sleep(0.06)
+        # A trial call that fails opens the circuit again
+        with pytest.raises(ConnectionError):
+            await limiter.run(_call(error=ConnectionError()), _is_failure)
+        with pytest.raises(Overloaded):
+            await limiter.run(_call(), _is_failure)
+        await asyncio.sleep(0.06)
+        assert await limiter.run(_call(), _is_failure) == 0
+        assert limiter.stats()['circuit'] == 'closed'
+
+    asyncio.run(run())
+
+
+def test_rejected_call(monkeypatch, rpc):
+    limiter = _limiter(open_seconds=30)
+    limiter.state = 'open'
+    limiter._opened_at = time.monotonic()
+    monkeypatch.setattr(re_api, 'LIMITER', limiter)
+    resp = rpc({
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_taxon',
+        'params': [{'id': '562', 'ns': 'ncbi_taxonomy', 'ts': 1}],
+    })
+    assert resp.status_code == 503
+    assert resp.headers['Retry-After'] == '30'
+    assert resp.json['error']['code'] == -32000
+    assert resp.json['error']['error']['retry_after'] == 30
+    _, resp = main.app.test_client.get('/')
+    assert resp.json['result'][0]['re_limiter']['rejected'] == 1
@@ -0,0 +1,137 @@
+import time
+
+from src.server import main
+from src.utils.lineage import LineageCache, LineageSnapshot, _MAX_TS
+
+# Tree of child ID to parent ID
+_PARENTS = {'1': None, '2': '1', '3': '2', '4': '3', '5': '3'}
+
+
+def test_snapshot():
+    snapshot = LineageSnapshot(valid_until=100)
+    assert snapshot.lineage_ids('4') is None
+    assert snapshot.first_unknown('4') == '4'
+    snapshot.add_parent('4', _doc('3', created=5))
+    snapshot.add_parent('3', _doc('2', expired=50))
+    assert snapshot.first_unknown('4') == '2'
+    snapshot.add_parent('2', _doc('1'))
+    snapshot.add_parent('1', None)
+    assert snapshot.first_unknown('4') is None
+    assert snapshot.lineage_ids('4') == ['1', '2', '3']
+    assert snapshot.lineage_ids('3') == ['1', '2']
+    assert snapshot.lineage_ids('1') == []
+    assert snapshot.lineage_ids('5') is None
+    # Only the range where every edge is active is covered, up to valid_until
+    assert (snapshot.start, snapshot.end) == (5, 50)
+    assert snapshot.covers(5) and snapshot.covers(50)
+    assert not snapshot.covers(4) and not snapshot.covers(51)
+    snapshot.add_docs([_doc('1', expired=_MAX_TS)])
+    snapshot.end = _MAX_TS
+    assert not snapshot.covers(101)
+
+
+def test_snapshot_eviction():
+    cache = LineageCache(max_snapshots=2, max_taxa=100, ttl=60)
+    first = cache.snapshot('gtdb', 1)
+    first.add_docs([_doc('1', created=0, expired=9)])
+    # Any ts of the same release gets the same snapshot
+    assert cache.snapshot('gtdb', 5) is first
+    second = cache.snapshot('gtdb', 10)
+    second.add_docs([_doc('1', created=10, expired=19)])
+    assert cache.snapshot('gtdb', 1) is first
+    cache.snapshot('gtdb', 20)
+    # The release from ts 10 was the least recently used
+    assert cache.stats()['snapshots'] == 2
+    assert cache.snapshot('gtdb', 1) is first
+    assert cache.snapshot('gtdb', 15) is not second
+    # Namespaces don't share snapshots, and the future is not cached
+    assert cache.snapshot('ncbi_taxonomy', 1) is not first
+    assert cache.snapshot('gtdb', int((time.time() + 120) * 1000)) is None
+
+
+def _doc(_id, created=0, expired=_MAX_TS, **fields):
+    return {'id': _id, 'created': created, 'expired': expired, **fields}
+
+
+def _fake_tree(fake_re):
+    fake_re.results['taxonomy_get_parent'] = lambda params: {
+        'results': [_doc(_PARENTS[params['id']])] if _PARENTS.get(params['id']) else [],
+        'stats': {},
+    }
+    fake_re.results['taxonomy_fetch_taxa'] = lambda params: {
+        'results': [_doc(_id, rank='r' + _id) for _id in params['ids']],
+        'stats': {},
+    }
+
+
+def _lineage_calls(fake_re):
+    return [(name, params.get('id') or params.get('ids')) for (name, params, _) in fake_re.calls]
+
+
+def test_get_lineage(fake_re, rpc, monkeypatch):
+    monkeypatch.setattr(main, '_LINEAGES', LineageCache(max_snapshots=2, max_taxa=100, ttl=60))
+    _fake_tree(fake_re)
+
+    def get_lineage(taxon_id, select=None, ts=10):
+        params = {'id': taxon_id, 'ns': 'ncbi_taxonomy', 'ts': ts}
+        if select:
+            params['select'] = select
+        resp = rpc({'version': '1.1', 'method': 'taxonomy_re_api.get_lineage', 'params': [params]})
+        assert resp.status_code == 200
+        return resp.json['result'][0]['results']
+
+    assert [{'id': r['id'], 'rank': r['rank'], 'ns': r['ns']} for r in get_lineage('4')] == [
+        {'id': '1', 'rank': 'r1', 'ns': 'ncbi_taxonomy'},
+        {'id': '2', 'rank': 'r2', 'ns': 'ncbi_taxonomy'},
+        {'id': '3', 'rank': 'r3', 'ns': 'ncbi_taxonomy'},
+    ]
+    # A miss walks up one edge at a time, then fetches the documents in one query
+    assert _lineage_calls(fake_re) == [
+        ('taxonomy_get_parent', '4'),
+        ('taxonomy_get_parent', '3'),
+        ('taxonomy_get_parent', '2'),
+        ('taxonomy_get_parent', '1'),
+        ('taxonomy_fetch_taxa', ['1', '2', '3']),
+    ]
+    fake_re.calls.clear()
+    # An ancestor's lineage is rebuilt locally, and so is a lineage at another ts of the same release
+    assert get_lineage('3', select=['rank'], ts=5000) == [
+        {'rank': 'r1', 'ns': 'ncbi_taxonomy'},
+        {'rank': 'r2', 'ns': 'ncbi_taxonomy'},
+    ]
+    assert fake_re.calls == []
+    # A new leaf only fetches its parent, which joins the cached chain, and no documents
+    assert [r['id'] for r in get_lineage('5')] == ['1', '2', '3']
+    assert _lineage_calls(fake_re) == [('taxonomy_get_parent', '5')]
+    # Roots and unknown taxa have no lineage, and are not cached
+    assert get_lineage('1') == []
+    assert get_lineage('nope') == []
+    assert main._LINEAGES.stats()['hits'] == 2
+    assert main._LINEAGES.stats()['snapshots'] == 1
+
+
+def test_get_lineage_releases(fake_re, rpc, monkeypatch):
+    """Lineages of another release get their own snapshot."""
+    monkeypatch.setattr(main, '_LINEAGES', LineageCache(max_snapshots=2, max_taxa=100, ttl=60))
+    # Taxon 2 is in the release from ts 0 to 99, and moved under 9 from ts 100
+    edges = {('2', 0): _doc('1', expired=99), ('2', 100): _doc('9', created=100), ('1', 0): None, ('9', 100): None}
+    fake_re.results['taxonomy_get_parent'] = lambda params: {
+        'results': [edge for edge in [edges.get((params['id'], 0 if params['ts'] < 100 else 100))] if edge],
+        'stats': {},
+    }
+    fake_re.results['taxonomy_fetch_taxa'] = lambda params: {
+        'results': [_doc(_id) for _id in params['ids']],
+        'stats': {},
+    }
+
+    def get_lineage(ts):
+        params = {'id': '2', 'ns': 'gtdb', 'ts': ts}
+        call = {'version': '1.1', 'method': 'taxonomy_re_api.get_lineage', 'params': [params]}
+        return [r['id'] for r in rpc(call).json['result'][0]['results']]
+
+    assert get_lineage(50) == ['1']
+    assert get_lineage(150) == ['9']
+    assert get_lineage(99) == ['1']
+    assert get_lineage(100) == ['9']
+    assert main._LINEAGES.stats()['snapshots'] == 2
+    assert main._LINEAGES.stats()['hits'] == 2
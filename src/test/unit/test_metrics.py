@@ -0,0 +1,81 @@
+"""
+Tests for the Prometheus metrics.
+"""
+import os
+import sys
+import asyncio
+import subprocess
+from prometheus_client import REGISTRY
+
+from src.server import main
+from src.utils import re_api
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_rpc_metrics(fake_re, rpc):
+    method = 'taxonomy_re_api.get_taxon'
+    before = {
+        'requests': _sample('taxonomy_rpc_requests_total', method=method),
+        'errors': _sample('taxonomy_rpc_errors_total', method=method, error='invalid_schema'),
+        'latency': _sample('taxonomy_rpc_duration_seconds_count', method=method),
+        'sizes': _sample('taxonomy_rpc_response_bytes_count', method=method),
+    }
+    rpc({'version': '1.1', 'method': method, 'params': [{'id': '562', 'ns': 'ncbi_taxonomy'}]})
+    rpc({'version': '1.1', 'method': method, 'params': [{'ns': 'ncbi_taxonomy'}]})
+    rpc({'version': '1.1', 'method': 'taxonomy_re_api.nope', 'params': []})
+    assert _sample('taxonomy_rpc_requests_total', method=method) == before['requests'] + 2
+    assert _sample('taxonomy_rpc_errors_total', method=method, error='invalid_schema') == before['errors'] + 1
+    assert _sample('taxonomy_rpc_duration_seconds_count', method=method) == before['latency'] + 2
+    # Error responses are measured too
+    assert _sample('taxonomy_rpc_response_bytes_count', method=method) == before['sizes'] + 2
+    assert _sample('taxonomy_rpc_errors_total', method='unknown', error='method_not_found') >= 1
+    assert _sample('taxonomy_rpc_in_flight') == 0
+
+    _, resp = main.app.test_client.get('/metrics')
+    assert resp.status_code == 200
+    assert 'taxonomy_rpc_requests_total{method="taxonomy_re_api.get_taxon"}' in resp.text
+    assert 'taxonomy_re_api.nope' not in resp.text
+
+
+def test_re_query_metrics(monkeypatch):
+    async def request(url_params, body, tok, timeout, replica=None):
+        if body['fail']:
+            raise RuntimeError('RE is down')
+        return b'{"results": [], "has_more": false}'
+
+    monkeypatch.setattr(re_api, '_request', request)
+    count = _sample('taxonomy_re_query_duration_seconds_count', query='test_query')
+    errors = _sample('taxonomy_re_query_errors_total', query='test_query')
+    asyncio.run(re_api.query('test_query', {'fail': False}))
+    try:
+        asyncio.run(re_api.query('test_query', {'fail': True}))
+    except RuntimeError:
+        pass
+    assert _sample('taxonomy_re_query_duration_seconds_count', query='test_query') == count + 2
+    assert _sample('taxonomy_re_query_errors_total', query='test_query') == errors + 1
+    assert _sample('taxonomy_re_queries_in_flight') == 0
+
+
+_WORKER = """
+from src.utils import metrics
+metrics.REQUESTS.labels('taxonomy_re_api.get_taxon').inc(3)
+metrics.IN_FLIGHT.inc()
+if {stop}:
+    metrics.worker_stopped()
+print(metrics.render()[0].decode())
+"""
+
+
+def test_multiprocess_aggregation(tmp_path):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    for stop in [False, True]:
+        subprocess.run([sys.executable, '-c', _WORKER.format(stop=stop)], env=env, check=True)
+    out = subprocess.run(
+        [sys.executable, '-c', _WORKER.format(stop=False)], env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    # Counters are summed over every worker; live gauges only over running ones
+    assert 'taxonomy_rpc_requests_total{method="taxonomy_re_api.get_taxon"} 9.0' in out
+    assert 'taxonomy_rpc_in_flight 2.0' in out
@@ -1,4 +1,4 @@
-from src.utils.search import clean_search_text
+from src.utils.search import clean_search_text, is_plain_prefix
 
 
 def test_validate_search_text():
@@ -14,3 +14,11 @@ def test_validate_search_text():
 
     for input, output in in_out:
         assert clean_search_text(input) == output
+
+
+def test_is_plain_prefix():
+    assert is_plain_prefix('Escherichia coli K-12')
+    assert not is_plain_prefix('rhodobacter,pseudomonas')
+    assert not is_plain_prefix('|rhodo')
+    assert not is_plain_prefix('-coli')
+    assert not is_plain_prefix('esch prefix:col')
@@ -0,0 +1,123 @@
+import pytest
+
+from src.exceptions import InvalidParams
+from src.server import main
+from src.utils.pagination import Page, encode_cursor
+from src.utils.snapshot import build_snapshot, load_snapshots
+
+_MAX_TS = 9007199254740991
+
+
+def _first_page_cursor(params, results, total_count=None):
+    page = Page('get_children', params)
+    params.setdefault('ts', 5)
+    return page.next_cursor(params, results, total_count)
+
+
+def test_cursor_round_trip():
+    cursor = _first_page_cursor({'id': '1', 'ns': 'gtdb', 'limit': 2}, [{'id': 'a'}, {'id': 'b'}], 10)
+    params = {'id': '1', 'ns': 'gtdb', 'limit': 5, 'cursor': cursor}
+    page = Page('get_children', params)
+    assert params == {'id': '1', 'ns': 'gtdb', 'limit': 5, 'ts': 5, 'offset': 2}
+    assert page.after == 'b'
+
+
+def test_last_page():
+    assert _first_page_cursor({'id': '1', 'ns': 'gtdb'}, [{'id': 'a'}], 1) is None
+    # Without a total count, a short page is the last one
+    assert _first_page_cursor({'id': '1', 'ns': 'gtdb', 'limit': 2}, [{'id': 'a'}]) is None
+    assert _first_page_cursor({'id': '1', 'ns': 'gtdb', 'limit': 1}, [{'id': 'a'}]) is not None
+
+
+def test_bad_cursors():
+    cursor = _first_page_cursor({'id': '1', 'ns': 'gtdb', 'limit': 1}, [{'id': 'a'}], 10)
+    with pytest.raises(InvalidParams):
+        Page('get_children', {'id': '2', 'ns': 'gtdb', 'cursor': cursor})
+    with pytest.raises(InvalidParams):
+        Page('get_siblings', {'id': '1', 'ns': 'gtdb', 'cursor': cursor})
+    with pytest.raises(InvalidParams):
+        Page('get_children', {'id': '1', 'ns': 'gtdb', 'offset': 1, 'cursor': cursor})
+    with pytest.raises(InvalidParams):
+        Page('get_children', {'id': '1', 'ns': 'gtdb', 'cursor': 'nope'})
+    with pytest.raises(InvalidParams):
+        Page('get_children', {'id': '1', 'ns': 'gtdb', 'cursor': encode_cursor([1])})
+
+
+def test_forged_cursors(fake_re, rpc):
+    query = Page('get_children', {'id': '1', 'ns': 'gtdb'}).query
+    good = {'q': query, 'ts': 5, 'offset': 2, 'after': 'b'}
+    Page('get_children', {'id': '1', 'ns': 'gtdb', 'cursor': encode_cursor(good)})
+    for bad in [{'ts': 'abc'}, {'ts': -1}, {'ts': True}, {'ts': 2 ** 64}, {'offset': -5}, {'offset': 100001},
+                {'offset': 1.5}, {'after': 5}, {'q': 1}]:
+        with pytest.raises(InvalidParams):
+            Page('get_children', {'id': '1', 'ns': 'gtdb', 'cursor': encode_cursor({**good, **bad})})
+    # The call fails with invalid params, before anything is sent to RE
+    cursor = encode_cursor({**good, 'ts': 'abc', 'offset': -5})
+    resp = rpc({'version': '1.1', 'method': 'taxonomy_re_api.get_children',
+                'params': [{'id': '1', 'ns': 'gtdb', 'cursor': cursor}]})
+    assert resp.status_code == 400
+    assert resp.json['error']['code'] == -32602
+    assert fake_re.calls == []
+
+
+@pytest.fixture
+def snapshots(tmp_path):
+    names = ['delta', 'Alpha', 'charlie', 'bravo', 'echo']
+    taxa = [{'_key': 'root', 'id': 'root', 'scientific_name': 'root', 'rank': 'no rank'}]
+    taxa += [{'_key': name, 'id': name, 'scientific_name': name, 'rank': 'species'} for name in names]
+    edges = [{'_from': f'gtdb_taxon/{name}', '_to': 'gtdb_taxon/root'} for name in names]
+    for doc in taxa + edges:
+        doc.update({'created': 0, 'expired': _MAX_TS})
+    path = str(tmp_path / 'gtdb.snap')
+    build_snapshot(path, 'gtdb', 1, taxa, edges, 'scientific_name')
+    return load_snapshots([path])
+
+
+def _pages(rpc, method, params):
+    """Follow the cursors through every page, returning the IDs in each page."""
+    pages = []
+    while True:
+        resp = rpc({'version': '1.1', 'method': 'taxonomy_re_api.' + method, 'params': [params]})
+        assert resp.status_code == 200, resp.json
+        result = resp.json['result'][0]
+        pages.append([doc['id'] for doc in result['results']])
+        if result['next_cursor'] is None:
+            return pages
+        params = {key: params[key] for key in ['id', 'ns', 'limit', 'search_text'] if key in params}
+        params['cursor'] = result['next_cursor']
+
+
+def test_snapshot_pages(snapshots, fake_re, rpc, monkeypatch):
+    monkeypatch.setattr(main, '_SNAPSHOTS', snapshots)
+    children = _pages(rpc, 'get_children', {'id': 'root', 'ns': 'gtdb', 'ts': 1, 'limit': 2})
+    assert children == [['Alpha', 'bravo'], ['charlie', 'delta'], ['echo']]
+    siblings = _pages(rpc, 'get_siblings', {'id': 'charlie', 'ns': 'gtdb', 'ts': 1, 'limit': 2})
+    assert siblings == [['Alpha', 'bravo'], ['delta', 'echo']]
+    # Offsets still work, and skip over the taxon itself
+    siblings = _pages(rpc, 'get_siblings', {'id': 'bravo', 'ns': 'gtdb', 'ts': 1, 'limit': 2, 'offset': 1})
+    assert siblings == [['charlie', 'delta'], ['echo']]
+    species = _pages(rpc, 'search_species', {'search_text': 'e', 'ns': 'gtdb', 'ts': 1, 'limit': 1})
+    assert species == [['echo'], []]
+    assert fake_re.calls == []
+
+
+def test_re_pages(fake_re, rpc):
+    ids = [str(i) for i in range(5)]
+
+    def page(start, limit):
+        return {'results': [{'total_count': len(ids), 'results': [{'id': _id} for _id in ids[start:][:limit]]}],
+                'stats': {}}
+
+    fake_re.results['taxonomy_get_children'] = lambda params: page(params.get('offset', 0), params['limit'])
+    fake_re.results['taxonomy_get_children_after'] = lambda params: page(ids.index(params['after']) + 1,
+                                                                         params['limit'])
+    pages = _pages(rpc, 'get_children', {'id': '1', 'ns': 'gtdb', 'limit': 2})
+    assert pages == [['0', '1'], ['2', '3'], ['4']]
+    # Every page used the ts of the first one
+    assert len({call[1]['ts'] for call in fake_re.calls}) == 1
+    # Pages after a cursor seek to the last result seen instead of counting from the start
+    assert [(call[0], call[1].get('after'), call[1].get('offset')) for call in fake_re.calls] == [
+        ('taxonomy_get_children', None, None),
+        ('taxonomy_get_children_after', '1', None),
+        ('taxonomy_get_children_after', '3', None),
+    ]
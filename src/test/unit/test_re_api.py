@@ -0,0 +1,26 @@
+import json
+import asyncio
+
+from src.utils import re_api
+
+
+def test_follow_cursor(monkeypatch):
+    requests = []
+    batches = {
+        None: {'results': [1, 2], 'count': 2, 'has_more': True, 'cursor_id': 'c1', 'stats': {}},
+        'c1': {'results': [3], 'count': 1, 'has_more': True, 'cursor_id': 'c2', 'stats': {}},
+        'c2': {'results': [4], 'count': 1, 'has_more': False, 'cursor_id': None, 'stats': {}},
+    }
+
+    async def request(url_params, body, tok, timeout, replica=None):
+        requests.append((url_params, body, tok))
+        return json.dumps(batches[url_params.get('cursor_id')]).encode()
+
+    monkeypatch.setattr(re_api, '_request', request)
+    resp = asyncio.run(re_api.query('q', {'x': 1}, tok='t'))
+    assert resp['results'] == [1, 2, 3, 4]
+    assert resp['count'] == 4
+    assert resp['has_more'] is False
+    assert requests[0] == ({'stored_query': 'q'}, {'x': 1}, 't')
+    assert [r[0] for r in requests[1:]] == [{'cursor_id': 'c1'}, {'cursor_id': 'c2'}]
+    assert all(r[1] is None and r[2] == 't' for r in requests[1:])
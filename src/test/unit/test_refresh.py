@@ -0,0 +1,73 @@
+"""
+Tests for values refreshed in the background, and their use for get_data_sources.
+"""
+import asyncio
+
+from src.server import main
+from src.utils.refresh import RefreshingValue
+
+
+def test_stale_while_revalidate():
+    fetched = []
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        fetched.append(len(fetched))
+        if len(fetched) == 3:
+            raise RuntimeError('RE is down')
+        return len(fetched)
+
+    async def run():
+        value = RefreshingValue(fetch, max_age=0.05)
+        # The first fetch is awaited, and shared by concurrent callers
+        assert await asyncio.gather(value.get(), value.get()) == [1, 1]
+        await asyncio.sleep(0.06)
+        # Stale: answered right away while a refresh runs
+        assert await value.get() == 1
+        await asyncio.sleep(0.02)
+        assert await value.get() == 2
+        await asyncio.sleep(0.06)
+        assert await value.get() == 2
+        await asyncio.sleep(0.02)
+        # The refresh failed, so the old value is kept
+        assert await value.get() == 2
+        assert value.stats()['errors'] == 1
+        assert value.stats()['refreshes'] == 2
+
+    asyncio.run(run())
+
+
+def test_first_fetch_error():
+    async def fetch():
+        raise RuntimeError('RE is down')
+
+    async def run():
+        value = RefreshingValue(fetch, max_age=60)
+        for _ in range(2):
+            try:
+                await value.get()
+                assert False, 'no error'
+            except RuntimeError:
+                pass
+        assert value.errors == 2
+
+    asyncio.run(run())
+
+
+def test_get_data_sources(fake_re, monkeypatch, rpc):
+    monkeypatch.setattr(main, '_DATA_SOURCES', RefreshingValue(main._fetch_data_sources, 300))
+    fake_re.results['data_sources_get_all_data_sources'] = {
+        'results': [
+            {'_id': 'd/1', '_key': '1', '_rev': 'r', 'ns': 'ncbi_taxonomy'},
+            {'_id': 'd/2', '_key': '2', '_rev': 'r', 'ns': 'gtdb'},
+        ],
+        'stats': {},
+    }
+    call = {'version': '1.1', 'method': 'taxonomy_re_api.get_data_sources', 'params': []}
+    assert rpc(call).json['result'][0]['sources'] == [{'ns': 'ncbi_taxonomy'}, {'ns': 'gtdb'}]
+    resp = rpc({**call, 'params': [{'ns': ['gtdb', 'silva_taxonomy']}]})
+    assert resp.json['result'][0]['sources'] == [{'ns': 'gtdb'}]
+    resp = rpc({**call, 'params': [{'ns': None}]})
+    assert len(resp.json['result'][0]['sources']) == 2
+    # Only the first call went to RE
+    assert fake_re.calls == [('data_sources_get_all_data_sources', {'type': 'taxonomy'}, None)]
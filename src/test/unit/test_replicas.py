@@ -0,0 +1,158 @@
+"""
+Tests for the RE replica pool and hedged queries.
+"""
+import asyncio
+import httpx
+import pytest
+
+from src.utils import re_api
+from src.utils.replicas import ReplicaPool
+
+
+def _pool(urls=('http://a', 'http://b'), **kwargs):
+    params = dict(hedge_percentile=90, hedge_min_delay=0.01, hedge_budget=0.5, max_failures=2)
+    return ReplicaPool(list(urls), **{**params, **kwargs})
+
+
+def test_pick():
+    pool = _pool(['http://a', 'http://b', 'http://c'])
+    (a, b, c) = pool.replicas
+    a.outstanding = 2
+    b.outstanding = 1
+    c.outstanding = 1
+    pool.observe(b, 0.2)
+    pool.observe(c, 0.1)
+    assert pool.pick() is c
+    assert pool.pick(exclude=c) is b
+    # Taken out of rotation after max_failures failures in a row
+    pool.fail(c)
+    assert pool.pick() is c
+    pool.fail(c)
+    assert pool.pick() is b
+    # Back once it answers
+    pool.observe(c, 0.1)
+    assert pool.pick() is c
+    # When none are healthy, they are all tried
+    for replica in pool.replicas:
+        replica.healthy = False
+    assert pool.pick() is c
+    single = _pool(['http://a'])
+    assert single.pick(exclude=single.replicas[0]) is None
+
+
+def test_hedge_delay_and_budget():
+    pool = _pool()
+    for i in range(1, 20):
+        pool.observe(pool.replicas[0], i / 100)
+    assert pool.hedge_delay() is None
+    pool.observe(pool.replicas[0], 0.2)
+    assert pool.hedge_delay() == pytest.approx(0.19)
+    assert _pool(hedge_min_delay=1).hedge_delay() is None
+    assert _pool(['http://a']).hedge_delay() is None
+
+    assert not pool.take_hedge()
+    pool.sent()
+    pool.sent()
+    assert pool.take_hedge()
+    assert not pool.take_hedge()
+    # Tokens don't pile up past a small burst
+    for _ in range(100):
+        pool.sent()
+    assert sum(pool.take_hedge() for _ in range(100)) == 10
+    assert pool.stats()['hedges'] == 11
+
+
+def _down():
+    return httpx.ConnectError('down', request=httpx.Request('POST', 'http://re'))
+
+
+class _Client:
+    """Stands in for the httpx client, answering after a delay that depends on the replica."""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.posts = []
+        self.cancelled = []
+
+    async def post(self, url, **kwargs):
+        base = url.rsplit('/api/', 1)[0]
+        self.posts.append(base)
+        delay = self.delays[base]
+        try:
+            if isinstance(delay, Exception):
+                raise delay
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(base)
+            raise
+        request = httpx.Request('POST', url)
+        return httpx.Response(200, content=('{"results": ["%s"], "has_more": false}' % base).encode(), request=request)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = _pool(hedge_budget=1)
+    monkeypatch.setattr(re_api, 'POOL', pool)
+    monkeypatch.setattr(re_api, 'LIMITER', None)
+    return pool
+
+
+def _query(client, monkeypatch, cache=True):
+    monkeypatch.setattr(re_api, '_get_client', lambda: client)
+    return asyncio.run(re_api.query('hedge_test', {'x': 1}, cache=cache))['results']
+
+
+def test_hedge(pool, monkeypatch):
+    (a, b) = pool.replicas
+    for _ in range(20):
+        pool.observe(a, 0.01)
+    pool.observe(b, 0.02)
+    # a is slow, so the query is hedged on b, which answers first
+    client = _Client({'http://a': 0.5, 'http://b': 0})
+    assert _query(client, monkeypatch) == ['http://b']
+    assert client.posts == ['http://a', 'http://b']
+    assert client.cancelled == ['http://a']
+    assert pool.hedges == 1
+    assert a.outstanding == b.outstanding == 0
+
+    # Queries that are not read-only are never hedged
+    client = _Client({'http://a': 0.05, 'http://b': 0})
+    b.outstanding = 1
+    assert _query(client, monkeypatch, cache=False) == ['http://a']
+    assert client.posts == ['http://a']
+
+    # Nor are they once the budget is spent
+    pool._tokens = 0
+    pool.hedge_budget = 0
+    b.outstanding = 0
+    a.latency = 0
+    client = _Client({'http://a': 0.05, 'http://b': 0})
+    assert _query(client, monkeypatch) == ['http://a']
+    assert client.posts == ['http://a']
+
+
+def test_retry_failed_replica(pool, monkeypatch):
+    client = _Client({'http://a': _down(), 'http://b': 0})
+    assert _query(client, monkeypatch) == ['http://b']
+    assert client.posts == ['http://a', 'http://b']
+    assert pool.replicas[0].failures == 1
+
+    client = _Client({'http://a': _down(), 'http://b': _down()})
+    with pytest.raises(httpx.ConnectError):
+        _query(client, monkeypatch)
+
+
+def test_probe():
+    class Client:
+        async def get(self, url, timeout):
+            if url == 'http://b/':
+                raise _down()
+            return httpx.Response(200, request=httpx.Request('GET', url))
+
+    pool = _pool()
+    asyncio.run(pool.probe(Client(), 1))
+    (a, b) = pool.replicas
+    assert a.healthy and a.latency is not None
+    assert not b.healthy
+    # Probe latencies are not used for the hedge delay
+    assert len(pool._latencies) == 0
@@ -0,0 +1,52 @@
+"""
+Tests for the REST-style GET routes.
+"""
+from src.server import main
+
+
+def _get(url, headers=None):
+    _, resp = main.app.test_client.get(url, headers=headers, allow_redirects=False)
+    return resp
+
+
+def test_get_taxon(fake_re):
+    fake_re.results['taxonomy_fetch_taxon'] = {'results': [{'id': 's__E coli'}], 'stats': {}}
+    resp = _get('/ns/gtdb/taxon/s__E%20coli?ts=5')
+    assert resp.status_code == 200
+    assert resp.json['results'] == [{'id': 's__E coli', 'ns': 'gtdb'}]
+    assert resp.headers['Cache-Control'].startswith('public')
+    assert fake_re.calls == [('taxonomy_fetch_taxon', {'id': 's__E coli', 'ts': 5, '@taxon_coll': 'gtdb_taxon'}, None)]
+    resp = _get('/ns/gtdb/taxon/s__E%20coli?ts=5', headers={'If-None-Match': resp.headers['ETag']})
+    assert resp.status_code == 304
+    assert len(fake_re.calls) == 1
+
+
+def test_get_children(fake_re):
+    fake_re.results['taxonomy_get_children'] = {'results': [{'total_count': 1, 'results': [{'id': '2'}]}], 'stats': {}}
+    resp = _get('/ns/ncbi_taxonomy/taxon/1/children?limit=10&select=id,rank&ts=5')
+    assert resp.status_code == 200
+    assert resp.json['total_count'] == 1
+    (name, params, _) = fake_re.calls[0]
+    assert name == 'taxonomy_get_children'
+    assert (params['limit'], params['select'], params['ts']) == (10, ['id', 'rank'], 5)
+
+
+def test_canonical_redirect(fake_re):
+    resp = _get('/ns/ncbi_taxonomy/taxon/1/lineage?ts=5&select=rank%2Cid,rank')
+    assert resp.status_code == 301
+    assert resp.headers['Location'] == '/ns/ncbi_taxonomy/taxon/1/lineage?select=id,rank&ts=5'
+    assert fake_re.calls == []
+
+
+def test_bad_requests(fake_re):
+    assert _get('/ns/ncbi_taxonomy/taxon/1/parents').status_code == 404
+    # Integers too large for JSON encoding are invalid, not server errors
+    too_large = ['ts=99999999999999999999999', 'offset=-99999999999999999999999', 'limit=9223372036854775808']
+    for query in ['ts=x', 'ts=1&ts=2', 'nope=1'] + too_large:
+        resp = _get('/ns/ncbi_taxonomy/taxon/1/lineage?' + query)
+        assert resp.status_code == 400
+        assert resp.json['error']['code'] == -32602
+    # Checked by the method's schema
+    resp = _get('/ns/nope/taxon/1?ts=1')
+    assert resp.status_code == 400
+    assert fake_re.calls == []
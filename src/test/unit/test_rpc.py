@@ -0,0 +1,176 @@
+"""
+Tests for the JSON-RPC layer in src.server.main, with the RE API replaced by
+an in-process fake (see conftest.py).
+"""
+import time
+
+from src.server import main
+
+
+def test_get_taxon(fake_re, rpc):
+    fake_re.results['taxonomy_fetch_taxon'] = {'results': [{'id': '562'}], 'stats': {}}
+    resp = rpc({
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_taxon',
+        'params': [{'id': '562', 'ns': 'ncbi_taxonomy', 'ts': 1}],
+        'id': 'x',
+    })
+    assert resp.status_code == 200
+    body = resp.json
+    assert body['id'] == 'x'
+    assert body['result'][0]['results'] == [{'id': '562', 'ns': 'ncbi_taxonomy'}]
+    assert fake_re.calls == [
+        ('taxonomy_fetch_taxon', {'id': '562', 'ts': 1, '@taxon_coll': 'ncbi_taxon'}, None)
+    ]
+
+
+def test_invalid_params(fake_re, rpc):
+    resp = rpc({
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_taxon',
+        'params': [{'ns': 'ncbi_taxonomy'}],
+    })
+    assert resp.status_code == 400
+    err = resp.json['error']
+    assert err['code'] == -32602
+    assert err['error']['validator'] == 'required'
+    assert fake_re.calls == []
+
+
+def test_method_not_found(fake_re, rpc):
+    resp = rpc({'version': '1.1', 'method': 'taxonomy_re_api.nope', 'params': [], 'id': 1})
+    assert resp.status_code == 400
+    assert resp.json['id'] == 1
+    assert resp.json['error']['error']['method'] == 'taxonomy_re_api.nope'
+
+
+def test_not_found():
+    _, resp = main.app.test_client.get('/nope')
+    assert resp.status_code == 404
+    assert resp.json['error']['name'] == 'not_found'
+
+
+def test_batch(fake_re, rpc):
+    fake_re.delay = 0.05
+    fake_re.results['taxonomy_fetch_taxon'] = {'results': [{'id': '562'}], 'stats': {}}
+    fake_re.results['taxonomy_get_lineage'] = {'results': [{'id': '1'}, {'id': '2'}], 'stats': {}}
+    resp = rpc([
+        {
+            'version': '1.1',
+            'method': 'taxonomy_re_api.get_taxon',
+            'params': [{'id': '562', 'ns': 'ncbi_taxonomy'}],
+            'id': 'a',
+        },
+        {
+            'version': '1.1',
+            'method': 'taxonomy_re_api.get_taxon',
+            'params': [{'ns': 'ncbi_taxonomy'}],
+            'id': 'b',
+        },
+        {
+            'version': '1.1',
+            'method': 'taxonomy_re_api.get_lineage',
+            'params': [{'id': '562', 'ns': 'ncbi_taxonomy'}],
+            'id': 'c',
+        },
+        'not a call',
+    ])
+    assert resp.status_code == 200
+    (taxon, invalid, lineage, bad_call) = resp.json
+    assert taxon['id'] == 'a'
+    assert taxon['result'][0]['results'] == [{'id': '562', 'ns': 'ncbi_taxonomy'}]
+    assert invalid['id'] == 'b'
+    assert invalid['error']['code'] == -32602
+    assert lineage['id'] == 'c'
+    assert [r['id'] for r in lineage['result'][0]['results']] == ['1', '2']
+    assert bad_call['error']['code'] == -32600
+    assert 'id' not in bad_call
+    # Both RE queries ran at the same time
+    assert fake_re.max_in_flight == 2
+
+
+def test_batch_too_large(fake_re, monkeypatch, rpc):
+    monkeypatch.setitem(main._CONF, 'max_batch_size', 1)
+    call = {'version': '1.1', 'method': 'taxonomy_re_api.get_data_sources', 'params': []}
+    resp = rpc([call, call])
+    assert resp.status_code == 400
+    assert resp.json['error']['code'] == -32600
+    assert fake_re.calls == []
+
+
+def test_get_taxa(fake_re, monkeypatch, rpc):
+    monkeypatch.setitem(main._CONF, 'bulk_chunk_size', 2)
+    known = {'1', '2', '562'}
+    fake_re.results['taxonomy_fetch_taxa'] = lambda params: {
+        'results': [{'id': _id} for _id in params['ids'] if _id in known],
+        'stats': {},
+    }
+    resp = rpc({
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_taxa',
+        'params': [{'ids': ['562', '1', 'x', '562', '2'], 'ns': 'gtdb', 'ts': 5}],
+    })
+    assert resp.status_code == 200
+    result = resp.json['result'][0]
+    assert result['results'] == {
+        '562': {'id': '562', 'ns': 'gtdb'},
+        '1': {'id': '1', 'ns': 'gtdb'},
+        '2': {'id': '2', 'ns': 'gtdb'},
+    }
+    assert result['missing'] == ['x']
+    assert result['ts'] == 5
+    # Duplicates are dropped before chunking
+    assert [call[1]['ids'] for call in fake_re.calls] == [['562', '1'], ['x', '2']]
+    assert all(call[1]['@taxon_coll'] == 'gtdb_taxon' for call in fake_re.calls)
+
+
+def test_get_taxa_from_ws_objs(fake_re, monkeypatch, rpc):
+    monkeypatch.setitem(main._CONF, 'bulk_chunk_size', 2)
+    taxa = {'1:2:3': {'id': 'a'}, '4:5:6': {'id': 'b'}, '1:1:1': None}
+    fake_re.results['taxonomy_get_taxa_from_ws_objs'] = lambda params: {
+        'results': [{'obj_ref': ref, 'taxon': taxa[ref]} for ref in params['obj_refs'] if ref in taxa],
+        'stats': {},
+    }
+    call = {
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_taxa_from_ws_objs',
+        'params': [{'obj_refs': ['1/2/3', '7/8/9', '1/2/3', '4/5/6', '1/1/1'], 'ns': 'gtdb', 'ts': 5}],
+    }
+    resp = rpc(call)
+    assert resp.status_code == 200, resp.json
+    result = resp.json['result'][0]
+    assert result['results'] == {'1/2/3': {'id': 'a', 'ns': 'gtdb'}, '4/5/6': {'id': 'b', 'ns': 'gtdb'}}
+    # Objects without a taxon, or with a null one, are missing
+    assert result['missing'] == ['7/8/9', '1/1/1']
+    assert len(result['stats']) == 2
+    # Duplicates are dropped before chunking, and refs are sent with colons
+    assert [call[1]['obj_refs'] for call in fake_re.calls] == [['1:2:3', '7:8:9'], ['4:5:6', '1:1:1']]
+
+    call['params'][0]['obj_refs'] = ['1/2']
+    assert rpc(call).status_code == 400
+
+
+def test_default_ts_bucket(monkeypatch):
+    # Bucketed with or without the cache, so that calls share in-flight queries
+    monkeypatch.setitem(main._CONF, 'cache_enabled', False)
+    monkeypatch.setitem(main._CONF, 'cache_ts_bucket_ms', 60000)
+    assert main.default_ts() % 60000 == 0
+    monkeypatch.setitem(main._CONF, 'cache_ts_bucket_ms', 0)
+    ts = main.default_ts()
+    assert abs(ts - int(time.time() * 1000)) < 1000
+
+
+def test_invalid_json(fake_re):
+    _, resp = main.app.test_client.post('/', data='{"version": "1.1",')
+    assert resp.status_code == 400
+    assert resp.json['error']['code'] == -32600
+    assert 'id' not in resp.json
+
+
+def test_huge_ts(fake_re, rpc):
+    # Whatever the codec, a ts beyond RE's range is invalid rather than sent to RE as a float
+    resp = rpc({'version': '1.1', 'method': 'taxonomy_re_api.get_taxon',
+                'params': [{'id': '1', 'ns': 'gtdb', 'ts': 99999999999999999999999}]})
+    assert resp.status_code == 400
+    assert resp.json['error']['code'] == -32602
+    assert fake_re.calls == []
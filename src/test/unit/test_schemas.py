@@ -0,0 +1,29 @@
+import jsonschema
+import pytest
+
+from src.utils.schemas import load_schemas, load_validators, validate
+
+_SCHEMAS = load_schemas()
+_VALIDATORS = load_validators(_SCHEMAS)
+
+
+@pytest.mark.parametrize('name,params', [
+    ('get_taxon', {'ns': 'ncbi_taxonomy'}),
+    ('get_taxon', {'id': 1, 'ns': 'ncbi_taxonomy'}),
+    ('get_children', {'id': '1', 'ns': 'nope', 'limit': 10000}),
+    ('search_species', {'search_text': 'x', 'ns': 'gtdb', 'select': [1]}),
+    ('get_data_sources', {'ns': 'gtdb'}),
+])
+def test_same_error_as_jsonschema(name, params):
+    """Precompiled validators raise the same error that `jsonschema.validate` would."""
+    with pytest.raises(jsonschema.ValidationError) as expected:
+        jsonschema.validate(instance=params, schema=_SCHEMAS[name])
+    with pytest.raises(jsonschema.ValidationError) as actual:
+        validate(_VALIDATORS[name], params)
+    for attr in ['message', 'validator', 'validator_value']:
+        assert getattr(actual.value, attr) == getattr(expected.value, attr)
+    assert list(actual.value.path) == list(expected.value.path)
+
+
+def test_valid():
+    validate(_VALIDATORS['get_taxon'], {'id': '1', 'ns': 'gtdb'})
@@ -0,0 +1,71 @@
+"""
+Tests for searches in several namespaces.
+"""
+from src.utils.search import merge_ranked
+
+
+def test_merge_ranked():
+    ncbi = [{'name': 'Escherichia coli K-12'}, {'name': 'Escherichia'}, {'name': 'Shigella'}]
+    rdp = [{'sciname': 'escherichia'}, {'sciname': 'Escherichia/Shigella'}]
+    merged = merge_ranked([(ncbi, 'name'), (rdp, 'sciname')], 'escherichia')
+    assert merged == [rdp[0], ncbi[1], ncbi[0], rdp[1], ncbi[2]]
+    # Without a plain prefix, the namespaces are interleaved in their own order
+    merged = merge_ranked([(ncbi, 'name'), (rdp, 'sciname')], 'escherichia,|shigella')
+    assert merged == [ncbi[0], rdp[0], ncbi[1], rdp[1], ncbi[2]]
+
+
+def _search(params):
+    """Five results in each namespace, one of which is named "e" in gtdb."""
+    ns = params['@taxon_coll'].split('_')[0]
+    names = [f'{ns} {i}' for i in range(5)]
+    if ns == 'gtdb':
+        names[3] = 'e'
+    docs = [{'id': f'{ns}:{i}', 'scientific_name': name, 'name': name} for (i, name) in enumerate(names)]
+    return {'results': docs[params['offset']:][:params['limit']], 'total_count': 5, 'stats': {'ns': ns}}
+
+
+def test_search_taxa_many(fake_re, rpc):
+    fake_re.results['taxonomy_search_sci_name'] = lambda params: {'results': [_search(params)], 'stats': {}}
+    call = {
+        'version': '1.1',
+        'method': 'taxonomy_re_api.search_taxa',
+        'params': [{'search_text': 'e', 'ns': ['gtdb', 'rdp_taxonomy'], 'limit': 3, 'offset': 1}],
+    }
+    resp = rpc(call)
+    assert resp.status_code == 200, resp.json
+    result = resp.json['result'][0]
+    # The exact match comes first (skipped by the offset), then the namespaces are interleaved
+    assert [doc['id'] for doc in result['results']] == ['gtdb:0', 'rdp:0', 'gtdb:1']
+    assert [doc['ns'] for doc in result['results']] == ['gtdb', 'rdp_taxonomy', 'gtdb']
+    assert result['total_count'] == 10
+    assert result['stats'] == {'gtdb': {}, 'rdp_taxonomy': {}}
+    # Every namespace was searched from the start, with the same ts
+    assert [(call[1]['offset'], call[1]['limit']) for call in fake_re.calls] == [(0, 4), (0, 4)]
+    assert len({call[1]['ts'] for call in fake_re.calls}) == 1
+
+    call['params'][0] = {'search_text': 'e', 'ns': ['gtdb', 'rdp_taxonomy'], 'cursor': result['next_cursor']}
+    result = rpc(call).json['result'][0]
+    assert len(result['results']) == 6
+    assert result['next_cursor'] is None
+
+
+def test_search_species_all(fake_re, rpc):
+    fake_re.results['taxonomy_search_species_strain'] = _search
+    resp = rpc({
+        'version': '1.1',
+        'method': 'taxonomy_re_api.search_species',
+        'params': [{'search_text': 'escherichia', 'ns': '*', 'limit': 2}],
+    })
+    assert resp.status_code == 200, resp.json
+    assert [doc['ns'] for doc in resp.json['result'][0]['results']] == ['ncbi_taxonomy', 'gtdb']
+    assert len(fake_re.calls) == 4
+
+
+def test_search_many_errors(fake_re, rpc):
+    def search(params):
+        return rpc({'version': '1.1', 'method': 'taxonomy_re_api.search_taxa', 'params': [params]})
+
+    assert search({'search_text': 'e', 'ns': ['gtdb', 'nope']}).status_code == 400
+    assert search({'search_text': 'e', 'ns': []}).status_code == 400
+    assert search({'search_text': 'e', 'ns': '*', 'offset': 990, 'limit': 20}).status_code == 400
+    assert fake_re.calls == []
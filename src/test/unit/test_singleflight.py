@@ -0,0 +1,117 @@
+import json
+import asyncio
+import pytest
+from types import SimpleNamespace
+
+from src.server import main
+from src.utils import re_api
+from src.utils.singleflight import SingleFlight
+
+
+def test_coalesce(monkeypatch):
+    calls = []
+
+    async def post(name, params, tok, timeout, hedge=False):
+        calls.append((name, tok))
+        await asyncio.sleep(0.01)
+        return json.dumps({'results': [{'id': params['id']}]})
+
+    monkeypatch.setattr(re_api, '_post', post)
+    monkeypatch.setattr(re_api, 'CACHE', None)
+    monkeypatch.setattr(re_api, 'FLIGHTS', SingleFlight())
+
+    async def run():
+        return await asyncio.gather(
+            re_api.query('q', {'id': '1'}),
+            re_api.query('q', {'id': '1'}),
+            re_api.query('q', {'id': '1'}, tok='x'),
+            re_api.query('q', {'id': '2'}),
+        )
+
+    results = asyncio.run(run())
+    assert [r['results'][0]['id'] for r in results] == ['1', '1', '1', '2']
+    # Every waiter gets its own copy of the result
+    assert results[0] is not results[1]
+    # Different auth scopes and params are separate requests
+    assert calls == [('q', None), ('q', 'x'), ('q', None)]
+    assert re_api.FLIGHTS.coalesced == 1
+    assert re_api.FLIGHTS.in_flight() == 0
+
+
+def test_coalesce_default_ts(monkeypatch, rpc):
+    """Concurrent calls without a ts share an RE request, even with the cache off."""
+    calls = []
+
+    async def post(name, params, tok, timeout, hedge=False):
+        calls.append(params['ts'])
+        await asyncio.sleep(0.05)
+        return json.dumps({'results': [{'id': '1'}], 'stats': {}})
+
+    monkeypatch.setattr(re_api, '_post', post)
+    monkeypatch.setattr(re_api, 'CACHE', None)
+    monkeypatch.setattr(re_api, 'FLIGHTS', SingleFlight())
+    monkeypatch.setattr(main, '_LINEAGES', None)
+    monkeypatch.setitem(main._CONF, 'cache_enabled', False)
+    # The calls get their default ts a few milliseconds apart, within one bucket
+    clock = iter(x / 1000 for x in range(1000020000, 1000020100, 3))
+    monkeypatch.setattr(main, 'time', SimpleNamespace(time=lambda: next(clock)))
+    call = {'version': '1.1', 'method': 'taxonomy_re_api.get_lineage', 'params': [{'id': '562', 'ns': 'gtdb'}]}
+    resp = rpc([dict(call, id='1'), dict(call, id='2')])
+    assert resp.status_code == 200, resp.json
+    assert [res['result'][0]['results'] for res in resp.json] == [[{'id': '1', 'ns': 'gtdb'}]] * 2
+    assert calls == [1000020000]
+    assert re_api.FLIGHTS.coalesced == 1
+
+
+def test_shared_exception():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('nope')
+
+    async def run():
+        return await asyncio.gather(flights.do('k', fail), flights.do('k', fail), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flights.coalesced == 1
+
+
+def test_cancel_one_waiter():
+    flights = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return 'done'
+
+    async def run():
+        first = asyncio.ensure_future(flights.do('k', slow))
+        second = asyncio.ensure_future(flights.do('k', slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        # The other waiter still gets the shared result
+        return await second
+
+    assert asyncio.run(run()) == 'done'
+
+
+def test_cancel_all_waiters():
+    flights = SingleFlight()
+    finished = []
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        finished.append(True)
+
+    async def run():
+        waiter = asyncio.ensure_future(flights.do('k', slow))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert finished == []
+    assert flights.in_flight() == 0
@@ -0,0 +1,152 @@
+import time
+import json
+import pytest
+
+from src.server import main
+from src.utils.snapshot import build_snapshot, load_snapshots, find_snapshot, TaxonomySnapshot
+
+_MAX_TS = 9007199254740991
+
+
+def _taxon(_id, name, created=0, expired=_MAX_TS, rank='species'):
+    return {
+        '_key': f'{_id}_{created}',
+        'id': _id,
+        'scientific_name': name,
+        'rank': rank,
+        'created': created,
+        'expired': expired,
+    }
+
+
+def _edge(child, parent, created=0, expired=_MAX_TS):
+    return {
+        '_from': f'ncbi_taxon/{child}_0',
+        '_to': f'ncbi_taxon/{parent}_0',
+        'created': created,
+        'expired': expired,
+    }
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    taxa = [
+        _taxon('1', 'root'),
+        _taxon('2', 'Bacteria'),
+        _taxon('10', 'zeta', expired=99),
+        _taxon('11', 'alpha'),
+        _taxon('12', 'Beta'),
+        _taxon('13', 'gamma'),
+        _taxon('15', 'Escherichia coli K-12'),
+        _taxon('16', 'Escherichia coli'),
+        _taxon('17', 'escherichia albertii'),
+        _taxon('18', 'Escherichia', rank='genus'),
+        # Not created yet at the snapshot time
+        _taxon('14', 'later', created=500),
+    ]
+    edges = [
+        _edge('2', '1'),
+        _edge('10', '2', expired=99),
+        _edge('11', '2'),
+        _edge('12', '2'),
+        _edge('13', '12'),
+        _edge('15', '16'),
+        _edge('16', '18'),
+        _edge('17', '18'),
+        _edge('18', '2'),
+    ]
+    path = str(tmp_path / 'ncbi.snap')
+    build_snapshot(path, 'ncbi_taxonomy', 200, taxa, edges, 'scientific_name')
+    return path
+
+
+def test_snapshot(snapshot_path):
+    snapshot = TaxonomySnapshot(snapshot_path)
+    assert (snapshot.ts_start, snapshot.ts_end) == (100, 499)
+    assert snapshot.covers(200) and not snapshot.covers(50) and not snapshot.covers(500)
+    assert snapshot.count == 9
+    assert snapshot.get_taxon('10') == []
+    assert snapshot.get_taxon('11')[0]['scientific_name'] == 'alpha'
+    assert [t['id'] for t in snapshot.get_lineage('13')] == ['1', '2', '12']
+    assert snapshot.get_lineage('1') == []
+    assert snapshot.get_lineage('13', select=['id']) == [{'id': '1'}, {'id': '2'}, {'id': '12'}]
+    # Children are sorted by name, ignoring case
+    (total, children) = snapshot.get_children('2', select=['scientific_name'])
+    assert total == 3
+    assert children == [{'scientific_name': 'alpha'}, {'scientific_name': 'Beta'}, {'scientific_name': 'Escherichia'}]
+    assert snapshot.get_children('2', limit=1, offset=1)[1][0]['id'] == '12'
+    assert snapshot.get_children('nope') == (0, [])
+    (total, siblings) = snapshot.get_siblings('12')
+    assert total == 2
+    assert [t['id'] for t in siblings] == ['11', '18']
+    assert snapshot.get_siblings('1') == (0, [])
+
+
+def test_search_species(snapshot_path):
+    snapshot = TaxonomySnapshot(snapshot_path)
+
+    def search(prefix, **kwargs):
+        return [t['scientific_name'] for t in snapshot.search_species(prefix, **kwargs)]
+
+    # 'Escherichia' is a genus, so it is not in the index
+    assert search('esch') == ['escherichia albertii', 'Escherichia coli', 'Escherichia coli K-12']
+    assert search('ESCHERICHIA COLI') == ['Escherichia coli', 'Escherichia coli K-12']
+    assert search('e', limit=1, offset=1) == ['Escherichia coli']
+    assert search('e', offset=3) == []
+    assert search('zz') == []
+    assert search('a') == ['alpha']
+
+
+def test_ts_end(tmp_path):
+    path = str(tmp_path / 'current.snap')
+    # Nothing changes after ts 100, but the export was made at 300
+    build_snapshot(path, 'ncbi_taxonomy', 200, [_taxon('1', 'root', created=100)], [], 'scientific_name', ts_end=300)
+    snapshot = TaxonomySnapshot(path)
+    assert (snapshot.ts_start, snapshot.ts_end) == (100, 300)
+    # By default it ends at the time of the build
+    build_snapshot(path, 'ncbi_taxonomy', 200, [_taxon('1', 'root', created=100)], [], 'scientific_name')
+    now = time.time() * 1000
+    assert now - 5000 < TaxonomySnapshot(path).ts_end <= now
+    with pytest.raises(ValueError):
+        build_snapshot(path, 'ncbi_taxonomy', 200, [], [], 'scientific_name', ts_end=199)
+
+
+def test_find_snapshot(snapshot_path):
+    snapshots = load_snapshots([snapshot_path])
+    assert find_snapshot(snapshots, 'ncbi_taxonomy', 300) is not None
+    assert find_snapshot(snapshots, 'ncbi_taxonomy', 600) is None
+    assert find_snapshot(snapshots, 'gtdb', 300) is None
+
+
+def test_handlers(snapshot_path, fake_re, rpc, monkeypatch):
+    monkeypatch.setattr(main, '_SNAPSHOTS', load_snapshots([snapshot_path]))
+
+    def call(method, **params):
+        resp = rpc({'version': '1.1', 'method': 'taxonomy_re_api.' + method, 'params': [params]})
+        assert resp.status_code == 200
+        return resp.json['result'][0]
+
+    result = call('get_children', id='2', ns='ncbi_taxonomy', ts=200, select=['id'], limit=2)
+    assert result['total_count'] == 3
+    assert result['results'] == [{'id': '11', 'ns': 'ncbi_taxonomy'}, {'id': '12', 'ns': 'ncbi_taxonomy'}]
+    # Streamed children are tagged the same way
+    resp = rpc({
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_children',
+        'params': [{'id': '2', 'ns': 'ncbi_taxonomy', 'ts': 200, 'select': ['id'], 'stream': True}],
+    })
+    assert json.loads(resp.body)['result'][0]['results'] == [
+        {'id': _id, 'ns': 'ncbi_taxonomy'} for _id in ['11', '12', '18']]
+    assert [t['id'] for t in call('get_lineage', id='13', ns='ncbi_taxonomy', ts=200)['results']] == ['1', '2', '12']
+    assert call('get_siblings', id='11', ns='ncbi_taxonomy', ts=200)['total_count'] == 2
+    result = call('search_species', search_text='esc', ns='ncbi_taxonomy', ts=200, select=['id'])
+    assert result['results'] == [{'id': _id, 'ns': 'ncbi_taxonomy'} for _id in ['17', '16', '15']]
+    assert call('get_taxon', id='11', ns='ncbi_taxonomy', ts=200)['results'][0]['ns'] == 'ncbi_taxonomy'
+    assert fake_re.calls == []
+    # Timestamps the snapshot does not cover go to RE
+    call('get_taxon', id='11', ns='ncbi_taxonomy', ts=1000)
+    # So do long or fulltext search texts
+    call('search_species', search_text='escherichia', ns='ncbi_taxonomy', ts=200)
+    call('search_species', search_text='e|a', ns='ncbi_taxonomy', ts=200)
+    assert [c[0] for c in fake_re.calls] == [
+        'taxonomy_fetch_taxon', 'taxonomy_search_species_strain', 'taxonomy_search_species_strain_no_sort']
@@ -0,0 +1,82 @@
+import json
+import asyncio
+
+from src.server import main
+from src.utils.stream import fetch_pages
+
+_CHILDREN = [{'id': str(i)} for i in range(25)]
+
+
+def _page(params):
+    (offset, limit) = (params.get('offset', 0), params.get('limit', 20))
+    return {'results': [{'total_count': len(_CHILDREN), 'results': _CHILDREN[offset:offset + limit]}], 'stats': {}}
+
+
+def test_fetch_pages():
+    calls = []
+
+    async def fetch_page(offset, limit):
+        calls.append((offset, limit))
+        return (len(_CHILDREN), _CHILDREN[offset:offset + limit])
+
+    async def collect(offset, limit):
+        (total, pages) = await fetch_pages(fetch_page, offset, limit, page_size=10)
+        return (total, [[doc['id'] for doc in docs] async for docs in pages])
+
+    (total, pages) = asyncio.run(collect(0, None))
+    assert total == 25
+    assert [len(p) for p in pages] == [10, 10, 5]
+    assert calls == [(0, 10), (10, 10), (20, 10)]
+    calls.clear()
+    (_, pages) = asyncio.run(collect(3, 12))
+    assert pages == [[str(i) for i in range(3, 13)], ['13', '14']]
+    assert calls == [(3, 10), (13, 2)]
+
+
+def test_stream_children(fake_re, rpc, monkeypatch):
+    monkeypatch.setitem(main._CONF, 'stream_page_size', 10)
+    fake_re.results['taxonomy_get_children'] = _page
+    resp = rpc({
+        'version': '1.1',
+        'id': 7,
+        'method': 'taxonomy_re_api.get_children',
+        'params': [{'id': '1', 'ns': 'gtdb', 'ts': 1, 'stream': True, 'offset': 2}],
+    })
+    assert resp.status_code == 200
+    assert resp.headers.get('transfer-encoding') == 'chunked'
+    body = json.loads(resp.body)
+    assert body['id'] == 7
+    result = body['result'][0]
+    assert result['total_count'] == 25
+    assert result['ts'] == 1
+    assert [r['id'] for r in result['results']] == [str(i) for i in range(2, 25)]
+    assert all(r['ns'] == 'gtdb' for r in result['results'])
+    assert [(c[1]['offset'], c[1]['limit']) for c in fake_re.calls] == [(2, 10), (12, 10), (22, 10)]
+    assert all('stream' not in c[1] for c in fake_re.calls)
+
+
+def test_stream_in_batch(fake_re, rpc):
+    fake_re.results['taxonomy_get_children'] = _page
+    resp = rpc([{
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_children',
+        'params': [{'id': '1', 'ns': 'gtdb', 'stream': True, 'limit': 5}],
+    }])
+    assert resp.status_code == 200
+    assert [r['id'] for r in resp.json[0]['result'][0]['results']] == ['0', '1', '2', '3', '4']
+
+
+def test_stream_associated_ws_objects(fake_re, rpc):
+    objs = [{'ws_obj': {'ws_info': {'metadata': {'narrative_nice_Name': 'n' + str(i)}}}} for i in range(3)]
+    fake_re.results['taxonomy_get_associated_ws_objects'] = lambda params: {
+        'results': [{'total_count': 3, 'results': objs[params['offset']:params['offset'] + params['limit']]}],
+        'stats': {},
+    }
+    resp = rpc({
+        'version': '1.1',
+        'method': 'taxonomy_re_api.get_associated_ws_objects',
+        'params': [{'id': '1', 'ns': 'gtdb', 'stream': True}],
+    }, headers={'Authorization': 'tok'})
+    result = json.loads(resp.body)['result'][0]
+    assert [r['ws_obj']['workspace']['narr_name'] for r in result['results']] == ['n0', 'n1', 'n2']
+    assert fake_re.calls[0][2] == 'tok'
@@ -0,0 +1,69 @@
+"""
+Tests for traffic capture and replay.
+"""
+import json
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.server import main
+from src.utils import traffic
+from src.benchmark import replay
+
+
+def test_capture(fake_re, monkeypatch, rpc, tmp_path):
+    path = str(tmp_path / 'traffic.jsonl')
+    monkeypatch.setattr(main, '_TRAFFIC', traffic.TrafficLog(path))
+    call = {'version': '1.1', 'method': 'taxonomy_re_api.get_taxon', 'params': [{'id': '1', 'ns': 'gtdb'}]}
+    rpc(call, headers={'Authorization': 'secret'})
+    rpc([call])
+    main.app.test_client.get('/')
+    entries = list(traffic.read(path))
+    assert [entry['body'] for entry in entries] == [call, [call]]
+    assert [entry['auth'] for entry in entries] == [True, False]
+    assert all(entry['status'] == 200 and entry['ms'] >= 0 for entry in entries)
+    with open(path) as fd:
+        assert 'secret' not in fd.read()
+
+
+def test_sample(tmp_path):
+    log = traffic.TrafficLog(str(tmp_path / 'traffic.jsonl'), sample=0)
+    log.record(b'{}', None, 0, 0, 200)
+    assert log.written == 0
+
+
+def test_replay():
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            received.append((json.loads(self.rfile.read(int(self.headers['Content-Length']))),
+                             self.headers.get('Authorization')))
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/'
+    call = {'version': '1.1', 'method': 'taxonomy_re_api.get_lineage', 'params': []}
+    entries = [
+        {'ts': 10.2, 'status': 200, 'auth': False, 'body': [call]},
+        {'ts': 10.0, 'status': 200, 'auth': True, 'body': call},
+        {'ts': 10.1, 'status': 400, 'auth': False, 'body': call},
+    ]
+    try:
+        results = asyncio.run(replay.replay(entries, url, speed=2, concurrency=2, token='tok'))
+    finally:
+        server.shutdown()
+    # Sent in the order they were received, with the token where there was one
+    assert received == [(call, 'tok'), (call, None), ([call], None)]
+    assert len(results['get_lineage'][0]) == 2
+    # The second call was logged as failing, so its 200 now counts as an error
+    assert results['get_lineage'][1] == 1
+    assert len(results['batch'][0]) == 1
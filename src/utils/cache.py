@@ -0,0 +1,70 @@
+"""
+In-process response cache for RE API queries.
+"""
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    LRU cache with a time-to-live and a memory cap.
+
+    Values are stored as serialized JSON, so the cap is measured in bytes of
+    JSON and every hit decodes to a fresh copy that callers are free to mutate.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Mapping of key to (expiration time, value), least recently used first
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return the cached value for `key`, or None if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        (expires, value) = entry
+        if expires <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries to stay under `max_bytes`."""
+        if key in self._entries:
+            self._remove(key)
+        if len(value) > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'size': self.size,
+            'max_size': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _remove(self, key):
+        (_, value) = self._entries.pop(key)
+        self.size -= len(value)
@@ -0,0 +1,40 @@
+"""
+Pluggable JSON codec for the RPC layer and RE client.
+
+`orjson` is used when it is installed, unless the standard library codec is
+selected in the config. Both codecs decode from str or bytes and encode to
+UTF-8 bytes, so bodies can go to and from the network without extra copies.
+"""
+import json
+from src.utils.config import get_config
+
+_CONF = get_config()
+
+
+def _load_stdlib():
+    def dumps(obj, sort_keys=False):
+        return json.dumps(obj, sort_keys=sort_keys, separators=(',', ':'), ensure_ascii=False).encode()
+    return ('json', json.loads, dumps)
+
+
+def _load_orjson():
+    import orjson
+
+    def dumps(obj, sort_keys=False):
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return ('orjson', orjson.loads, dumps)
+
+
+def _load(name):
+    if name == 'json':
+        return _load_stdlib()
+    try:
+        return _load_orjson()
+    except ImportError:
+        if name == 'orjson':
+            raise
+        return _load_stdlib()
+
+
+# Name of the codec in use, and its decode and encode functions
+(NAME, loads, dumps) = _load(_CONF['json_codec'])
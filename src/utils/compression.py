@@ -0,0 +1,54 @@
+"""
+Response compression negotiated from the Accept-Encoding header.
+
+Brotli is used when the `brotli` package is installed and the client
+accepts it; otherwise gzip.
+"""
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Supported encodings, most preferred first, with their default levels
+LEVELS = {'gzip': 6}
+if brotli is not None:
+    LEVELS = {'br': 4, **LEVELS}
+
+
+def choose_encoding(accept_encoding):
+    """
+    Pick the encoding for a response from an Accept-Encoding header, or None to send it as is.
+    The client's q-values are respected, and ties go to the most preferred encoding.
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        (coding, *options) = [part.strip() for part in item.split(';')]
+        weight = 1.0
+        for option in options:
+            if option.startswith('q='):
+                try:
+                    weight = float(option[2:])
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+    best = None
+    for coding in LEVELS:
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > 0 and (best is None or weight > best[1]):
+            best = (coding, weight)
+    return best and best[0]
+
+
+def compress(body, encoding, level=None):
+    """Compress a response body with an encoding from `LEVELS`, at its default level unless given."""
+    if level is None:
+        level = LEVELS[encoding]
+    if encoding == 'br':
+        return brotli.compress(body, quality=level)
+    # A gzip container without a timestamp, so the same body always compresses the same
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
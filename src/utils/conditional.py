@@ -0,0 +1,47 @@
+"""
+HTTP validators for the read-only methods.
+
+Taxonomy data at a given `ts` never changes, so once `ts` is resolved the
+result of a read-only method is fixed by its name and params. Tags are weak,
+as RE query stats in the body can differ between identical results.
+"""
+import os
+import hashlib
+
+from src.utils import codec
+
+
+def _read_version():
+    path = os.path.join(os.path.dirname(__file__), '..', '..', 'VERSION')
+    try:
+        with open(path) as fd:
+            return fd.read().strip()
+    except OSError:
+        return ''
+
+
+# Part of every tag, so that a new release doesn't match responses of the old one
+_VERSION = _read_version()
+
+
+def etag(method, params):
+    """Weak entity tag of the result of a call, with `ts` already set in the params."""
+    digest = hashlib.blake2b(codec.dumps([_VERSION, method, params], sort_keys=True), digest_size=16)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match, tag, any_tag=True):
+    """
+    Whether an If-None-Match header matches a tag, using the weak comparison.
+    `*` matches any tag only when `any_tag` is set.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return any_tag
+    opaque = tag[2:] if tag.startswith('W/') else tag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith('W/') else candidate) == opaque:
+            return True
+    return False
@@ -5,14 +5,110 @@ import os
 import functools
 
 
+def _env_flag(name):
+    """Read an on/off environment variable, such as "1", "true" or "yes"."""
+    return os.environ.get(name, '').lower() in ['1', 't', 'true', 'y', 'yes']
+
+
+def _env_levels(name):
+    """Read a mapping of names to integer levels, such as "taxonomy_re_api.get_children=1,batch=9"."""
+    levels = {}
+    for item in os.environ.get(name, '').split(','):
+        if '=' in item:
+            (key, level) = item.rsplit('=', 1)
+            levels[key.strip()] = int(level)
+    return levels
+
+
 @functools.lru_cache(maxsize=1)
 def get_config():
     re_url = os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_API_URL', 'http://re_api:5000').strip('/')
     if 'appdev' in os.environ.get('KBASE_ENDPOINT', ''):
         re_url = os.environ.get('KBASE_SECURE_CONFIG_PARAM_APPDEV_RE_API_URL').strip('/')
+    # Comma-separated RE API replicas, which queries are balanced over; defaults to the single URL above
+    re_urls = [url.strip().strip('/') for url in os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_API_URLS', '').split(',')]
+    re_urls = [url for url in re_urls if url] or [re_url]
     config = {
-        're_url': re_url,
+        're_url': re_urls[0],
+        're_urls': re_urls,
+        # Seconds between health and latency probes of the RE replicas, and the timeout of a probe
+        're_probe_interval': float(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_PROBE_INTERVAL', 10)),
+        're_probe_timeout': float(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_PROBE_TIMEOUT', 2)),
+        # A replica is taken out of rotation after this many failed queries in a row, until it answers a probe
+        're_replica_failures': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_REPLICA_FAILURES', 3)),
+        # Read-only queries not answered by this percentile of RE latency (and at least the min delay, in
+        # milliseconds) are sent to a second replica as well
+        're_hedge_percentile': float(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_HEDGE_PERCENTILE', 95)),
+        're_hedge_min_delay_ms': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_HEDGE_MIN_DELAY_MS', 10)),
+        # Extra requests that hedges and retries may add, as a fraction of the read-only queries (0 to disable)
+        're_hedge_budget': float(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_HEDGE_BUDGET', 0.1)),
         'dev': 'DEVELOPMENT' in os.environ,
-        'nworkers': os.environ.get('KBASE_SECURE_CONFIG_PARAM_NWORKERS', 2)
+        'nworkers': os.environ.get('KBASE_SECURE_CONFIG_PARAM_NWORKERS', 2),
+        # Max number of open (and keep-alive) connections to the RE API per worker
+        're_pool_size': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_POOL_SIZE', 100)),
+        # Default timeout, in seconds, for a single RE API call
+        're_timeout': float(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_TIMEOUT', 60)),
+        # Default and max time, in milliseconds, that a JSON-RPC call may take before it is cancelled
+        'request_timeout_ms': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_REQUEST_TIMEOUT_MS', 60000)),
+        'max_request_timeout_ms': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_MAX_REQUEST_TIMEOUT_MS', 300000)),
+        # Adaptive limit of concurrent RE calls per worker, between RE_LIMIT_MIN and RE_POOL_SIZE
+        're_limiter': not _env_flag('KBASE_SECURE_CONFIG_PARAM_RE_LIMITER_DISABLED'),
+        're_limit_initial': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_LIMIT_INITIAL', 20)),
+        're_limit_min': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_LIMIT_MIN', 2)),
+        # RE calls taking at least this many seconds lower the limit
+        're_slow_latency': float(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_SLOW_LATENCY', 2)),
+        # Max number of RE calls waiting for the limit, and max seconds each waits, before calls are rejected
+        're_queue_size': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_QUEUE_SIZE', 200)),
+        're_queue_timeout': float(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_QUEUE_TIMEOUT', 5)),
+        # After this many failed RE calls in a row, RE calls are rejected for RE_BREAKER_SECONDS
+        're_breaker_failures': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_BREAKER_FAILURES', 5)),
+        're_breaker_seconds': float(os.environ.get('KBASE_SECURE_CONFIG_PARAM_RE_BREAKER_SECONDS', 10)),
+        # JSON codec: "orjson", "json" (the standard library), or "auto" to use orjson when it is installed
+        'json_codec': os.environ.get('KBASE_SECURE_CONFIG_PARAM_JSON_CODEC', 'auto'),
+        # Max number of calls in a single JSON-RPC batch request
+        'max_batch_size': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_MAX_BATCH_SIZE', 100)),
+        # Max number of IDs sent to the RE API in a single query by the bulk methods
+        'bulk_chunk_size': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_BULK_CHUNK_SIZE', 1000)),
+        # Number of results fetched from RE per query by the streaming mode of the list methods
+        'stream_page_size': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_STREAM_PAGE_SIZE', 1000)),
+        # Max age, in seconds, that clients and proxies may cache results for a `ts` in the past
+        'http_cache_max_age': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_HTTP_CACHE_MAX_AGE', 86400)),
+        # Max age, in seconds, that results for the current data may be cached for (0 to always revalidate)
+        'http_cache_current_max_age': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_HTTP_CACHE_CURRENT_MAX_AGE', 60)),
+        # Responses at least this many bytes long are compressed, if the client accepts it
+        'compress_min_size': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_COMPRESS_MIN_SIZE', 1024)),
+        # Responses at least this many bytes long are compressed in a thread, off the event loop
+        'compress_offload_size': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_COMPRESS_OFFLOAD_SIZE', 1024 * 1024)),
+        # Compression levels (1-9) by method name, or "batch", instead of the defaults of each encoding
+        'compress_levels': _env_levels('KBASE_SECURE_CONFIG_PARAM_COMPRESS_LEVELS'),
+        # In-process cache of RE results for the read-only methods
+        'cache_enabled': _env_flag('KBASE_SECURE_CONFIG_PARAM_CACHE'),
+        'cache_ttl': float(os.environ.get('KBASE_SECURE_CONFIG_PARAM_CACHE_TTL', 300)),
+        'cache_max_bytes': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+        # Short-lived cache of RE results that depend on the caller's token (get_associated_ws_objects), keyed by
+        # a hash of the token; a TTL of 0 turns it off
+        'auth_cache_ttl': float(os.environ.get('KBASE_SECURE_CONFIG_PARAM_AUTH_CACHE_TTL', 30)),
+        'auth_cache_max_bytes': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_AUTH_CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+        # A default `ts` is floored to a multiple of this many milliseconds, so that requests share RE queries
+        'cache_ts_bucket_ms': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_CACHE_TS_BUCKET_MS', 60000)),
+        # Shared-prefix cache of parent pointers and ancestor documents for get_lineage
+        'lineage_cache': _env_flag('KBASE_SECURE_CONFIG_PARAM_LINEAGE_CACHE'),
+        'lineage_cache_snapshots': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_LINEAGE_CACHE_SNAPSHOTS', 4)),
+        'lineage_cache_max_taxa': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_LINEAGE_CACHE_MAX_TAXA', 1000000)),
+        # Seconds after which a lineage cache snapshot stops answering for the current data, as a new
+        # release may have been loaded since
+        'lineage_cache_ttl': float(os.environ.get('KBASE_SECURE_CONFIG_PARAM_LINEAGE_CACHE_TTL', 300)),
+        # Seconds between refreshes of the in-memory list of data sources
+        'data_sources_max_age': float(os.environ.get('KBASE_SECURE_CONFIG_PARAM_DATA_SOURCES_MAX_AGE', 300)),
+        # search_species text up to this long is answered from a snapshot's prefix index, when there is one
+        'prefix_search_max_len': int(os.environ.get('KBASE_SECURE_CONFIG_PARAM_PREFIX_SEARCH_MAX_LEN', 3)),
+        # File that sampled JSON-RPC requests are appended to, for replaying them (see src/utils/traffic.py)
+        'traffic_log': os.environ.get('KBASE_SECURE_CONFIG_PARAM_TRAFFIC_LOG') or None,
+        # Fraction of requests written to the traffic log
+        'traffic_log_sample': float(os.environ.get('KBASE_SECURE_CONFIG_PARAM_TRAFFIC_LOG_SAMPLE', 1)),
+        # Comma-separated paths of local taxonomy snapshot files (see src/utils/snapshot.py)
+        'snapshot_paths': [
+            path for path in os.environ.get('KBASE_SECURE_CONFIG_PARAM_TAXONOMY_SNAPSHOTS', '').split(',') if path
+        ],
     }
     return config
@@ -0,0 +1,141 @@
+"""
+Adaptive concurrency limit, wait queue and circuit breaker for RE API calls.
+"""
+import time
+import asyncio
+from collections import deque
+
+from src.exceptions import Overloaded
+
+_CLOSED = 'closed'
+_OPEN = 'open'
+_HALF_OPEN = 'half_open'
+
+
+class AdaptiveLimiter:
+    """
+    Bounds the number of concurrent calls, adapting the bound to the latency of the calls.
+
+    The limit grows by one for each `limit` fast calls, and shrinks by
+    `backoff` when a call is slow (takes at least `slow_latency` seconds) or
+    fails, at most once per `slow_latency` seconds (AIMD). Calls over the
+    limit wait in a queue of at most `max_queue` calls, for at most
+    `max_wait` seconds; past either bound they are rejected right away.
+
+    After `max_failures` failures in a row the circuit opens, and every call
+    is rejected for `open_seconds`. Then a single trial call is let through,
+    and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, initial, min_limit, max_limit, slow_latency, max_queue, max_wait,
+                 max_failures, open_seconds, backoff=0.9):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.slow_latency = slow_latency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_failures = max_failures
+        self.open_seconds = open_seconds
+        self.backoff = backoff
+        self.in_flight = 0
+        self.rejected = 0
+        self.failures = 0
+        self.state = _CLOSED
+        self._opened_at = None
+        self._last_decrease = 0.0
+        # Futures of the calls waiting for a slot, oldest first
+        self._waiters = deque()
+
+    async def run(self, make_coro, is_failure):
+        """
+        Await `make_coro()` once a slot is free, or raise Overloaded.
+        `is_failure(err)` tells whether an exception from the call means that the backend is unhealthy.
+        """
+        await self._acquire()
+        start = time.monotonic()
+        try:
+            result = await make_coro()
+        except Exception as err:
+            self._release(time.monotonic() - start, is_failure(err))
+            raise
+        except BaseException:
+            # Cancelled: says nothing about the backend
+            self._release(None, False)
+            raise
+        self._release(time.monotonic() - start, False)
+        return result
+
+    def stats(self):
+        return {
+            'limit': round(self.limit, 1),
+            'in_flight': self.in_flight,
+            'queued': len(self._waiters),
+            'rejected': self.rejected,
+            'circuit': self.state,
+        }
+
+    async def _acquire(self):
+        if self.state == _OPEN:
+            remaining = self._opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                self._reject('The relation engine API is failing', remaining)
+            # Let one trial call through
+            self.state = _HALF_OPEN
+        elif self.state == _HALF_OPEN:
+            self._reject('The relation engine API is failing', self.open_seconds)
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._reject('Too many requests to the relation engine API', self.slow_latency)
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            self._reject('Timed out waiting for the relation engine API', self.slow_latency)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # Cancelled right after being handed a slot, so pass it on
+                self._free_slot()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        # The slot was handed over by _free_slot, which counted it
+
+    def _reject(self, message, retry_after):
+        self.rejected += 1
+        raise Overloaded(message, retry_after=max(1, round(retry_after)))
+
+    def _release(self, latency, failed):
+        now = time.monotonic()
+        if failed:
+            self.failures += 1
+            if self.state == _HALF_OPEN or self.failures >= self.max_failures:
+                self.state = _OPEN
+                self._opened_at = now
+        elif latency is not None:
+            self.failures = 0
+            if self.state == _HALF_OPEN:
+                self.state = _CLOSED
+        elif self.state == _HALF_OPEN:
+            # The trial call was cancelled; allow another
+            self.state = _OPEN
+        if failed or (latency is not None and latency >= self.slow_latency):
+            if now - self._last_decrease >= self.slow_latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        elif latency is not None:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._free_slot()
+
+    def _free_slot(self):
+        """Release a slot, and hand free slots over to waiting calls."""
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
@@ -0,0 +1,141 @@
+"""
+Shared-prefix cache of taxon lineages.
+
+Lineages overlap almost completely, so instead of caching whole lineages we
+keep one parent pointer and one document per taxon. Any lineage whose chain
+of parent pointers is known can be rebuilt locally.
+
+A snapshot is not tied to the `ts` of the requests that filled it, but to a
+release: the range of timestamps over which every pointer and document it
+holds is active (from their `created` and `expired` fields). Any `ts` in that
+range is answered from the same snapshot.
+"""
+import time
+import itertools
+from collections import OrderedDict
+
+# Guard against cycles in bad data
+_MAX_DEPTH = 1000
+# Max timestamp in RE, the `expired` of documents that are still active
+_MAX_TS = 9007199254740991
+
+
+class LineageSnapshot:
+    """
+    Parent pointers and documents for one namespace, all active from `start` to `end`.
+    Documents that are still active have no known end, but a new release may be loaded
+    at any time, so the snapshot only answers timestamps up to `valid_until`.
+    """
+
+    def __init__(self, valid_until):
+        # Mapping of taxon ID to parent ID (None for the root)
+        self.parents = {}
+        # Mapping of taxon ID to its full document
+        self.docs = {}
+        (self.start, self.end) = (0, _MAX_TS)
+        self.valid_until = valid_until
+
+    def covers(self, ts):
+        return self.start <= ts <= min(self.end, self.valid_until)
+
+    def lineage_ids(self, taxon_id):
+        """
+        IDs of the ancestors of a taxon, from the root down to its parent.
+        Returns None if any link in the chain is not cached.
+        """
+        ids = []
+        current = taxon_id
+        while len(ids) < _MAX_DEPTH:
+            if current not in self.parents:
+                return None
+            current = self.parents[current]
+            if current is None:
+                ids.reverse()
+                return ids
+            ids.append(current)
+        return None
+
+    def first_unknown(self, taxon_id):
+        """
+        The first taxon in the chain of parents from `taxon_id` up whose parent is not cached,
+        or None if the chain reaches the root (or is too long).
+        """
+        current = taxon_id
+        for _ in range(_MAX_DEPTH):
+            if current not in self.parents:
+                return current
+            current = self.parents[current]
+            if current is None:
+                return None
+        return None
+
+    def add_parent(self, taxon_id, edge):
+        """
+        Record the parent of a taxon, from its child_of `edge` (a dict of the parent `id` and the
+        `created` and `expired` of the edge), or None for a root.
+        """
+        if edge is None:
+            self.parents[taxon_id] = None
+        else:
+            self._narrow(edge)
+            self.parents[taxon_id] = edge['id']
+
+    def add_docs(self, docs):
+        for doc in docs:
+            self._narrow(doc)
+            self.docs[doc['id']] = doc
+
+    def _narrow(self, item):
+        """Shrink the range of the snapshot to the one where `item` is active as well."""
+        self.start = max(self.start, item['created'])
+        self.end = min(self.end, item['expired'])
+
+
+class LineageCache:
+    """
+    Lineage snapshots by namespace, each covering the timestamps of one release.
+    A snapshot answers timestamps up to `ttl` seconds past the time it was made,
+    after which a new one is started for the current data. The least recently
+    used snapshots are dropped when there are more than `max_snapshots`, and a
+    snapshot is replaced once it holds more than `max_taxa` parent pointers.
+    """
+
+    def __init__(self, max_snapshots, max_taxa, ttl):
+        self.max_snapshots = max_snapshots
+        self.max_taxa = max_taxa
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._snapshots = OrderedDict()
+        self._keys = itertools.count()
+
+    def snapshot(self, ns, ts):
+        """
+        The snapshot covering `ts` in a namespace, started if there is none.
+        Returns None for a `ts` too far in the future to be cached.
+        """
+        # An empty snapshot covers any ts, so prefer the one that holds the most
+        covering = [(key, snapshot) for (key, snapshot) in self._snapshots.items()
+                    if key[0] == ns and snapshot.covers(ts)]
+        if covering:
+            (key, snapshot) = max(covering, key=lambda item: len(item[1].parents))
+            if len(snapshot.parents) <= self.max_taxa:
+                self._snapshots.move_to_end(key)
+                return snapshot
+            del self._snapshots[key]
+        snapshot = LineageSnapshot(int((time.time() + self.ttl) * 1000))
+        if not snapshot.covers(ts):
+            return None
+        self._snapshots[(ns, next(self._keys))] = snapshot
+        while len(self._snapshots) > self.max_snapshots:
+            self._snapshots.popitem(last=False)
+        return snapshot
+
+    def stats(self):
+        return {
+            'snapshots': len(self._snapshots),
+            'taxa': sum(len(s.parents) for s in self._snapshots.values()),
+            'docs': sum(len(s.docs) for s in self._snapshots.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -0,0 +1,67 @@
+"""
+Prometheus metrics for JSON-RPC calls and RE stored queries.
+
+Each server worker is a separate process. When `PROMETHEUS_MULTIPROC_DIR` is
+set (the entrypoint script does this), every worker writes its samples to
+files in that directory, and the `/metrics` response served by any worker
+aggregates the samples of all of them.
+"""
+import os
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir')
+
+# Response sizes from 256 bytes to 64MiB
+_SIZE_BUCKETS = [256 * 4 ** i for i in range(10)]
+
+REQUESTS = Counter(
+    'taxonomy_rpc_requests_total', 'JSON-RPC calls, by method.', ['method'],
+)
+ERRORS = Counter(
+    'taxonomy_rpc_errors_total', 'JSON-RPC calls that failed, by method and error handler.', ['method', 'error'],
+)
+LATENCY = Histogram(
+    'taxonomy_rpc_duration_seconds', 'Time to run a JSON-RPC call, by method.', ['method'],
+)
+IN_FLIGHT = Gauge(
+    'taxonomy_rpc_in_flight', 'HTTP requests to the JSON-RPC endpoint being handled.', multiprocess_mode='livesum',
+)
+RESPONSE_SIZE = Histogram(
+    'taxonomy_rpc_response_bytes', 'Size of JSON-RPC response bodies, by method ("batch" for batches).',
+    ['method'], buckets=_SIZE_BUCKETS,
+)
+RE_LATENCY = Histogram(
+    'taxonomy_re_query_duration_seconds', 'Time to run an RE stored query, including any cursor batches.',
+    ['query'],
+)
+RE_ERRORS = Counter(
+    'taxonomy_re_query_errors_total', 'RE stored queries that failed, by query.', ['query'],
+)
+RE_REJECTED = Counter(
+    'taxonomy_re_query_rejected_total', 'RE stored queries rejected by the concurrency limiter, by query.', ['query'],
+)
+RE_LIMIT = Gauge(
+    'taxonomy_re_concurrency_limit', 'Adaptive limit of RE queries in flight, summed over the workers.',
+    multiprocess_mode='livesum',
+)
+RE_IN_FLIGHT = Gauge(
+    'taxonomy_re_queries_in_flight', 'RE stored queries waiting on a response.', multiprocess_mode='livesum',
+)
+
+
+def render():
+    """Return the body and content type of a metrics scrape."""
+    if _MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return (generate_latest(registry), CONTENT_TYPE_LATEST)
+
+
+def worker_stopped():
+    """Drop the live gauges of this worker, so they are no longer summed."""
+    if _MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,103 @@
+"""
+Opaque continuation cursors for paginated methods.
+
+A cursor pins the `ts` of the first page, the offset of the next page and the
+ID of the last result seen, so that the next page neither drifts when the
+data changes nor has to be found by counting from the start where the
+backend can seek to the last result instead: local snapshots, and the keyset
+variants of the RE queries for children and siblings. Searches are ranked by
+relevance, so their pages are still found by offset.
+"""
+import json
+import base64
+import hashlib
+
+from src.exceptions import InvalidParams
+
+# Params that may change from page to page; every other param is part of the query
+_PAGE_PARAMS = ('cursor', 'offset', 'limit', 'select', 'ts', 'stream')
+# Max offset of a cursor, the same as the max `offset` param
+_MAX_OFFSET = 100000
+# Max timestamp in RE
+_MAX_TS = 9007199254740991
+
+
+def _query_hash(method, params):
+    query = {key: val for (key, val) in params.items() if key not in _PAGE_PARAMS}
+    text = json.dumps([method, query], sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def encode_cursor(token):
+    return base64.urlsafe_b64encode(json.dumps(token, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def _is_int(val, minimum=0, maximum=None):
+    # bool is a subclass of int, but not a valid ts or offset
+    return (
+        isinstance(val, int) and not isinstance(val, bool) and val >= minimum and (maximum is None or val <= maximum)
+    )
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor, checking its fields as strictly as the params they stand for,
+    since clients may build their own.
+    """
+    try:
+        token = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(token, dict) or not {'q', 'ts', 'offset', 'after'} <= token.keys():
+            raise ValueError()
+    except ValueError:
+        raise InvalidParams('Invalid cursor')
+    if (
+        not isinstance(token['q'], str)
+        or not _is_int(token['ts'], maximum=_MAX_TS)
+        or not _is_int(token['offset'], maximum=_MAX_OFFSET)
+        or not (token['after'] is None or isinstance(token['after'], str))
+    ):
+        raise InvalidParams('Invalid cursor')
+    return token
+
+
+class Page:
+    """
+    Pagination state for one request.
+    Takes the validated params (before the namespace is resolved) and replaces
+    a `cursor` param with the `ts` and `offset` it encodes.
+    """
+
+    def __init__(self, method, params):
+        cursor = params.pop('cursor', None)
+        self.query = _query_hash(method, params)
+        # ID of the last result of the previous page, if known
+        self.after = None
+        if cursor is None:
+            return
+        if 'offset' in params:
+            raise InvalidParams('Use either a cursor or an offset, not both')
+        token = decode_cursor(cursor)
+        if token['q'] != self.query:
+            raise InvalidParams('The cursor was made for a different query')
+        params['ts'] = token['ts']
+        params['offset'] = token['offset']
+        self.after = token['after']
+
+    def next_cursor(self, params, results, total_count=None):
+        """
+        Cursor for the page after `results`, or None if there are no more results.
+        Without a total count, a full page is assumed to have more results after it.
+        """
+        offset = params.get('offset', 0) + len(results)
+        if total_count is not None:
+            more = offset < total_count
+        else:
+            more = len(results) > 0 and len(results) >= params.get('limit', 20)
+        if not more:
+            return None
+        return encode_cursor({
+            'q': self.query,
+            'ts': params['ts'],
+            'offset': offset,
+            'after': results[-1].get('id') if results else None,
+        })
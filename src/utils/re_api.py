@@ -1,17 +1,115 @@
 """
 Relation engine API client.
+
+Queries are made through a single keep-alive connection pool per worker, so
+handlers can have many RE queries in flight without blocking the event loop.
+When several RE replicas are configured, each query goes to the healthy
+replica with the fewest queries outstanding, and slow read-only queries are
+hedged on a second replica (see src/utils/replicas.py).
 """
-import json
-import requests
+import re
+import time
+import asyncio
+import hashlib
+import httpx
+from src.utils import codec, metrics
 from src.utils.config import get_config
-from src.exceptions import REError
+from src.utils.cache import ResponseCache
+from src.utils.singleflight import SingleFlight
+from src.utils.limiter import AdaptiveLimiter
+from src.utils.replicas import ReplicaPool
+from src.exceptions import REError, Overloaded
 
 _CONF = get_config()
 
+# Shared async HTTP client; created lazily inside the running event loop
+_CLIENT = None
+
+# Cache of query results, shared by every request in this worker
+CACHE = ResponseCache(_CONF['cache_max_bytes'], _CONF['cache_ttl']) if _CONF['cache_enabled'] else None
+
+# Short-lived cache of query results that depend on the caller's token. Keys hold a hash of the
+# token (see query_key), so a user only ever gets results fetched with their own token
+AUTH_CACHE = (
+    ResponseCache(_CONF['auth_cache_max_bytes'], _CONF['auth_cache_ttl']) if _CONF['auth_cache_ttl'] > 0 else None
+)
+
+# Identical queries in flight at the same time share a single RE request
+FLIGHTS = SingleFlight()
+
+# Bound on the RE requests in flight in this worker, adapted to RE's latency
+LIMITER = AdaptiveLimiter(
+    initial=_CONF['re_limit_initial'],
+    min_limit=_CONF['re_limit_min'],
+    max_limit=_CONF['re_pool_size'],
+    slow_latency=_CONF['re_slow_latency'],
+    max_queue=_CONF['re_queue_size'],
+    max_wait=_CONF['re_queue_timeout'],
+    max_failures=_CONF['re_breaker_failures'],
+    open_seconds=_CONF['re_breaker_seconds'],
+) if _CONF['re_limiter'] else None
+
+# RE API replicas that queries are balanced over
+POOL = ReplicaPool(
+    _CONF['re_urls'],
+    hedge_percentile=_CONF['re_hedge_percentile'],
+    hedge_min_delay=_CONF['re_hedge_min_delay_ms'] / 1000,
+    hedge_budget=_CONF['re_hedge_budget'],
+    max_failures=_CONF['re_replica_failures'],
+)
+
+
+def _get_client():
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=_CONF['re_pool_size'],
+                max_keepalive_connections=_CONF['re_pool_size'],
+            ),
+            timeout=httpx.Timeout(_CONF['re_timeout']),
+        )
+    return _CLIENT
+
+
+def start_probing():
+    """Start probing the health of the RE replicas. Called when a worker starts."""
+    POOL.start(_get_client, _CONF['re_probe_interval'], _CONF['re_probe_timeout'])
+
 
-def query(name, params, tok=None):
+async def stop_probing():
+    await POOL.stop()
+
+
+async def close():
+    """Close the connection pool. Called when a worker stops."""
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
+
+
+def query_key(name, params, tok=None):
+    """
+    Key identifying a query by its name, params and auth scope.
+    The token is hashed so that raw tokens are never held in memory.
+    """
+    tok_hash = hashlib.sha256(tok.encode()).hexdigest() if tok else None
+    return (name, codec.dumps(params, sort_keys=True), tok_hash)
+
+
+async def query(name, params, tok=None, timeout=None, cache=False, auth_cache=False):
     """
     Run a stored query from the RE API.
+    `timeout` is in seconds and overrides the default from the config.
+    Set `cache` for read-only queries whose results may be served from the
+    response cache, when it is enabled. Set `auth_cache` instead for
+    read-only queries whose results depend on the token, to cache them in
+    AUTH_CACHE. Both kinds of queries may also be hedged, or retried on
+    another replica.
+
+    Any further results on the RE cursor are fetched as well, so `has_more`
+    is always false in the returned dict.
 
     Returns (from relation_engine)
     {
@@ -23,12 +121,137 @@ def query(name, params, tok=None):
     }
 
     """
-    resp = requests.post(
-        _CONF['re_url'] + '/api/v1/query_results',
-        params={'stored_query': name},
-        data=json.dumps(params),
-        headers={'Authorization': tok}
-    )
-    if not resp.ok:
+    key = query_key(name, params, tok)
+    hedge = cache or auth_cache
+    store = CACHE if cache else AUTH_CACHE if auth_cache else None
+    if store is None:
+        return codec.loads(await FLIGHTS.do(key, lambda: _post(name, params, tok, timeout, hedge)))
+    body = store.get(key)
+    if body is None:
+        body = await FLIGHTS.do(key, lambda: _post(name, params, tok, timeout, hedge))
+        store.set(key, body)
+    return codec.loads(body)
+
+
+# Quick check for a response that has more results on a cursor, without parsing it
+_HAS_MORE = re.compile(rb'"has_more"\s*:\s*true')
+
+
+async def _post(name, params, tok, timeout, hedge=False):
+    """
+    Send a stored query to the RE API and return the raw response body, as bytes.
+    If RE has more results on a cursor, they are fetched and merged in.
+    Set `hedge` for read-only queries, which may be sent to two replicas.
+    Raises Overloaded when the limiter rejects the query.
+    """
+    if LIMITER is None:
+        return await _send(name, params, tok, timeout, hedge)
+    try:
+        return await LIMITER.run(lambda: _send(name, params, tok, timeout, hedge), _is_failure)
+    except Overloaded:
+        metrics.RE_REJECTED.labels(name).inc()
+        raise
+    finally:
+        metrics.RE_LIMIT.set(LIMITER.limit)
+
+
+def _is_failure(err):
+    """Whether an error means that RE is unhealthy, rather than that the query was bad."""
+    return isinstance(err, httpx.TransportError) or (isinstance(err, REError) and err.status_code >= 500)
+
+
+async def _send(name, params, tok, timeout, hedge=False):
+    try:
+        with metrics.RE_LATENCY.labels(name).time(), metrics.RE_IN_FLIGHT.track_inprogress():
+            return await _fetch_all(name, params, tok, timeout, hedge)
+    except Exception:
+        metrics.RE_ERRORS.labels(name).inc()
+        raise
+
+
+async def _fetch_all(name, params, tok, timeout, hedge=False):
+    (body, replica) = await _hedged({'stored_query': name}, params, tok, timeout, hedge)
+    if not _HAS_MORE.search(body):
+        return body
+    resp = codec.loads(body)
+    batch = resp
+    while batch.get('has_more') and batch.get('cursor_id'):
+        # The cursor only exists on the replica that answered the query
+        batch = codec.loads(await _request({'cursor_id': batch['cursor_id']}, None, tok, timeout, replica))
+        resp['results'].extend(batch['results'])
+    resp['count'] = len(resp['results'])
+    resp['has_more'] = False
+    resp['cursor_id'] = None
+    return codec.dumps(resp)
+
+
+async def _hedged(url_params, body, tok, timeout, hedge):
+    """
+    Send a request to the best replica and return (raw response body, replica that answered).
+
+    With `hedge` set, a request that isn't answered within the pool's hedge
+    delay, or that fails with a replica error, is sent to a second replica as
+    well, if the hedge budget allows it. The first good response wins and the
+    other request is cancelled.
+    """
+    primary = POOL.pick()
+    if not hedge or len(POOL.replicas) < 2:
+        return (await _request(url_params, body, tok, timeout, primary), primary)
+    POOL.sent()
+    tasks = {asyncio.ensure_future(_request(url_params, body, tok, timeout, primary)): primary}
+    try:
+        (done, _) = await asyncio.wait(tasks, timeout=POOL.hedge_delay())
+        if not done or _is_failure(next(iter(done)).exception()):
+            secondary = POOL.pick(exclude=primary)
+            if secondary is not None and POOL.take_hedge():
+                tasks[asyncio.ensure_future(_request(url_params, body, tok, timeout, secondary))] = secondary
+        while True:
+            for (task, replica) in tasks.items():
+                if task.done() and (task.exception() is None or not _is_failure(task.exception())):
+                    # A response, or an error that another replica would give as well
+                    return (task.result(), replica)
+            pending = [task for task in tasks if not task.done()]
+            if not pending:
+                # Every replica failed; raise the last error
+                raise list(tasks)[-1].exception()
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def _request(url_params, body, tok, timeout, replica=None):
+    """
+    POST to the query endpoint of an RE replica (by default the best one) and return the raw
+    response body, as bytes.
+    Call deadlines are not applied here: a request may be shared by several calls (see FLIGHTS), so
+    each call enforces its own deadline by cancelling its wait, and a timeout here is always RE's fault.
+    """
+    if replica is None:
+        replica = POOL.pick()
+    headers = {'Authorization': tok} if tok else {}
+    kwargs = {}
+    if timeout is not None:
+        kwargs['timeout'] = timeout
+    replica.outstanding += 1
+    start = time.monotonic()
+    try:
+        resp = await _get_client().post(
+            replica.url + '/api/v1/query_results',
+            params=url_params,
+            content=codec.dumps(body) if body is not None else b'',
+            headers=headers,
+            **kwargs
+        )
+    except httpx.TransportError:
+        POOL.fail(replica)
+        raise
+    finally:
+        replica.outstanding -= 1
+    if resp.is_error:
+        if resp.status_code >= 500:
+            POOL.fail(replica)
         raise REError(resp)
-    return resp.json()
+    POOL.observe(replica, time.monotonic() - start)
+    return resp.content
@@ -0,0 +1,89 @@
+"""
+In-memory values that are served stale while they are refreshed in the background.
+"""
+import time
+import asyncio
+import traceback
+from contextlib import suppress
+
+
+class RefreshingValue:
+    """
+    A value fetched by a coroutine function and kept in memory.
+
+    Once the value is older than `max_age` seconds, callers still get it right
+    away while a single background task fetches a new one. If a refresh
+    fails, the old value is kept and served until a later refresh succeeds.
+    Only the very first fetch is awaited by callers, and its errors are raised.
+    """
+
+    def __init__(self, fetch, max_age):
+        self.fetch = fetch
+        self.max_age = max_age
+        self.value = None
+        self.refreshes = 0
+        self.errors = 0
+        self._fetched_at = None
+        self._task = None
+        self._schedule = None
+
+    async def get(self):
+        if self._fetched_at is None:
+            return await asyncio.shield(self.refresh())
+        self.refresh_if_older(self.max_age)
+        return self.value
+
+    def refresh_if_older(self, seconds):
+        """Refresh in the background if the value was fetched more than `seconds` ago."""
+        if self._fetched_at is not None and time.monotonic() - self._fetched_at > seconds:
+            self.refresh()
+
+    def refresh(self):
+        """Start fetching a new value, unless a fetch is already running. Returns its task."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._refresh())
+        return self._task
+
+    def start(self):
+        """Refresh the value every `max_age` seconds in the background, whether it is used or not."""
+        if self._schedule is None:
+            self._schedule = asyncio.ensure_future(self._keep_fresh())
+
+    async def stop(self):
+        """Stop the scheduled refreshes and any refresh in progress."""
+        tasks = [task for task in (self._schedule, self._task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        with suppress(asyncio.CancelledError, Exception):
+            await asyncio.gather(*tasks)
+        self._schedule = None
+
+    async def _keep_fresh(self):
+        while True:
+            await asyncio.sleep(self.max_age)
+            # Failures are counted in `errors`; try again on schedule
+            with suppress(Exception):
+                await self.refresh()
+
+    def stats(self):
+        return {
+            'age': None if self._fetched_at is None else round(time.monotonic() - self._fetched_at, 1),
+            'refreshes': self.refreshes,
+            'errors': self.errors,
+        }
+
+    async def _refresh(self):
+        try:
+            value = await self.fetch()
+        except Exception:
+            self.errors += 1
+            if self._fetched_at is None:
+                raise
+            traceback.print_exc()
+            return self.value
+        finally:
+            self._task = None
+        self.value = value
+        self._fetched_at = time.monotonic()
+        self.refreshes += 1
+        return value
@@ -0,0 +1,144 @@
+"""
+Pool of RE API replicas, with health probing, least-outstanding-requests
+balancing and a budget for hedged requests.
+"""
+import time
+import asyncio
+from collections import deque
+from contextlib import suppress
+
+import httpx
+
+# Weight of a new sample in a replica's average latency
+_EWMA_WEIGHT = 0.2
+# Query latencies kept for choosing the hedging delay, and how many are needed first
+_LATENCY_SAMPLES = 500
+_MIN_LATENCY_SAMPLES = 20
+# Max number of hedges that may be sent in a burst
+_MAX_HEDGE_TOKENS = 10
+
+
+class Replica:
+    def __init__(self, url):
+        self.url = url
+        self.healthy = True
+        self.outstanding = 0
+        self.failures = 0
+        # Average latency in seconds, or None before the first response
+        self.latency = None
+
+    def stats(self):
+        # URLs are left out, as they are secure config
+        return {
+            'healthy': self.healthy,
+            'outstanding': self.outstanding,
+            'latency_ms': None if self.latency is None else round(self.latency * 1000, 1),
+        }
+
+
+class ReplicaPool:
+    """
+    Picks the healthy replica with the fewest outstanding requests (then the lowest latency).
+
+    A replica is marked unhealthy after `max_failures` failures in a row, and
+    healthy again when it answers a query or a probe. Each request sent earns
+    `hedge_budget` of a hedge token, and each hedge spends one, so that hedges
+    add at most that fraction of extra requests (past a small burst).
+    """
+
+    def __init__(self, urls, hedge_percentile, hedge_min_delay, hedge_budget, max_failures):
+        self.replicas = [Replica(url) for url in urls]
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_budget = hedge_budget
+        self.max_failures = max_failures
+        self.hedges = 0
+        self._tokens = 0.0
+        self._latencies = deque(maxlen=_LATENCY_SAMPLES)
+        self._probing = None
+
+    def pick(self, exclude=None):
+        """The replica to send a request to, or None if there is no other than `exclude`."""
+        candidates = [replica for replica in self.replicas if replica is not exclude]
+        healthy = [replica for replica in candidates if replica.healthy]
+        if not candidates:
+            return None
+        return min(healthy or candidates, key=lambda replica: (replica.outstanding, replica.latency or 0))
+
+    def hedge_delay(self):
+        """
+        Seconds to wait for an answer before hedging a request, or None to not hedge.
+        This is the `hedge_percentile` of the recent query latencies.
+        """
+        if len(self.replicas) < 2 or len(self._latencies) < _MIN_LATENCY_SAMPLES:
+            return None
+        latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))
+        return max(self.hedge_min_delay, latencies[index])
+
+    def sent(self):
+        """Record a request that may be hedged, earning part of a hedge token."""
+        self._tokens = min(_MAX_HEDGE_TOKENS, self._tokens + self.hedge_budget)
+
+    def take_hedge(self):
+        """Spend a hedge token, if there is one."""
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        self.hedges += 1
+        return True
+
+    def observe(self, replica, latency, query=True):
+        """Record a successful response from a replica, which took `latency` seconds."""
+        replica.healthy = True
+        replica.failures = 0
+        if replica.latency is None:
+            replica.latency = latency
+        else:
+            replica.latency += _EWMA_WEIGHT * (latency - replica.latency)
+        if query:
+            self._latencies.append(latency)
+
+    def fail(self, replica):
+        replica.failures += 1
+        if replica.failures >= self.max_failures:
+            replica.healthy = False
+
+    async def probe(self, client, timeout):
+        """Check the health and latency of every replica with a request to its root URL."""
+        async def check(replica):
+            start = time.monotonic()
+            try:
+                resp = await client.get(replica.url + '/', timeout=timeout)
+            except httpx.HTTPError:
+                replica.healthy = False
+                return
+            if resp.status_code >= 500:
+                replica.healthy = False
+            else:
+                self.observe(replica, time.monotonic() - start, query=False)
+        await asyncio.gather(*[check(replica) for replica in self.replicas])
+
+    def start(self, get_client, interval, timeout):
+        """Probe the replicas every `interval` seconds in the background, when there are several."""
+        if len(self.replicas) > 1 and self._probing is None:
+            self._probing = asyncio.ensure_future(self._keep_probing(get_client, interval, timeout))
+
+    async def stop(self):
+        if self._probing is not None:
+            self._probing.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._probing
+            self._probing = None
+
+    def stats(self):
+        return {
+            'replicas': [replica.stats() for replica in self.replicas],
+            'hedges': self.hedges,
+            'hedge_delay_ms': None if self.hedge_delay() is None else round(self.hedge_delay() * 1000, 1),
+        }
+
+    async def _keep_probing(self, get_client, interval, timeout):
+        while True:
+            await self.probe(get_client(), timeout)
+            await asyncio.sleep(interval)
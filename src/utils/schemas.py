@@ -1,5 +1,7 @@
 import yaml
 import os
+from jsonschema.validators import validator_for
+from jsonschema.exceptions import best_match
 
 _PATH = 'src/server/schemas/'
 
@@ -13,3 +15,27 @@ def load_schemas():
             schema = yaml.safe_load(fd.read())
             schemas[basename] = schema
     return schemas
+
+
+def load_validators(schemas):
+    """
+    Check each schema once and build a reusable validator object for it.
+    Returns a dict of schema name to validator.
+    """
+    validators = {}
+    for (name, schema) in schemas.items():
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        validators[name] = cls(schema)
+    return validators
+
+
+def validate(validator, instance):
+    """
+    Validate an instance with a validator from `load_validators`.
+    Raises the same ValidationError as `jsonschema.validate`, without
+    re-checking the schema and rebuilding the validator on every call.
+    """
+    error = best_match(validator.iter_errors(instance))
+    if error is not None:
+        raise error
@@ -26,3 +26,41 @@ def clean_search_text(text: str):
         return ''
 
     return text
+
+
+def is_plain_prefix(text: str):
+    """
+    Whether cleaned search text is a plain name prefix, without any of the
+    fulltext syntax (term separators, "|" alternatives, "-" exclusions or
+    "prefix:" markers), so that it can be matched against the start of a name.
+    """
+    return not re.search(r'[,|]|prefix:', text) and not text.startswith('-')
+
+
+def merge_ranked(result_lists, text):
+    """
+    Merge the ranked results of one search in several namespaces into a single ranking.
+    `result_lists` is a list of (results, name_field) pairs, one per namespace.
+
+    Names equal to the search text come first, then names starting with it,
+    then the rest. Within each of these groups the results of the namespaces
+    are interleaved, keeping the order of each, with ties going to the
+    earlier namespace.
+    """
+    text = (text or '').lower()
+    plain = bool(text) and is_plain_prefix(text)
+
+    def group(name):
+        if not plain or not isinstance(name, str):
+            return 2
+        name = name.lower()
+        if name == text:
+            return 0
+        return 1 if name.startswith(text) else 2
+
+    ranked = []
+    for (ns_index, (results, name_field)) in enumerate(result_lists):
+        for (position, result) in enumerate(results):
+            ranked.append(((group(result.get(name_field)), position, ns_index), result))
+    ranked.sort(key=lambda item: item[0])
+    return [result for (_, result) in ranked]
@@ -0,0 +1,47 @@
+"""
+Coalescing of identical concurrent calls.
+"""
+import asyncio
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time.
+    Callers asking for a key that is already in flight wait for the running
+    call and all receive its result (or its exception).
+    """
+
+    def __init__(self):
+        # Mapping of key to [task, number of waiters]
+        self._calls = {}
+        # Number of calls that were answered by another caller's request
+        self.coalesced = 0
+
+    def in_flight(self):
+        return len(self._calls)
+
+    async def do(self, key, make_coro):
+        """
+        Await the call in flight for `key`, or start one with `make_coro()`.
+        The shared call is cancelled only once every waiter has been cancelled.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = [asyncio.ensure_future(make_coro()), 0]
+            self._calls[key] = call
+            call[0].add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.coalesced += 1
+        call[1] += 1
+        try:
+            return await asyncio.shield(call[0])
+        except asyncio.CancelledError:
+            if call[1] == 1:
+                call[0].cancel()
+            raise
+        finally:
+            call[1] -= 1
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -0,0 +1,408 @@
+"""
+Memory-mapped local snapshots of a taxonomy release.
+
+A snapshot file holds every taxon document and child_of edge of one
+namespace that is active over a range of timestamps, in compact arrays:
+
+* taxon IDs, sorted, for binary search
+* a parent-index array (-1 for the root)
+* a CSR index of children, sorted by scientific name
+* interned scientific names
+* the JSON documents themselves
+* an index of species and strains sorted by case-folded name, for prefix search
+
+The file is opened with mmap, so every worker process shares the same pages
+and lookups decode only the documents they return.
+
+Build a snapshot from JSON-lines exports of the taxon and child_of
+collections (one document per line, as written by `arangoexport --type jsonl`):
+
+    python -m src.utils.snapshot --ns ncbi_taxonomy --ts 1635479149946 \\
+        ncbi_taxon.jsonl ncbi_child_of_taxon.jsonl ncbi_taxonomy.snap
+
+A snapshot covers timestamps up to the export (`--ts-end`, by default the
+time of the build), since a later release may have been loaded since.
+"""
+import os
+import sys
+import time
+import json
+import mmap
+import array
+import struct
+import argparse
+
+from src.utils import codec
+
+_MAGIC = b'TAXSNAP1'
+# Section alignment in the file, in bytes
+_ALIGN = 8
+# Expiration timestamp that RE uses for documents that are still active
+_MAX_TS = 9007199254740991
+
+# Array type codes for each section; blobs are plain bytes
+_SECTIONS = {
+    'id_offsets': 'Q',
+    'ids': None,
+    'parents': 'i',
+    'child_offsets': 'Q',
+    'children': 'i',
+    'name_ids': 'i',
+    'name_offsets': 'Q',
+    'names': None,
+    'doc_offsets': 'Q',
+    'docs': None,
+    'species': 'i',
+}
+
+# Ranks included in the species prefix index, besides documents flagged as strains
+_SPECIES_RANKS = ('species', 'strain')
+
+
+class TaxonomySnapshot:
+    """Read-only view of a snapshot file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fd:
+            self._mmap = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f'Not a taxonomy snapshot file: {path}')
+        (header_len,) = struct.unpack_from('<I', self._mmap, len(_MAGIC))
+        start = len(_MAGIC) + 4
+        header = json.loads(self._mmap[start:start + header_len])
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError(f'Snapshot {path} was built on a {header["byteorder"]}-endian machine')
+        self.ns = header['ns']
+        self.ts_start = header['ts_start']
+        self.ts_end = header['ts_end']
+        self.sciname_field = header['sciname_field']
+        self.count = header['count']
+        view = memoryview(self._mmap)
+        for (name, typecode) in _SECTIONS.items():
+            (offset, length) = header['sections'][name]
+            section = view[offset:offset + length]
+            setattr(self, '_' + name, section.cast(typecode) if typecode else section)
+
+    def covers(self, ts):
+        """Whether the snapshot holds exactly the documents active at `ts`."""
+        return ts is not None and self.ts_start <= ts <= self.ts_end
+
+    def stats(self):
+        return {'ns': self.ns, 'ts_start': self.ts_start, 'ts_end': self.ts_end, 'taxa': self.count}
+
+    # Low-level access by taxon index
+
+    def index(self, taxon_id):
+        """Index of a taxon ID, or None if it is not in the snapshot."""
+        target = taxon_id.encode()
+        (lo, hi) = (0, self.count)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self.taxon_id_bytes(mid)
+            if current < target:
+                lo = mid + 1
+            elif current > target:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def taxon_id_bytes(self, idx):
+        return bytes(self._ids[self._id_offsets[idx]:self._id_offsets[idx + 1]])
+
+    def parent(self, idx):
+        """Index of the parent of a taxon, or -1 for a root."""
+        return self._parents[idx]
+
+    def children(self, idx):
+        """Indexes of the children of a taxon, sorted by scientific name."""
+        return self._children[self._child_offsets[idx]:self._child_offsets[idx + 1]]
+
+    def name(self, idx):
+        name_id = self._name_ids[idx]
+        return bytes(self._names[self._name_offsets[name_id]:self._name_offsets[name_id + 1]]).decode()
+
+    def doc(self, idx, select=None):
+        """Decode the document of a taxon, keeping only the `select` fields if given."""
+        doc = codec.loads(bytes(self._docs[self._doc_offsets[idx]:self._doc_offsets[idx + 1]]))
+        if select:
+            return {key: doc[key] for key in select if key in doc}
+        return doc
+
+    def sort_key(self, idx):
+        """Key that children and species are sorted by: case-folded name, name, then ID."""
+        name = self.name(idx)
+        return (name.casefold(), name, self.taxon_id_bytes(idx).decode())
+
+    def _position_after(self, indexes, after_id):
+        """
+        Position just after taxon `after_id` in a sequence of taxon indexes
+        ordered by `sort_key`, or None if the taxon is unknown.
+        """
+        after = self.index(after_id) if after_id is not None else None
+        if after is None:
+            return None
+        key = self.sort_key(after)
+        (lo, hi) = (0, len(indexes))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.sort_key(indexes[mid]) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _species_key(self, position):
+        return self.name(self._species[position]).casefold()
+
+    def search_species(self, prefix, limit=20, offset=0, select=None, after=None):
+        """
+        Species and strains whose scientific name starts with `prefix`, ignoring case.
+        Results are ordered by name, so an exact match always comes first.
+        If `after` is the ID of a result, the page starts right after it instead of at `offset`.
+        """
+        key = prefix.casefold()
+        (lo, hi) = (0, len(self._species))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._species_key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        results = []
+        position = self._position_after(self._species, after)
+        if position is None:
+            position = lo + offset
+        while len(results) < limit and position < len(self._species) and self._species_key(position).startswith(key):
+            results.append(self.doc(self._species[position], select))
+            position += 1
+        return results
+
+    # Equivalents of the RE stored queries
+
+    def get_taxon(self, taxon_id):
+        idx = self.index(taxon_id)
+        return [] if idx is None else [self.doc(idx)]
+
+    def get_lineage(self, taxon_id, select=None):
+        """Ancestors of a taxon from the root down to its parent."""
+        idx = self.index(taxon_id)
+        if idx is None:
+            return []
+        ancestors = []
+        parent = self.parent(idx)
+        while parent != -1 and len(ancestors) < self.count:
+            ancestors.append(parent)
+            parent = self.parent(parent)
+        return [self.doc(i, select) for i in reversed(ancestors)]
+
+    def get_children(self, taxon_id, limit=20, offset=0, select=None, after=None):
+        """
+        Returns a pair of (total number of children, page of child documents).
+        If `after` is the ID of a child, the page starts right after it instead of at `offset`.
+        """
+        idx = self.index(taxon_id)
+        if idx is None:
+            return (0, [])
+        children = self.children(idx)
+        start = self._position_after(children, after)
+        if start is None:
+            start = offset
+        return (len(children), [self.doc(i, select) for i in children[start:start + limit]])
+
+    def get_siblings(self, taxon_id, limit=20, offset=0, select=None, after=None):
+        """
+        Returns a pair of (total number of siblings, page of sibling documents).
+        If `after` is the ID of a sibling, the page starts right after it instead of at `offset`.
+        """
+        idx = self.index(taxon_id)
+        if idx is None or self.parent(idx) == -1:
+            return (0, [])
+        children = self.children(self.parent(idx))
+        start = self._position_after(children, after)
+        if start is None:
+            # Skip over the taxon itself when counting the offset
+            own_position = self._position_after(children, taxon_id) - 1
+            start = offset if offset < own_position else offset + 1
+        docs = []
+        for i in children[start:]:
+            if len(docs) >= limit:
+                break
+            if i != idx:
+                docs.append(self.doc(i, select))
+        return (len(children) - 1, docs)
+
+
+def load_snapshots(paths):
+    """Open snapshot files, returning a dict of namespace to a list of snapshots."""
+    snapshots = {}
+    for path in paths:
+        snapshot = TaxonomySnapshot(path)
+        snapshots.setdefault(snapshot.ns, []).append(snapshot)
+    return snapshots
+
+
+def find_snapshot(snapshots, ns, ts):
+    """The snapshot for a namespace that covers `ts`, or None to use RE."""
+    for snapshot in snapshots.get(ns, []):
+        if snapshot.covers(ts):
+            return snapshot
+    return None
+
+
+def _active_range(items, ts, ts_end=_MAX_TS):
+    """
+    The largest range of timestamps around `ts`, and up to `ts_end`, over which
+    the set of active items is the same as at `ts`.
+    """
+    (start, end) = (0, ts_end)
+    for item in items:
+        (created, expired) = (item['created'], item['expired'])
+        if created <= ts <= expired:
+            start = max(start, created)
+            end = min(end, expired)
+        elif expired < ts:
+            start = max(start, expired + 1)
+        else:
+            end = min(end, created - 1)
+    return (start, end)
+
+
+def build_snapshot(path, ns, ts, taxa, edges, sciname_field, ts_end=None):
+    """
+    Write a snapshot file of the taxa and child_of edges active at `ts`.
+    `taxa` and `edges` are lists of RE documents, which may include inactive versions.
+    The snapshot covers timestamps up to `ts_end` at most, the time of the export (by default, now):
+    what RE holds after that is unknown.
+    """
+    if ts_end is None:
+        ts_end = int(time.time() * 1000)
+    if ts_end < ts:
+        raise ValueError(f'The end of the snapshot, {ts_end}, is before its timestamp, {ts}')
+    (ts_start, ts_end) = _active_range(taxa + edges, ts, ts_end)
+    taxa = sorted(
+        (doc for doc in taxa if doc['created'] <= ts <= doc['expired']),
+        key=lambda doc: doc['id'].encode()
+    )
+    index_by_key = {doc['_key']: idx for (idx, doc) in enumerate(taxa)}
+    parents = array.array('i', [-1] * len(taxa))
+    child_lists = [[] for _ in taxa]
+    for edge in edges:
+        if not edge['created'] <= ts <= edge['expired']:
+            continue
+        child = index_by_key.get(edge['_from'].split('/', 1)[-1])
+        parent = index_by_key.get(edge['_to'].split('/', 1)[-1])
+        if child is None or parent is None or child == parent:
+            continue
+        parents[child] = parent
+        child_lists[parent].append(child)
+
+    # Intern the scientific names
+    name_index = {}
+    name_ids = array.array('i')
+    for doc in taxa:
+        name = doc.get(sciname_field) or ''
+        name_ids.append(name_index.setdefault(name, len(name_index)))
+
+    def sort_key(idx):
+        name = taxa[idx].get(sciname_field) or ''
+        return (name.casefold(), name, taxa[idx]['id'])
+
+    child_offsets = array.array('Q', [0])
+    children = array.array('i')
+    for child_list in child_lists:
+        children.extend(sorted(child_list, key=sort_key))
+        child_offsets.append(len(children))
+
+    species = array.array('i', sorted(
+        (idx for (idx, doc) in enumerate(taxa) if doc.get('rank') in _SPECIES_RANKS or doc.get('strain') is True),
+        key=sort_key
+    ))
+
+    (id_offsets, ids) = _blob(doc['id'].encode() for doc in taxa)
+    (name_offsets, names) = _blob(name.encode() for name in name_index)
+    (doc_offsets, docs) = _blob(json.dumps(doc, separators=(',', ':')).encode() for doc in taxa)
+    sections = {
+        'id_offsets': id_offsets,
+        'ids': ids,
+        'parents': parents,
+        'child_offsets': child_offsets,
+        'children': children,
+        'name_ids': name_ids,
+        'name_offsets': name_offsets,
+        'names': names,
+        'doc_offsets': doc_offsets,
+        'docs': docs,
+        'species': species,
+    }
+    _write(path, sections, {
+        'ns': ns,
+        'ts': ts,
+        'ts_start': ts_start,
+        'ts_end': ts_end,
+        'sciname_field': sciname_field,
+        'count': len(taxa),
+        'byteorder': sys.byteorder,
+    })
+
+
+def _blob(items):
+    """Concatenate byte strings, returning (offsets array, bytes)."""
+    offsets = array.array('Q', [0])
+    blob = bytearray()
+    for item in items:
+        blob += item
+        offsets.append(len(blob))
+    return (offsets, bytes(blob))
+
+
+def _write(path, sections, header):
+    # The header size depends on the section offsets, so lay out the sections
+    # after a header of fixed, padded size
+    datas = {name: (data.tobytes() if isinstance(data, array.array) else data) for (name, data) in sections.items()}
+    header['sections'] = {name: [0, len(data)] for (name, data) in datas.items()}
+    header_len = len(json.dumps(header)) + 32 * len(datas)
+    offset = _aligned(len(_MAGIC) + 4 + header_len)
+    for (name, data) in datas.items():
+        header['sections'][name][0] = offset
+        offset = _aligned(offset + len(data))
+    header_bytes = json.dumps(header).encode().ljust(header_len)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as fd:
+        fd.write(_MAGIC)
+        fd.write(struct.pack('<I', header_len))
+        fd.write(header_bytes)
+        for (name, data) in datas.items():
+            fd.write(b'\0' * (header['sections'][name][0] - fd.tell()))
+            fd.write(data)
+    os.replace(tmp_path, path)
+
+
+def _aligned(offset):
+    return offset + (-offset % _ALIGN)
+
+
+def _read_jsonl(path):
+    with open(path) as fd:
+        return [json.loads(line) for line in fd if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build a memory-mapped taxonomy snapshot.')
+    parser.add_argument('--ns', required=True, help='Taxonomy namespace, such as ncbi_taxonomy')
+    parser.add_argument('--ts', required=True, type=int, help='Timestamp (ms) of the release to snapshot')
+    parser.add_argument('--ts-end', type=int, default=None,
+                        help='Last timestamp (ms) that the snapshot covers, the time of the export (default: now)')
+    parser.add_argument('--sciname-field', default='scientific_name', help='Scientific name field in the taxa')
+    parser.add_argument('taxa', help='JSON lines file of taxon documents')
+    parser.add_argument('edges', help='JSON lines file of child_of edges')
+    parser.add_argument('output', help='Snapshot file to write')
+    args = parser.parse_args(argv)
+    build_snapshot(args.output, args.ns, args.ts, _read_jsonl(args.taxa), _read_jsonl(args.edges), args.sciname_field,
+                   args.ts_end)
+    print(json.dumps(TaxonomySnapshot(args.output).stats()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Page-by-page results for the streaming mode of the list methods.
+"""
+
+
+class StreamedResult:
+    """
+    A method result whose `results` array is fetched and sent page by page.
+    `fields` holds the other fields of the result, and `pages` is an async
+    iterator over lists of result documents.
+    """
+
+    def __init__(self, fields, pages):
+        self.fields = fields
+        self.pages = pages
+
+    async def collect(self):
+        """Fetch every page and return the whole result as a dict."""
+        results = []
+        async for docs in self.pages:
+            results.extend(docs)
+        return {**self.fields, 'results': results}
+
+
+async def fetch_pages(fetch_page, offset, limit, page_size):
+    """
+    Page through a result set with `fetch_page(offset, limit)`, a coroutine
+    returning a pair of (total count, documents). A `limit` of None means every
+    result after `offset`.
+    The first page is fetched before returning, so that errors are raised
+    before any response is started.
+    Returns the total count and an async iterator over the pages.
+    """
+    def page_limit(fetched):
+        return page_size if limit is None else min(page_size, limit - fetched)
+
+    async def pages(docs):
+        fetched = 0
+        while True:
+            yield docs
+            fetched += len(docs)
+            size = page_limit(fetched)
+            if not docs or size <= 0 or offset + fetched >= total_count:
+                return
+            (_, docs) = await fetch_page(offset + fetched, size)
+
+    (total_count, first) = await fetch_page(offset, page_limit(0))
+    return (total_count, pages(first))
@@ -0,0 +1,57 @@
+"""
+Capture of JSON-RPC traffic, for replaying it with `python -m src.benchmark.replay`.
+
+The log has one JSON object per line:
+    {"ts": 1690000000.123, "ms": 12.5, "status": 200, "auth": true, "body": {...}}
+where `ts` is the time the request was received, in seconds since the epoch,
+`ms` is how long it took to answer, and `body` is the JSON-RPC call or batch.
+Tokens are never written; `auth` only records whether the request had one.
+"""
+import random
+
+from src.utils import codec
+
+
+class TrafficLog:
+    """
+    Appends sampled requests to a log file.
+
+    Each line is written with a single call on a file opened for appending, so
+    several workers can share one log.
+    """
+
+    def __init__(self, path, sample=1.0):
+        self.path = path
+        self.sample = sample
+        self.written = 0
+        self._file = open(path, 'ab', buffering=0)
+
+    def record(self, body, auth, ts, duration, status):
+        """
+        Log a raw JSON request body if it is sampled. `ts` and `duration` are in seconds.
+        The body is decoded again, as the handlers change the parsed one, and so it is stored without whitespace.
+        """
+        if self.sample < 1 and random.random() >= self.sample:  # nosec
+            return
+        line = codec.dumps({
+            'ts': round(ts, 3),
+            'ms': round(duration * 1000, 1),
+            'status': status,
+            'auth': bool(auth),
+            'body': codec.loads(body),
+        })
+        self._file.write(line + b'\n')
+        self.written += 1
+
+    def close(self):
+        self._file.close()
+
+
+def read(path):
+    """Yield the entries of a traffic log, skipping any partly written line."""
+    with open(path, 'rb') as fd:
+        for line in fd:
+            try:
+                yield codec.loads(line)
+            except ValueError:
+                continue
@@ -12,6 +12,56 @@ module taxonomy_re_api {
         string id;
     } GetTaxonParams;
 
+    /*
+    Parameters for get_taxa.
+        ts - optional - fetch the documents with this active timestamp (defaults to now)
+        ns - required - taxonomy namespace to use
+        ids - required - IDs of the taxon nodes, such as ["123", "562"]
+    */
+    typedef structure {
+        int ts;
+        string ns;
+        list<string> ids;
+    } GetTaxaParams;
+
+    /*
+    Bulk results for get_taxa.
+        stats - Query execution information from ArangoDB, one per chunk of IDs.
+        results - mapping of taxon ID to the taxon document.
+        missing - IDs that were not found.
+    */
+    typedef structure {
+        list<UnspecifiedObject> stats;
+        mapping<string, UnspecifiedObject> results;
+        list<string> missing;
+        int ts;
+    } GetTaxaResults;
+
+    /*
+    Parameters for get_taxa_from_ws_objs.
+        ts - optional - fetch the documents with this active timestamp (defaults to now)
+        ns - required - taxonomy namespace to use
+        obj_refs - required - versioned workspace object references, such as ["123/4/5"]
+    */
+    typedef structure {
+        int ts;
+        string ns;
+        list<string> obj_refs;
+    } GetTaxaFromWsObjsParams;
+
+    /*
+    Bulk results for get_taxa_from_ws_objs.
+        stats - Query execution information from ArangoDB, one per chunk of references.
+        results - mapping of workspace object reference to its taxon document.
+        missing - references that have no taxon.
+    */
+    typedef structure {
+        list<UnspecifiedObject> stats;
+        mapping<string, UnspecifiedObject> results;
+        list<string> missing;
+        int ts;
+    } GetTaxaFromWsObjsResults;
+
     /*
     Parameters for get_lineage.
         ts - optional - fetch documents with this active timestamp (defaults to now)
@@ -103,6 +153,12 @@ module taxonomy_re_api {
     /* Fetch details of a taxon by ID. */
     funcdef get_taxon(GetTaxonParams params) returns (Results result);
 
+    /* Fetch details of many taxa by ID. */
+    funcdef get_taxa(GetTaxaParams params) returns (GetTaxaResults result);
+
+    /* Fetch the taxa of many versioned workspace objects. */
+    funcdef get_taxa_from_ws_objs(GetTaxaFromWsObjsParams params) returns (GetTaxaFromWsObjsResults result);
+
     /* Fetch the ancestors of a taxon by ID, in order of root node to leaf node. */
     funcdef get_lineage(GetLineageParams params) returns (Results result);
 